@@ -2,179 +2,268 @@
 Serviço Python para processamento OMR usando OpenCV
 Compatível com o frontend HTML fornecido
 """
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import cv2
-import numpy as np
-from PIL import Image, ImageOps, ImageFilter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 import io
-import requests
 import base64
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional
 import json
 import logging
 import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+
+from startup_profile import lazy_import, startup_profile
+
+# Imports pesados medidos por fase (/health -> startup); requests e pdf2image
+# ficam para o primeiro uso (lazy_import)
+_startup = startup_profile()
+with _startup.phase("import_flask"):
+    from flask import Flask, Request, Response, current_app, g, request, jsonify, stream_with_context
+    from flask_cors import CORS
+with _startup.phase("import_numpy"):
+    import numpy as np
+with _startup.phase("import_cv2"):
+    import cv2
+with _startup.phase("import_pil"):
+    from PIL import Image, ImageOps
+with _startup.phase("import_omr_modules"):
+    from compiled_template import get_compiled_template, template_cache_info, template_name
+    from fast_preprocess import preprocess_array, target_size
+    from metrics import (
+        ALIGNMENT_FAILURES, C2F_QUESTIONS, DUPLICATE_CANDIDATES, IN_FLIGHT, PAGES, PAGES_SKIPPED, REGISTRY, REQUEST_PEAK_MEMORY, REQUEST_SECONDS, REQUESTS,
+        begin_request, current_timer, end_request, record_timings, render_metrics, timed,
+    )
+    from image_decode import MAX_REDUCTION, ImageData, decode_image, open_image
+    from integral_detection import (
+        bubble_darkness, decide_answers, detect_bubbles_integral, detect_sheet_integral, detect_sheets_integral,
+    )
+    from omr_result import NO_ANSWER, NPY_MIMETYPE, SheetAnswers
+    from result_cache import cache_key, content_digest, get_result_cache, result_cache_info
+    from validation_jobs import (
+        OPENAI_API_URL, CallbackNotAllowed, ValidationQueueFull, check_callback_url, http_session,
+        validation_batcher, validation_jobs,
+    )
+    from template_registry import template_registry
+    from roi_pipeline import RoiPage, preprocess_roi, roi_contains, template_roi_box, warp_roi
+    from synthetic_sheets import render_marks, template_page_size
+    from validation_crops import ambiguous_crops, ambiguous_strips, build_mosaic, sheet_margin
+    from upload_ingest import UploadBuffer, spool_stream
+    from buffer_pool import BufferLease, buffer_pool_info, page_buffers, take as take_buffer
+    from page_screening import PAGE_SCREENING, SCREEN_BLANK_INK, SCREEN_GRID_CONTRAST, PageThumbnail, screen_page
+    from page_hash import (
+        PAGE_HASH_ENABLED, PAGE_HASH_GRID, DuplicateCheck, duplicate_check, duplicate_flag, page_hash,
+        tenant_index,
+    )
+    from coarse_to_fine import C2F_FACTOR, C2F_MARGIN, COARSE_TO_FINE, read_coarse_to_fine
 
 # Configurar logging - apenas WARNING e ERROR para melhor performance
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+class OMRRequest(Request):
+    """
+    Request com limite de upload maior para os endpoints de lote (imagens e PDF
+    enviado) e arquivos do multipart em memória ou disco conforme o tamanho
+    (upload_ingest.spool_stream).
+    """
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        if self.path == '/api/process-batch' or (self.path == '/api/process-pdf' and self.method == 'POST'):
+            return current_app.config['BATCH_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return spool_stream(total_content_length)
+
+
 app = Flask(__name__)
+app.request_class = OMRRequest
 CORS(app)  # Permitir CORS para o frontend
 
-# Configurar tamanho máximo de upload (10MB)
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024
+# Tamanho máximo de upload dos demais endpoints (uma imagem por requisição)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('OMR_MAX_UPLOAD_MB', '32')) * 1024 * 1024
+# Lote (/api/process-batch): várias imagens ou um zip por requisição
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.getenv('OMR_BATCH_MAX_MB', '200')) * 1024 * 1024
 
 # ============================================================================
-# CONFIGURAÇÃO DO TEMPLATE DO GABARITO ENEM (45 questões - Dia 1)
+# TEMPLATES DE GABARITO (templates/*.json, ver template_registry.py)
 # ============================================================================
-GABARITO_TEMPLATE_45 = {
-    "total_questions": 45,
-    "options_per_question": 5,  # A, B, C, D, E
-    "columns": 1,
-    "rows_per_column": 45,
-    "options": ["A", "B", "C", "D", "E"],
-    "option_x": [
-        0.1810,  # A
-        0.3072,  # B
-        0.4335,  # C
-        0.5597,  # D
-        0.6859,  # E
-    ],
-    "question_y": [
-        0.0584, 0.0643, 0.0898, 0.1235, 0.2059,
-        0.2527, 0.3332, 0.3584, 0.3599, 0.3814,
-        0.3828, 0.4036, 0.4047, 0.4205, 0.4314,
-        0.4434, 0.4595, 0.4723, 0.4825, 0.5196,
-        0.5324, 0.5448, 0.5579, 0.5982, 0.6005,
-        0.6161, 0.6307, 0.6337, 0.6935, 0.7091,
-        0.7259, 0.7435, 0.7606, 0.7772, 0.7947,
-        0.8120, 0.8285, 0.8461, 0.8629, 0.8803,
-        0.8977, 0.9145, 0.9315, 0.9485, 0.9860,
-    ],
-}
-
-
-def build_enem90_template() -> Dict:
-    """Template ENEM90 - 150 DPI (6 colunas x 15 linhas) - v4.1 calibrado."""
-    y_coords = [1212, 1240, 1269, 1300, 1330, 1358, 1389, 1419, 1449, 1478, 1507, 1536, 1567, 1596, 1625]
-    
-    blocos_x = [
-        [157, 186, 218, 249, 278],      # Bloco 1: Q01-Q15
-        [348, 377, 407, 437, 467],      # Bloco 2: Q16-Q30
-        [537, 567, 597, 628, 658],      # Bloco 3: Q31-Q45
-        [727, 756, 786, 817, 848],      # Bloco 4: Q46-Q60
-        [918, 947, 977, 1008, 1037],    # Bloco 5: Q61-Q75
-        [1106, 1135, 1165, 1196, 1227]  # Bloco 6: Q76-Q90
-    ]
-    
-    base_x = [157, 348, 537, 727, 918, 1106]
-    y_start = 1212
-    y_step = 29.5
-    
-    questions = []
-    for idx in range(90):
-        col = idx // 15
-        row = idx % 15
-        questions.append({
-            "id": idx + 1,
-            "y": y_coords[row],
-            "x_positions": blocos_x[col]
-        })
+# enem45: ENEM Dia 1, coordenadas normalizadas
+# enem90: 150 DPI (6 colunas x 15 linhas) - v4.1 calibrado
+# enem90_v5: 300 DPI - HoughCircles calibrado
+DEFAULT_TEMPLATE_NAME = "enem90_v5"  # v5.0: 300 DPI (100% accuracy)
 
-    return {
-        "name": "enem90",
-        "total_questions": 90,
-        "options_per_question": 5,
-        "columns": 6,
-        "rows_per_column": 15,
-        "options": ["A", "B", "C", "D", "E"],
-        "base_x": base_x,
-        "y_start": y_start,
-        "y_step": y_step,
-        "bubble_radius": 13,
-        "bubble_radius_tolerance": 0.15,
-        "reference_size": {"width": 1240, "height": 1756},
-        "enable_chatgpt_validation": True,
-        "registration_marks": {
-            "p1": (15, 15),
-            "p2": (1225, 15),
-            "p3": (15, 1735),
-            "p4": (1225, 1735),
-        },
-        "questions": questions,
-    }
+with _startup.phase("load_templates"):
+    _registry = template_registry()
+_registry.required.add(DEFAULT_TEMPLATE_NAME)
+if DEFAULT_TEMPLATE_NAME not in _registry.templates:
+    raise RuntimeError(f"Template padrão '{DEFAULT_TEMPLATE_NAME}' não encontrado em {_registry.directory}")
 
+# Mesmo dict do registro: recargas a quente aparecem aqui
+AVAILABLE_TEMPLATES: Dict[str, Dict] = _registry.templates
 
-def build_enem90_v5_template() -> Dict:
-    """Template v5.0 - 300 DPI (6 colunas x 15 linhas) - HoughCircles calibrado."""
-    y_coords = [2436, 2490, 2550, 2610, 2672, 2730, 2790, 2852, 2910, 2971, 3030, 3090, 3152, 3210, 3270]
-    
-    blocos_x = [
-        [180, 240, 300, 362, 422],        # Bloco 1: Q01-Q15
-        [562, 622, 684, 746, 806],        # Bloco 2: Q16-Q30
-        [946, 1006, 1066, 1128, 1189],    # Bloco 3: Q31-Q45
-        [1330, 1389, 1450, 1512, 1572],   # Bloco 4: Q46-Q60
-        [1714, 1773, 1834, 1896, 1957],   # Bloco 5: Q61-Q75
-        [2097, 2156, 2218, 2280, 2339]    # Bloco 6: Q76-Q90
-    ]
-    
-    base_x = [180, 562, 946, 1330, 1714, 2097]
-    y_start = 2436
-    y_step = 60
-    
-    questions = []
-    for idx in range(90):
-        col = idx // 15
-        row = idx % 15
-        questions.append({
-            "id": idx + 1,
-            "y": y_coords[row],
-            "x_positions": blocos_x[col]
-        })
 
-    return {
-        "name": "enem90_v5",
-        "version": "5.0",
-        "total_questions": 90,
-        "options_per_question": 5,
-        "columns": 6,
-        "rows_per_column": 15,
-        "options": ["A", "B", "C", "D", "E"],
-        "base_x": base_x,
-        "y_start": y_start,
-        "y_step": y_step,
-        "bubble_radius": 19,
-        "bubble_radius_tolerance": 0.15,
-        "reference_size": {"width": 2481, "height": 3509},
-        "roi_gabarito": {
-            "y_inicio": 2400,
-            "y_fim": 3400,
-            "x_inicio": 50,
-            "x_fim": 2400
-        },
-        "enable_chatgpt_validation": True,
-        "registration_marks": {
-            "p1": (50, 2400),
-            "p2": (2400, 2400),
-            "p3": (50, 3400),
-            "p4": (2400, 3400),
-        },
-        "questions": questions,
-    }
+def refresh_templates() -> None:
+    """Recarrega templates alterados no diretório (no máximo a cada OMR_TEMPLATES_RELOAD_SECONDS)."""
+    changed = _registry.refresh()
+    if changed:
+        logger.warning(f"[Templates] Recarregados: {changed}")
 
 
-# Instanciar templates
-GABARITO_TEMPLATE_90 = build_enem90_template()
-GABARITO_TEMPLATE_90_V5 = build_enem90_v5_template()
+@app.before_request
+def _refresh_templates_before_request() -> None:
+    refresh_templates()
 
-AVAILABLE_TEMPLATES: Dict[str, Dict] = {
-    "enem45": GABARITO_TEMPLATE_45,
-    "enem90": GABARITO_TEMPLATE_90,
-    "enem90_v5": GABARITO_TEMPLATE_90_V5,
-}
 
-DEFAULT_TEMPLATE_NAME = "enem90_v5"  # v5.0: 300 DPI (100% accuracy)
+# ============================================================================
+# MÉTRICAS (metrics.py): tempos por etapa, /metrics e ?timings=true
+# ============================================================================
+
+def timings_requested() -> bool:
+    return request.args.get('timings', 'false').lower() == 'true'
+
+
+def request_timings() -> Dict[str, float]:
+    """Bloco "timings" (ms por etapa + total) da requisição atual."""
+    timer = current_timer()
+    return timer.snapshot() if timer is not None else {}
+
+
+def request_memory() -> Dict:
+    """Bloco "memory" (RSS e pico da requisição atual, em MB); vazio fora do Linux."""
+    timer = current_timer()
+    return timer.memory.snapshot() if timer is not None and timer.memory is not None else {}
+
+
+def timing_blocks() -> Dict:
+    """Blocos "timings" e "memory" da resposta, só com ?timings=true."""
+    if not timings_requested():
+        return {}
+    blocks = {"timings": request_timings()}
+    memory = request_memory()
+    if memory:
+        blocks["memory"] = memory
+    return blocks
+
+
+def count_pages(pages: Iterable[Dict], template_key: str) -> None:
+    """
+    Páginas lidas, ignoradas na triagem, possíveis duplicatas e falhas de
+    alinhamento para /metrics; acertos do cache não contam como lidas.
+    """
+    for page in pages:
+        if page.get("status") == "erro":
+            continue
+        if page.get("status") == "ignorada":
+            PAGES_SKIPPED.inc(template_key, page["motivo"])
+            continue
+        duplicate = page.get("possivel_duplicata")
+        if duplicate:
+            DUPLICATE_CANDIDATES.inc(template_key, duplicate["escopo"])
+        PAGES.inc(template_key)
+        if page.get("pipeline") == "coarse_to_fine":
+            refined = page["refinadas"]
+            C2F_QUESTIONS.inc(template_key, "coarse", amount=len(page["resultado"]["questoes"]) - refined)
+            C2F_QUESTIONS.inc(template_key, "fine", amount=refined)
+        if page.get("alinhamento", {}).get("reason") == "marks_not_found":
+            ALIGNMENT_FAILURES.inc(template_key)
+
+
+@app.before_request
+def _begin_request_metrics() -> None:
+    IN_FLIGHT.inc()
+    # Sozinha no processo: o pico de memória (VmHWM) é só desta requisição
+    begin_request(track_memory=True, exclusive=IN_FLIGHT.value() == 1)
+
+
+@app.after_request
+def _end_request_metrics(response: Response) -> Response:
+    timer = current_timer()
+    if timer is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else "other"
+    if timings_requested() and not response.is_streamed:
+        response.headers["Server-Timing"] = timer.server_timing()
+
+    def finish() -> None:
+        # Depois do último byte (respostas em streaming incluídas)
+        REQUEST_SECONDS.observe(time.perf_counter() - timer.start, endpoint)
+        REQUESTS.inc(endpoint, str(response.status_code))
+        if timer.memory is not None and timer.memory.exclusive and IN_FLIGHT.value() == 1:
+            peak = timer.memory.peak_bytes()
+            if peak is not None:
+                REQUEST_PEAK_MEMORY.observe(peak, endpoint)
+        IN_FLIGHT.dec()
+        if current_timer() is timer:
+            end_request()
+
+    response.call_on_close(finish)
+    return response
+
+
+def _result_cache_collector():
+    info = result_cache_info()
+    if not info.get("enabled"):
+        return []
+    return [(f"omr_result_cache_{name}_total", "counter", f"Cache de resultados: {name}", [({}, info[name])])
+            for name in ("hits", "memory_hits", "disk_hits", "misses", "stores", "evictions")]
+
+
+def _buffer_pool_collector():
+    info = buffer_pool_info()
+    counters = [(f"omr_buffer_pool_{name}_total", "counter", f"Pool de buffers: {name}", [({}, info[name])])
+                for name in ("allocations", "reuses", "evictions")]
+    return counters + [("omr_buffer_pool_free_bytes", "gauge", "Pool de buffers: bytes livres guardados",
+                        [({}, info["free_bytes"])])]
+
+
+REGISTRY.collectors.extend([_result_cache_collector, _buffer_pool_collector])
+
+
+def open_upload(storage) -> UploadBuffer:
+    """Conteúdo do upload sem cópia (upload_ingest); o mmap é fechado no fim da requisição."""
+    upload = UploadBuffer.from_storage(storage)
+    g.setdefault("uploads", []).append(upload)
+    return upload
+
+
+def request_buffers() -> BufferLease:
+    """Escopo de buffers da requisição atual (a PageReading vale até o fim dela)."""
+    if "buffers" not in g:
+        g.buffers = page_buffers()
+    return g.buffers
+
+
+@app.teardown_request
+def _release_request_resources(_exc=None) -> None:
+    for upload in g.pop("uploads", ()):
+        upload.close()
+    buffers = g.pop("buffers", None)
+    if buffers is not None:
+        buffers.release()
+
+
+# Motor de detecção: "integral" (imagem integral vetorizada, respostas idênticas)
+# ou "fixed" (detect_bubbles_fixed, referência da calibração)
+DETECTION_ENGINE = os.getenv("OMR_DETECTION_ENGINE", "integral").lower()
+
+# Pré-processamento: "numpy" (NumPy/OpenCV, bit a bit idêntico) ou "pil" (preprocess_pil_image)
+PREPROCESS_ENGINE = os.getenv("OMR_PREPROCESS_ENGINE", "numpy").lower()
+
+# Decodificação dos uploads: "pil" (colorido, resolução cheia, como na calibração)
+# ou "gray" (cv2 direto em cinza; JPEG grande já reduzido perto do reference_size)
+DECODE_ENGINE = os.getenv("OMR_DECODE_ENGINE", "pil").lower()
+
+# Pipeline restrito à roi_gabarito (templates que a declaram; requer o motor "integral")
+ROI_PIPELINE = os.getenv("OMR_ROI_PIPELINE", "false").lower() == "true"
+
+# Revisão da leitura na chave do cache de resultados: incrementar ao mudar a calibração
+DETECTOR_REVISION = "1"
 
 
 def select_template(name: Optional[str]) -> Dict:
@@ -208,31 +297,38 @@ def preprocess_pil_image(pil_img: Image.Image) -> np.ndarray:
     return np.array(bw, dtype=np.uint8)
 
 
-def detect_bubbles_fixed(image_array: np.ndarray, template: Dict, debug: bool = False) -> Tuple[Dict[str, str], Optional[np.ndarray]]:
+def preprocess_image(image: np.ndarray, buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """Pré-processa com o motor configurado em OMR_PREPROCESS_ENGINE."""
+    if PREPROCESS_ENGINE == "pil":
+        return preprocess_pil_image(Image.fromarray(image))
+    return preprocess_array(image, buffers)
+
+
+def detect_bubbles_fixed(image_array: np.ndarray, template: Dict, debug: bool = False,
+                         buffers: Optional[BufferLease] = None) -> Tuple[Dict[str, str], Optional[np.ndarray]]:
     """
     Detecta respostas usando coordenadas fixas do template (OpenCV).
     Retorna: (answers_dict, debug_image)
     """
     height, width = image_array.shape
-    inverted = 255 - image_array
     answers: Dict[str, str] = {}
     
     debug_image = None
     if debug:
-        if len(image_array.shape) == 2:
-            debug_image = cv2.cvtColor(image_array, cv2.COLOR_GRAY2BGR)
-        else:
-            debug_image = image_array.copy()
+        debug_image = cv2.cvtColor(image_array, cv2.COLOR_GRAY2BGR, dst=take_buffer(buffers, (height, width, 3)))
 
     def read_region(cx: int, cy: int, radius_px: int) -> float:
         y_min = max(0, cy - radius_px)
         y_max = min(height, cy + radius_px)
         x_min = max(0, cx - radius_px)
         x_max = min(width, cx + radius_px)
-        region = inverted[y_min:y_max, x_min:x_max]
+        region = image_array[y_min:y_max, x_min:x_max]
         if region.size == 0:
             return 0.0
-        darkness = float(np.mean(region) / 255.0)
+        # Média de 255 - pixel sem materializar a imagem invertida: soma inteira
+        # exata, mesmo float que np.mean(255 - region)
+        inverted_sum = region.size * 255 - int(region.sum(dtype=np.int64))
+        darkness = float(inverted_sum / region.size / 255.0)
         
         if debug and debug_image is not None:
             cv2.circle(debug_image, (cx, cy), radius_px, (0, 255, 0), 1)
@@ -337,63 +433,267 @@ def detect_bubbles_fixed(image_array: np.ndarray, template: Dict, debug: bool =
     return (answers, debug_image) if debug else (answers, None)
 
 
+def detect_bubbles(image_array: np.ndarray, template: Dict, debug: bool = False,
+                   buffers: Optional[BufferLease] = None) -> Tuple[Dict[str, str], Optional[np.ndarray]]:
+    """Detecta respostas com o motor configurado em OMR_DETECTION_ENGINE."""
+    if DETECTION_ENGINE == "fixed":
+        return detect_bubbles_fixed(image_array, template, debug=debug, buffers=buffers)
+    return detect_bubbles_integral(image_array, template, debug=debug, buffers=buffers)
+
+
+def _mark_window(center: Tuple[int, int], margin: int, width: int, height: int) -> Tuple[int, int, int, int]:
+    """Janela de busca (x1, x2, y1, y2) ao redor de um marcador, recortada na página."""
+    cx, cy = center
+    return max(0, cx - margin), min(width, cx + margin), max(0, cy - margin), min(height, cy + margin)
+
+
+def _mark_centroid(binary: np.ndarray) -> Optional[Tuple[int, int]]:
+    """Centroide (na janela) do maior contorno da janela binarizada."""
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    contour = max(contours, key=cv2.contourArea)
+    M = cv2.moments(contour)
+    if M["m00"] == 0:
+        return None
+    return int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"])
+
+
+def _find_marks_near(source: np.ndarray, positions: Dict[str, Tuple[int, int]], margin: int,
+                     level: Optional[float] = None) -> Optional[Dict[str, Tuple[int, int]]]:
+    """
+    Procura cada marcador só na janela ao redor da sua posição; None se faltar algum.
+    Com level, source é a página (cinza ou BGR) e só as janelas são binarizadas;
+    sem level, source já é a página binarizada.
+    """
+    h, w = source.shape[:2]
+    found: Dict[str, Tuple[int, int]] = {}
+    for name, center in positions.items():
+        x1, x2, y1, y2 = _mark_window(center, margin, w, h)
+        window = source[y1:y2, x1:x2]
+        if window.size == 0:
+            continue
+        if level is not None:
+            if window.ndim == 3:
+                window = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+            _, window = cv2.threshold(window, level, 255, cv2.THRESH_BINARY_INV)
+        centroid = _mark_centroid(window)
+        if centroid is not None:
+            found[name] = (centroid[0] + x1, centroid[1] + y1)
+    return found if len(found) == len(positions) else None
+
+
+def locate_registration_marks(gray: np.ndarray, template: Dict,
+                              buffers: Optional[BufferLease] = None) -> Tuple[Optional[Dict[str, Tuple[int, int]]], float]:
+    """Marcadores P1-P4 e o nível de Otsu (da página inteira, como na calibração) usado."""
+    h, w = gray.shape
+    compiled = get_compiled_template(template, w, h)
+    expected = dict(zip(compiled.mark_names, map(tuple, compiled.expected_marks.tolist())))
+    level, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU,
+                                  dst=take_buffer(buffers, gray.shape))
+    return _find_marks_near(binary, expected, compiled.mark_margin), level
+
+
 def find_registration_marks(gray: np.ndarray, template: Dict) -> Optional[Dict[str, Tuple[int, int]]]:
     """Localiza marcadores P1-P4 nos cantos."""
     if "registration_marks" not in template or "reference_size" not in template:
         return None
+    marks, _level = locate_registration_marks(gray, template)
+    return marks
 
-    h, w = gray.shape
-    ref_w = template["reference_size"]["width"]
-    ref_h = template["reference_size"]["height"]
-    scale_x = w / ref_w
-    scale_y = h / ref_h
-    expected = {k: (int(v[0] * scale_x), int(v[1] * scale_y)) for k, v in template["registration_marks"].items()}
 
-    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-    margin = int(30 * max(scale_x, scale_y))
-    found: Dict[str, Tuple[int, int]] = {}
+# Modo lote: reaproveita a homografia da página anterior enquanto os marcadores
+# caírem a até OMR_BATCH_ALIGNMENT_TOLERANCE px das posições dela
+BATCH_ALIGNMENT = os.getenv("OMR_BATCH_ALIGNMENT", "false").lower() == "true"
+BATCH_ALIGNMENT_TOLERANCE = int(os.getenv("OMR_BATCH_ALIGNMENT_TOLERANCE", "2"))
 
-    for name, (ex, ey) in expected.items():
-        x1 = max(0, ex - margin)
-        x2 = min(w, ex + margin)
-        y1 = max(0, ey - margin)
-        y2 = min(h, ey + margin)
-        roi = binary[y1:y2, x1:x2]
-        if roi.size == 0:
-            continue
-        contours, _ = cv2.findContours(roi, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if not contours:
-            continue
-        contour = max(contours, key=cv2.contourArea)
-        M = cv2.moments(contour)
-        if M["m00"] == 0:
-            continue
-        cx = int(M["m10"] / M["m00"]) + x1
-        cy = int(M["m01"] / M["m00"]) + y1
-        found[name] = (cx, cy)
 
-    if len(found) == len(expected):
+class RegistrationTracker:
+    """
+    Homografia da última página alinhada de um lote.
+
+    Scanners alimentados em sequência produzem páginas quase na mesma posição.
+    A verificação converte para cinza e binariza só as janelas ao redor das
+    posições anteriores, com o nível de Otsu da página anterior (sem passar
+    pela página inteira); se todos os marcadores estiverem dentro da
+    tolerância, a homografia anterior é reaproveitada. Senão, alinhamento completo.
+    """
+
+    __slots__ = ("tolerance", "key", "M", "marks", "level", "reused", "recomputed")
+
+    def __init__(self, tolerance: int = BATCH_ALIGNMENT_TOLERANCE):
+        self.tolerance = tolerance
+        self.key = None
+        self.M: Optional[np.ndarray] = None
+        self.marks: Dict[str, Tuple[int, int]] = {}
+        self.level = 0.0
+        self.reused = 0
+        self.recomputed = 0
+
+    @staticmethod
+    def _key(image: np.ndarray, template: Dict) -> Tuple:
+        return template_name(template), image.shape[:2]
+
+    def verify(self, image: np.ndarray, template: Dict) -> Optional[Dict[str, Tuple[int, int]]]:
+        """Marcadores da página se estiverem dentro da tolerância dos anteriores, senão None."""
+        if self.M is None or self._key(image, template) != self.key:
+            return None
+        h, w = image.shape[:2]
+        margin = get_compiled_template(template, w, h).mark_margin
+        found = _find_marks_near(image, self.marks, margin, self.level)
+        if found is None:
+            return None
+        for name, (x, y) in found.items():
+            px, py = self.marks[name]
+            if abs(x - px) > self.tolerance or abs(y - py) > self.tolerance:
+                return None
+        self.reused += 1
         return found
-    return None
 
+    def remember(self, image: np.ndarray, template: Dict, M: np.ndarray,
+                 marks: Dict[str, Tuple[int, int]], level: float) -> None:
+        self.key = self._key(image, template)
+        self.M = M
+        self.marks = dict(marks)
+        self.level = level
+        self.recomputed += 1
 
-def align_with_registration_marks(image: np.ndarray, template: Dict) -> Tuple[np.ndarray, Dict]:
-    """Alinha a imagem usando P1-P4."""
+
+def registration_transform(image: np.ndarray, template: Dict,
+                           tracker: Optional[RegistrationTracker] = None,
+                           buffers: Optional[BufferLease] = None) -> Tuple[Optional[np.ndarray], Dict]:
+    """
+    Homografia P1-P4 → página de referência (None se não houver marcadores).
+    Com tracker (modo lote), tenta antes reaproveitar a homografia da página anterior.
+    """
     if "registration_marks" not in template or "reference_size" not in template:
-        return image, {"aligned": False, "reason": "template_without_marks"}
+        return None, {"aligned": False, "reason": "template_without_marks"}
+
+    if tracker is not None:
+        marks = tracker.verify(image, template)
+        if marks is not None:
+            return tracker.M, {"aligned": True, "marks": marks, "reused": True}
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
-    marks = find_registration_marks(gray, template)
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=take_buffer(buffers, image.shape[:2]))
+    else:
+        gray = image
+    marks, level = locate_registration_marks(gray, template, buffers)
     if not marks:
-        return image, {"aligned": False, "reason": "marks_not_found"}
+        return None, {"aligned": False, "reason": "marks_not_found"}
 
     ref_w = template["reference_size"]["width"]
     ref_h = template["reference_size"]["height"]
     src_pts = np.float32([marks["p1"], marks["p2"], marks["p3"], marks["p4"]])
     dst_pts = np.float32([[0, 0], [ref_w, 0], [0, ref_h], [ref_w, ref_h]])
     M = cv2.getPerspectiveTransform(src_pts, dst_pts)
-    aligned = cv2.warpPerspective(image, M, (ref_w, ref_h))
-    return aligned, {"aligned": True, "marks": marks}
+    if tracker is not None:
+        tracker.remember(image, template, M, marks, level)
+    return M, {"aligned": True, "marks": marks}
+
+
+def align_with_registration_marks(image: np.ndarray, template: Dict,
+                                  tracker: Optional[RegistrationTracker] = None,
+                                  buffers: Optional[BufferLease] = None) -> Tuple[np.ndarray, Dict]:
+    """Alinha a imagem usando P1-P4."""
+    M, info = registration_transform(image, template, tracker, buffers)
+    if M is None:
+        return image, info
+    return warp_to_reference(image, template, M, buffers), info
+
+
+def warp_to_reference(image: np.ndarray, template: Dict, M: np.ndarray,
+                      buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """Página de referência inteira a partir da homografia de registration_transform."""
+    ref_w = template["reference_size"]["width"]
+    ref_h = template["reference_size"]["height"]
+    dst = take_buffer(buffers, (ref_h, ref_w) + image.shape[2:], image.dtype)
+    return cv2.warpPerspective(image, M, (ref_w, ref_h), dst=dst)
+
+
+def prepare_roi_page(image: np.ndarray, template: Dict, align_marks: bool = True,
+                     tracker: Optional[RegistrationTracker] = None,
+                     buffers: Optional[BufferLease] = None) -> Tuple[Optional[RoiPage], Dict]:
+    """
+    Alinha e binariza só a roi_gabarito do template.
+    Retorna (None, info) se a ROI não cobrir todas as bolhas (usar o pipeline completo).
+    """
+    M = None
+    alignment_info = {"aligned": False}
+    # ALINHAMENTO MANTIDO HABILITADO - NÃO ALTERAR (afeta calibração)
+    if align_marks and "registration_marks" in template:
+        with timed("align"):
+            M, alignment_info = registration_transform(image, template, tracker, buffers)
+
+    if M is not None:
+        page_size = (template["reference_size"]["width"], template["reference_size"]["height"])
+        box = template_roi_box(template, *page_size)
+        if box is None:
+            return None, alignment_info
+        with timed("align"):
+            roi_image = warp_roi(image, M, box, buffers)
+    else:
+        page_size = (image.shape[1], image.shape[0])
+        box = template_roi_box(template, *page_size)
+        if box is None:
+            return None, alignment_info
+        x0, y0, x1, y1 = box
+        roi_image = image[y0:y1, x0:x1]
+
+    with timed("preprocess"):
+        page = preprocess_roi(roi_image, page_size, box, buffers)
+    if not roi_contains(page, get_compiled_template(template, *page.page_size).roi):
+        return None, alignment_info
+    return page, alignment_info
+
+
+class PageReading:
+    """
+    O que read_omr_page leu de uma página, para as etapas seguintes (validação).
+
+    image: página de trabalho (alinhada) antes da binarização, ou só o recorte
+    da ROI, em image_origin (x, y) numa página page_size (width, height).
+    bw: imagem binarizada lida pelo detector, em bw_origin (y, x) numa página
+    bw_page_size; é nessa escala que ficam as coordenadas do template compilado.
+    """
+
+    __slots__ = ("template", "image", "image_origin", "page_size", "bw", "bw_origin", "bw_page_size",
+                 "_darkness", "_sheet")
+
+    def __init__(self, template: Dict, image: np.ndarray, image_origin: Tuple[int, int], page_size: Tuple[int, int],
+                 bw: np.ndarray, bw_origin: Tuple[int, int], bw_page_size: Tuple[int, int]):
+        self.template = template
+        self.image = image
+        self.image_origin = image_origin
+        self.page_size = page_size
+        self.bw = bw
+        self.bw_origin = bw_origin
+        self.bw_page_size = bw_page_size
+        self._darkness: Optional[np.ndarray] = None
+        self._sheet: Optional[SheetAnswers] = None
+
+    @property
+    def compiled(self):
+        return get_compiled_template(self.template, *self.bw_page_size)
+
+    def darkness(self) -> np.ndarray:
+        """Escuridão [Q, O] de cada bolha (a mesma que a detecção usou)."""
+        if self._darkness is None:
+            self._darkness = bubble_darkness(self.bw, self.compiled, self.bw_origin)
+        return self._darkness
+
+    def sheet(self) -> SheetAnswers:
+        """Resultado compacto (arrays) da página."""
+        if self._sheet is None:
+            darkness = self.darkness()
+            compiled = self.compiled
+            self._sheet = SheetAnswers.from_detection(compiled, darkness, *decide_answers(darkness, compiled))
+        return self._sheet
+
+    def attach(self, sheet: SheetAnswers, darkness: np.ndarray) -> None:
+        """Guarda o que a detecção já calculou (evita reler as bolhas)."""
+        self._sheet = sheet
+        self._darkness = darkness
 
 
 def process_omr_page(
@@ -402,36 +702,71 @@ def process_omr_page(
     template_name: Optional[str] = None,
     align_marks: bool = True,
     debug: bool = False,
+    roi_only: Optional[bool] = None,
+    tracker: Optional[RegistrationTracker] = None,
+    coarse: Optional[bool] = None,
 ) -> Dict:
     """
     Processa uma página usando template fixo (OpenCV).
     OTIMIZADO: Reduzido logging verboso para melhor performance.
+    roi_only: processa só a roi_gabarito (None = OMR_ROI_PIPELINE).
+    tracker: alinhamento em modo lote (homografia reaproveitada entre páginas).
+    coarse: leitura em dois níveis (None = OMR_COARSE_TO_FINE).
+    Os arrays intermediários vêm do pool de buffers e voltam para ele no fim.
     """
-    template = select_template(template_name)
-    candidate = template_name.lower() if template_name else DEFAULT_TEMPLATE_NAME
-    template_key = candidate if candidate in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
-    height, width = image.shape[:2]
-    # Log reduzido para performance
+    with page_buffers() as buffers:
+        result, _reading = read_omr_page(image, page_number, template_name, align_marks, debug, roi_only, tracker,
+                                         buffers, coarse)
+    return result
+
+
+def prepare_page(
+    image: np.ndarray,
+    template: Dict,
+    align_marks: bool = True,
+    roi_only: Optional[bool] = None,
+    tracker: Optional[RegistrationTracker] = None,
+    buffers: Optional[BufferLease] = None,
+) -> Tuple[PageReading, Dict, bool]:
+    """
+    Alinhamento + binarização de uma página, sem detecção: (leitura, alinhamento, pipeline ROI?).
+    Com buffers, os arrays da leitura são do pool: valem até o fim do escopo.
+    """
+    if roi_only is None:
+        roi_only = ROI_PIPELINE
+
+    roi_page = None
+    if roi_only and DETECTION_ENGINE != "fixed" and "roi_gabarito" in template:
+        roi_page, alignment_info = prepare_roi_page(image, template, align_marks, tracker, buffers)
+
+    if roi_page is not None:
+        x0, y0 = roi_page.source_box[:2]
+        reading = PageReading(template, roi_page.source, (x0, y0), roi_page.source_page_size,
+                              roi_page.bw, roi_page.origin, roi_page.page_size)
+        return reading, alignment_info, True
+
     working_image = image
     alignment_info = {"aligned": False}
     # ALINHAMENTO MANTIDO HABILITADO - NÃO ALTERAR (afeta calibração)
     if align_marks and "registration_marks" in template:
         # Logs removidos para melhor performance
-        aligned_img, info = align_with_registration_marks(image, template)
+        with timed("align"):
+            aligned_img, info = align_with_registration_marks(image, template, tracker, buffers)
         alignment_info = info
         working_image = aligned_img
         # Logs removidos para melhor performance
 
     # Pré-processamento otimizado
-    pil_img = Image.fromarray(working_image)
-    bw_array = preprocess_pil_image(pil_img)
-    
-    # Detecção de bolhas
-    answers, debug_image = detect_bubbles_fixed(bw_array, template, debug=debug)
-    
-    detected_count = len([q for q in answers.values() if q != "Não respondeu"])
-    # Log removido para melhor performance
-    
+    with timed("preprocess"):
+        bw_array = preprocess_image(working_image, buffers)
+    reading = PageReading(template, working_image, (0, 0), (working_image.shape[1], working_image.shape[0]),
+                          bw_array, (0, 0), (bw_array.shape[1], bw_array.shape[0]))
+    return reading, alignment_info, False
+
+
+def page_result(page_number: int, template_key: str, alignment_info: Dict, answers: Dict[str, str],
+                roi: bool, debug_image: Optional[np.ndarray] = None) -> Dict:
+    """Dict de resultado de uma página (formato da resposta JSON)."""
     result = {
         "pagina": page_number,
         "template": template_key,
@@ -441,42 +776,807 @@ def process_omr_page(
             "questoes": answers
         }
     }
+    if roi:
+        result["pipeline"] = "roi"
     
-    if debug and debug_image is not None:
-        _, buffer = cv2.imencode('.png', debug_image)
-        debug_base64 = base64.b64encode(buffer).decode('utf-8')
+    if debug_image is not None:
+        with timed("debug_encode"):
+            _, buffer = cv2.imencode('.png', debug_image)
+            debug_base64 = base64.b64encode(buffer).decode('utf-8')
         result["debug_image"] = debug_base64
         # Log removido para melhor performance
 
     return result
 
 
-def pdf_url_to_images(pdf_url: str) -> List[np.ndarray]:
-    """Converte PDF de URL em lista de imagens."""
+def skipped_page_result(page_number: int, template_key: str, screening: Dict) -> Dict:
+    """Página que a triagem (page_screening) tirou da leitura: motivo + medidas da miniatura."""
+    screening = dict(screening)
+    return {
+        "pagina": page_number,
+        "template": template_key,
+        "status": "ignorada",
+        "motivo": screening.pop("motivo"),
+        "triagem": screening,
+    }
+
+
+def read_page_coarse_to_fine(
+    image: np.ndarray,
+    page_number: int,
+    template: Dict,
+    template_key: str,
+    align_marks: bool = True,
+    tracker: Optional[RegistrationTracker] = None,
+    buffers: Optional[BufferLease] = None,
+) -> Dict:
+    """
+    Página pela leitura em dois níveis (coarse_to_fine): só a homografia P1-P4,
+    a página em 1/k e recortes das questões ambíguas; sem página alinhada nem
+    binarizada inteira (não há PageReading). "refinadas" = questões relidas no
+    nível fino. Template pequeno demais para o nível grosso: pipeline completo.
+    """
+    M = None
+    alignment_info = {"aligned": False}
+    # ALINHAMENTO MANTIDO HABILITADO - NÃO ALTERAR (afeta calibração)
+    if align_marks and "registration_marks" in template:
+        with timed("align"):
+            M, alignment_info = registration_transform(image, template, tracker, buffers)
+
+    with timed("coarse_to_fine"):
+        reading = read_coarse_to_fine(image, template, M, buffers)
+    if reading is not None:
+        result = page_result(page_number, template_key, alignment_info, reading.sheet.to_dict(), False)
+        result["pipeline"] = "coarse_to_fine"
+        result["refinadas"] = reading.refined
+        return result
+
+    working_image = image
+    if M is not None:
+        with timed("align"):
+            working_image = warp_to_reference(image, template, M, buffers)
+    with timed("preprocess"):
+        bw_array = preprocess_image(working_image, buffers)
+    with timed("detect"):
+        sheet, _ = detect_sheet_integral(bw_array, template, buffers=buffers)
+    return page_result(page_number, template_key, alignment_info, sheet.to_dict(), False)
+
+
+def page_error(page_number: int, error: Exception) -> Dict:
+    """Resultado de uma página que falhou (as demais do PDF/lote seguem)."""
+    logger.error(f"[OMR] Erro página {page_number}: {error}")
+    return {"pagina": page_number, "status": "erro", "mensagem": str(error)}
+
+
+def request_duplicates() -> Optional[DuplicateCheck]:
+    """
+    Possíveis duplicatas do job da requisição (page_hash): tenant em `tenant`
+    ou no header X-OMR-Tenant.
+    """
+    tenant = request.values.get('tenant') or request.headers.get('X-OMR-Tenant')
+    return duplicate_check(tenant)
+
+
+def _template_key(template_name: Optional[str]) -> str:
+    candidate = template_name.lower() if template_name else DEFAULT_TEMPLATE_NAME
+    return candidate if candidate in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
+
+
+def read_omr_page(
+    image: np.ndarray,
+    page_number: int = 1,
+    template_name: Optional[str] = None,
+    align_marks: bool = True,
+    debug: bool = False,
+    roi_only: Optional[bool] = None,
+    tracker: Optional[RegistrationTracker] = None,
+    buffers: Optional[BufferLease] = None,
+    coarse: Optional[bool] = None,
+) -> Tuple[Dict, Optional[PageReading]]:
+    """
+    process_omr_page que também devolve a PageReading (imagem alinhada, binarizada, geometria).
+    Com buffers, a PageReading aponta para arrays do pool: usar antes de liberar o escopo.
+    Na leitura em dois níveis (coarse, None = OMR_COARSE_TO_FINE; nunca com
+    debug) não há PageReading: quem precisa dela passa coarse=False.
+    """
+    template = select_template(template_name)
+    template_key = _template_key(template_name)
+    if coarse is None:
+        coarse = COARSE_TO_FINE
+    if coarse and not debug and DETECTION_ENGINE != "fixed":
+        return read_page_coarse_to_fine(image, page_number, template, template_key, align_marks, tracker,
+                                        buffers), None
+    reading, alignment_info, roi = prepare_page(image, template, align_marks, roi_only, tracker, buffers)
+
+    # Detecção de bolhas (motor integral: arrays primeiro, dict derivado deles)
+    debug_image = None
+    with timed("detect"):
+        if roi and debug:
+            answers, debug_image = detect_bubbles_integral(reading.bw, template, debug=True,
+                                                           origin=reading.bw_origin, page_size=reading.bw_page_size,
+                                                           buffers=buffers)
+        elif DETECTION_ENGINE == "fixed" or debug:
+            answers, debug_image = detect_bubbles(reading.bw, template, debug=debug, buffers=buffers)
+        else:
+            sheet, darkness = detect_sheet_integral(reading.bw, template, reading.bw_origin, reading.bw_page_size,
+                                                    buffers)
+            reading.attach(sheet, darkness)
+            answers = sheet.to_dict()
+
+    return page_result(page_number, template_key, alignment_info, answers, roi, debug_image), reading
+
+
+def process_omr_pages(
+    pages: Iterable[Tuple[int, np.ndarray]],
+    template_name: Optional[str] = None,
+    align_marks: bool = True,
+    roi_only: Optional[bool] = None,
+    tracker: Optional[RegistrationTracker] = None,
+    screen: bool = False,
+    duplicates: Optional[DuplicateCheck] = None,
+    coarse: Optional[bool] = None,
+) -> List[Dict]:
+    """
+    process_omr_page para várias páginas [(número, imagem)] do mesmo template.
+    Alinhamento e binarização continuam página a página; a detecção empilha as
+    páginas de mesma geometria e lê escuridão e escada de thresholds do lote
+    inteiro de uma vez. Página com erro (triagem, hash, leitura ou detecção)
+    vira {"status": "erro"} no lugar dela; se a detecção empilhada falhar, o
+    grupo é relido página a página.
+    screen: triagem na miniatura antes da leitura; página sem os marcadores e
+    sem a grade de bolhas vira {"status": "ignorada", "motivo": ...}.
+    duplicates: hash de cada página ("phash"), sinalizando ("possivel_duplicata")
+    as páginas com hash parecido e as mesmas respostas de uma anterior do
+    job/tenant (toda página é lida).
+    coarse: leitura em dois níveis (None = OMR_COARSE_TO_FINE), página a página
+    (cada uma relê só as próprias questões ambíguas; não entra no empilhamento).
+    """
+    template = select_template(template_name)
+    template_key = _template_key(template_name)
+    if coarse is None:
+        coarse = COARSE_TO_FINE
+    coarse = coarse and DETECTION_ENGINE != "fixed"
+    results: Dict[int, Dict] = {}
+    groups: Dict[Tuple, List[Tuple[int, int, np.ndarray, Tuple[int, int], Dict]]] = {}
+    order = []
+    entries: Dict[int, Tuple[str, List[Dict], Dict]] = {}
+    # bw de cada página fica no pool até a detecção do grupo; o resto (cinza,
+    # Otsu, página alinhada) volta para o pool a cada página
+    with page_buffers() as buffers:
+        for index, (page_number, image) in enumerate(pages):
+            order.append(index)
+            # Triagem, hash e leitura por página: uma página ruim vira erro só dela
+            with page_buffers() as scratch:
+                try:
+                    thumb = PageThumbnail(image) if screen or duplicates is not None else None
+                    if screen:
+                        with timed("screen"):
+                            screening = screen_page(image, template, thumb)
+                        if screening is not None:
+                            results[index] = skipped_page_result(page_number, template_key, screening)
+                            continue
+                    if duplicates is not None:
+                        with timed("hash"):
+                            phash = page_hash(image, template, thumb)
+                        entries[index] = (phash, duplicates.match(phash), duplicates.add(phash, page_number))
+                    if coarse:
+                        results[index] = read_page_coarse_to_fine(image, page_number, template, template_key,
+                                                                  align_marks, tracker, scratch)
+                        continue
+                    reading, alignment_info, roi = prepare_page(image, template, align_marks, roi_only, tracker,
+                                                                scratch)
+                    if DETECTION_ENGINE == "fixed":
+                        with timed("detect"):
+                            answers, _ = detect_bubbles(reading.bw, template, buffers=scratch)
+                        results[index] = page_result(page_number, template_key, alignment_info, answers, roi)
+                        continue
+                except Exception as e:
+                    results[index] = page_error(page_number, e)
+                    continue
+                scratch.transfer(reading.bw, buffers)
+            groups.setdefault((reading.bw_page_size, roi), []).append(
+                (index, page_number, reading.bw, reading.bw_origin, alignment_info))
+
+        for (page_size, roi), group in groups.items():
+            try:
+                with timed("detect"):
+                    sheets = detect_sheets_integral([bw for _, _, bw, _, _ in group], template, page_size,
+                                                    [origin for _, _, _, origin, _ in group], buffers)
+            except Exception as e:
+                # Detecção empilhada falhou: página a página, para achar a(s) página(s) com problema
+                logger.error(f"[OMR] Erro na detecção de {len(group)} páginas juntas: {e}")
+                sheets = None
+            for position, (index, page_number, bw, origin, alignment_info) in enumerate(group):
+                try:
+                    if sheets is None:
+                        with timed("detect"):
+                            sheet, _ = detect_sheet_integral(bw, template, origin, page_size, buffers)
+                    else:
+                        sheet, _ = sheets[position]
+                    results[index] = page_result(page_number, template_key, alignment_info, sheet.to_dict(), roi)
+                except Exception as e:
+                    results[index] = page_error(page_number, e)
+
+    # Em ordem: as candidatas anteriores desta chamada já têm as respostas quando a página chega
+    for index in order:
+        if index not in entries:
+            continue
+        phash, candidates, entry = entries[index]
+        results[index]["phash"] = phash
+        match = duplicates.confirm(candidates, results[index])
+        if match is not None:
+            results[index]["possivel_duplicata"] = duplicate_flag(match)
+        duplicates.complete(entry, results[index])
+    return [results[index] for index in order]
+
+
+def detector_version() -> str:
+    """
+    Versão da leitura para o cache de resultados. Os motores integral/numpy são
+    bit a bit idênticos aos de referência e não entram; o pipeline ROI e o
+    alinhamento em modo lote mudam o resultado e entram, assim como a triagem
+    das páginas de PDF (páginas ignoradas também vão para o cache) e o hash
+    das páginas (guardado no resultado) e a leitura em dois níveis (questões
+    em branco relidas com outro LUT podem mudar). A decodificação em cinza
+    (cinza do libjpeg e redução por DCT até MAX_REDUCTION) não é bit a bit a
+    do Pillow e também entra: o cache em disco é compartilhado entre processos.
+    """
+    roi = ROI_PIPELINE and DETECTION_ENGINE != "fixed"
+    version = f"{DETECTOR_REVISION}:{'roi' if roi else 'full'}:{'lote' if BATCH_ALIGNMENT else 'pagina'}"
+    if DECODE_ENGINE == "gray":
+        version += f":gray-dct{MAX_REDUCTION}"
+    if PAGE_SCREENING:
+        version += f":triagem{SCREEN_GRID_CONTRAST:g}-{SCREEN_BLANK_INK:g}"
+    if PAGE_HASH_ENABLED:
+        version += f":phash{PAGE_HASH_GRID}"
+    if COARSE_TO_FINE and DETECTION_ENGINE != "fixed":
+        version += f":c2f{C2F_FACTOR}-{C2F_MARGIN}"
+    return version
+
+
+def page_cache_key(content_hash: str, template_key: str, align_marks: bool = True) -> Optional[str]:
+    """Chave do cache de resultados para um conteúdo (None se o cache estiver desligado)."""
+    if get_result_cache() is None:
+        return None
+    return cache_key(content_hash, template_key, select_template(template_key), align_marks, detector_version())
+
+
+def cached_page(key: Optional[str], page_number: int) -> Optional[Dict]:
+    """Resultado guardado para a chave, com o número da página desta requisição."""
+    if key is None:
+        return None
+    cached = get_result_cache().get(key)
+    if cached is None:
+        return None
+    return {"pagina": page_number, **cached}
+
+
+def store_page(key: Optional[str], result: Dict) -> None:
+    """
+    Guarda o resultado da página (sem número de página nem o bloco
+    "possivel_duplicata", que são da requisição). Resultados com debug não entram.
+    """
+    if key is None or "debug_image" in result:
+        return
+    get_result_cache().put(key, {k: v for k, v in result.items() if k not in ("pagina", "possivel_duplicata")})
+
+
+# DPI MANTIDO EM 150 - NÃO ALTERAR (afeta calibração)
+PDF_RENDER_DPI = 150
+# Renderização: "dpi" (PDF_RENDER_DPI, RGB) ou "template" (reference_size do template, em cinza)
+PDF_RENDER_MODE = os.getenv('OMR_PDF_RENDER', 'dpi').lower()
+# Páginas renderizadas por janela: memória de pico ~ 2 janelas, qualquer que seja o PDF
+PDF_RENDER_WINDOW = max(1, int(os.getenv('OMR_PDF_WINDOW', '4')))
+
+
+def save_pdf_to_tempfile(chunks: Iterable[bytes]) -> str:
+    """Grava o PDF, bloco a bloco, num arquivo temporário e retorna o caminho."""
+    fd, path = tempfile.mkstemp(suffix='.pdf', prefix='omr_')
+    with os.fdopen(fd, 'wb') as out:
+        for chunk in chunks:
+            out.write(chunk)
+    return path
+
+
+def iter_stream_chunks(stream, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """Lê um stream de arquivo em blocos."""
+    return iter(lambda: stream.read(chunk_size), b'')
+
+
+def download_pdf_to_tempfile(pdf_url: str) -> str:
+    """Baixa o PDF da URL em blocos direto para um arquivo temporário."""
     try:
-        response = requests.get(pdf_url, timeout=30)
-        response.raise_for_status()
-        pdf_bytes = response.content
-        
+        with timed("download"), lazy_import("requests").get(pdf_url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            return save_pdf_to_tempfile(response.iter_content(1024 * 1024))
+    except Exception as e:
+        logger.error(f"Erro ao baixar PDF: {e}")
+        raise
+
+
+def pdf_render_options(template: Optional[Dict] = None) -> Dict:
+    """
+    Parâmetros de convert_from_path para o template.
+
+    No modo "template", o pdftoppm rasteriza direto no reference_size do template
+    (escala da calibração, dispensa o redimensionamento depois) e em cinza (a
+    detecção só usa luminância; a página chega 2D e pula a conversão RGB→L).
+    Templates sem reference_size (normalizados) seguem em PDF_RENDER_DPI.
+    """
+    if PDF_RENDER_MODE == 'template' and template and "reference_size" in template:
+        size = (template["reference_size"]["width"], template["reference_size"]["height"])
+        return {"size": size, "grayscale": True}
+    return {"dpi": PDF_RENDER_DPI}
+
+
+def render_pdf_window(pdf_path: str, first_page: int, last_page: int,
+                      template: Optional[Dict] = None) -> List[np.ndarray]:
+    """Renderiza as páginas [first_page, last_page] do PDF (na thread do renderizador: só o histograma)."""
+    with timed("pdf_render"):
+        images = lazy_import("pdf2image").convert_from_path(pdf_path, first_page=first_page, last_page=last_page,
+                                                           thread_count=2, **pdf_render_options(template))
+        return [np.array(img) for img in images]
+
+
+def iter_pdf_pages(pdf_path: str, window: int = PDF_RENDER_WINDOW, template: Optional[Dict] = None,
+                   total_pages: Optional[int] = None) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Gera (número_da_página, imagem) renderizando o PDF em janelas de `window` páginas.
+    A próxima janela é renderizada (pdftoppm, fora do GIL) enquanto a atual é processada.
+    """
+    if total_pages is None:
         try:
-            from pdf2image import convert_from_bytes
-            # DPI MANTIDO EM 150 - NÃO ALTERAR (afeta calibração)
-            images = convert_from_bytes(pdf_bytes, dpi=150, thread_count=2)
-            return [np.array(img) for img in images]
+            total_pages = pdf_page_count(pdf_path)
         except ImportError:
             logger.error("pdf2image não instalado")
             raise
-            
+
+    windows = [(first, min(first + window - 1, total_pages)) for first in range(1, total_pages + 1, window)]
+    if not windows:
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as renderer:
+        pending = renderer.submit(render_pdf_window, pdf_path, *windows[0], template)
+        try:
+            for idx, (first_page, _last_page) in enumerate(windows):
+                images = pending.result()
+                pending = (renderer.submit(render_pdf_window, pdf_path, *windows[idx + 1], template)
+                           if idx + 1 < len(windows) else None)
+                for offset in range(len(images)):
+                    image, images[offset] = images[offset], None
+                    yield first_page + offset, image
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+
+def pdf_page_count(pdf_path: str) -> int:
+    """Número de páginas do PDF (pdfinfo)."""
+    return int(lazy_import("pdf2image").pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def process_pdf_pages(pdf_path: str, template_key: str,
+                      duplicates: Optional[DuplicateCheck] = None) -> Iterator[Dict]:
+    """
+    Processa o PDF em janelas de OMR_PDF_WINDOW páginas (resultado de erro por
+    página em vez de abortar); a detecção de cada janela é vetorizada
+    (process_omr_pages). Com OMR_PAGE_SCREENING, versos, capas e instruções
+    são ignorados (page_screening). Com duplicates, cada página
+    leva o hash e as possíveis duplicatas (double-feed, mesma folha em outro
+    upload do tenant) são sinalizadas (page_hash). Se
+    todas as páginas estiverem no cache de resultados, o PDF nem é renderizado.
+    """
+    template = select_template(template_key)
+    total_pages = pdf_page_count(pdf_path)
+    keys: Dict[int, Optional[str]] = {}
+    if get_result_cache() is not None:
+        with open(pdf_path, 'rb') as f:
+            pdf_hash = content_digest(iter_stream_chunks(f))
+        render = json.dumps(pdf_render_options(template), sort_keys=True)
+        keys = {n: page_cache_key(f"{pdf_hash}#p{n}@{render}", template_key) for n in range(1, total_pages + 1)}
+
+    cached = {n: cached_page(keys[n], n) for n in keys}
+    if keys and all(result is not None for result in cached.values()):
+        for page_num in range(1, total_pages + 1):
+            if duplicates is not None:
+                duplicates.register(cached[page_num], page_num)
+            yield cached[page_num]
+        return
+
+    tracker = RegistrationTracker() if BATCH_ALIGNMENT else None
+    # Páginas pendentes (em ordem) até completar uma janela: detecção vetorizada por janela
+    window: List[Tuple[int, Optional[np.ndarray]]] = []
+
+    def flush() -> Iterator[Dict]:
+        pending = [(n, image) for n, image in window if image is not None]
+        pages = process_omr_pages(pending, template_key, tracker=tracker, screen=PAGE_SCREENING,
+                                  duplicates=duplicates)
+        results = {r["pagina"]: r for r in pages}
+        count_pages(results.values(), template_key)
+        for n, image in window:
+            if image is None:
+                yield cached[n]
+                continue
+            if results[n].get("status") != "erro":
+                store_page(keys.get(n), results[n])
+                if duplicates is not None:
+                    duplicates.publish(results[n])
+            yield results[n]
+        window.clear()
+
+    for page_num, image in iter_pdf_pages(pdf_path, template=template, total_pages=total_pages):
+        if duplicates is not None and cached.get(page_num) is not None:
+            duplicates.register(cached[page_num], page_num)
+        window.append((page_num, None if cached.get(page_num) is not None else image))
+        if len(window) >= PDF_RENDER_WINDOW:
+            yield from flush()
+    yield from flush()
+
+
+def stream_pdf_results(pdf_path: str, template_key: str, timings: bool = False,
+                       duplicates: Optional[DuplicateCheck] = None) -> Iterator[str]:
+    """
+    Uma linha NDJSON por página, à medida que cada janela é processada (remove o PDF no fim).
+    timings: tempos por etapa do PDF inteiro na linha final (a detecção é por janela, não por página).
+    """
+    total = 0
+    errors = 0
+    skipped = 0
+    duplicated = 0
+    try:
+        for result in process_pdf_pages(pdf_path, template_key, duplicates):
+            total += 1
+            if result.get("status") == "erro":
+                errors += 1
+            elif result.get("status") == "ignorada":
+                skipped += 1
+            if "possivel_duplicata" in result:
+                duplicated += 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        summary = {"status": "concluido", "total_paginas": total, "erros": errors, "ignoradas": skipped,
+                   "possiveis_duplicatas": duplicated, "template": template_key}
+        if timings:
+            summary["timings"] = request_timings()
+            memory = request_memory()
+            if memory:
+                summary["memory"] = memory
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
     except Exception as e:
-        logger.error(f"Erro ao processar PDF: {e}")
+        logger.error(f"[PDF] Erro: {e}")
+        yield json.dumps({"status": "erro", "mensagem": str(e)}, ensure_ascii=False) + "\n"
+    finally:
+        os.remove(pdf_path)
+
+
+# ============================================================================
+# PROCESSAMENTO EM LOTE (PROCESS POOL + NDJSON)
+# ============================================================================
+
+# Com 1 (o padrão do gunicorn.conf.py com um worker por núcleo) não há pool: o lote é lido no próprio worker
+BATCH_WORKERS = int(os.getenv('OMR_BATCH_WORKERS', '0')) or (os.cpu_count() or 1)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp')
+# Limites do lote expandido: OMR_BATCH_MAX_MB só limita o corpo (comprimido) da requisição
+BATCH_MAX_FILES = int(os.getenv('OMR_BATCH_MAX_FILES', '2000'))
+BATCH_MAX_FILE_BYTES = int(os.getenv('OMR_BATCH_MAX_FILE_MB', '32')) * 1024 * 1024
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv('OMR_BATCH_MAX_UNCOMPRESSED_MB', '1024')) * 1024 * 1024
+# Folhas lidas do upload e enviadas ao pool de cada vez (o resto fica no zip/spool)
+BATCH_IN_FLIGHT = 2 * BATCH_WORKERS
+
+_batch_pool: Optional[ProcessPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+# Alinhamento em modo lote: cada processo do pool acompanha as folhas que recebe
+_worker_tracker: Optional[RegistrationTracker] = None
+
+
+def _init_batch_worker() -> None:
+    """Cada processo já é um núcleo: sem threads internas do OpenCV (evita oversubscription)."""
+    global _worker_tracker
+    cv2.setNumThreads(1)
+    if BATCH_ALIGNMENT:
+        _worker_tracker = RegistrationTracker()
+
+
+def get_batch_pool() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado (criado no primeiro lote)."""
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, initializer=_init_batch_worker)
+        return _batch_pool
+
+
+def decode_image_bytes(image_bytes: ImageData, template_key: Optional[str] = None) -> np.ndarray:
+    """
+    Decodifica bytes (ou o mmap de um upload) de imagem (PNG/JPEG/...) em array NumPy, com o motor de
+    OMR_DECODE_ENGINE; no modo "gray" a redução usa o tamanho de referência do template.
+    """
+    with timed("decode"):
+        if DECODE_ENGINE == "gray":
+            return decode_image(image_bytes, "gray", template_page_size(select_template(template_key)))
+        return decode_image(image_bytes)
+
+
+def read_image_bytes(image_bytes: bytes, page_number: int, template_key: str, debug: bool = False,
+                     tracker: Optional[RegistrationTracker] = None) -> Dict:
+    """
+    Decodifica e processa uma folha do lote. O hash da página (page_hash) também
+    é calculado aqui; as possíveis duplicatas são vistas no processo principal.
+    """
+    try:
+        image_array = decode_image_bytes(image_bytes, template_key)
+        page = process_omr_page(image_array, page_number, template_name=template_key, debug=debug, tracker=tracker)
+        if PAGE_HASH_ENABLED and not debug:
+            with timed("hash"):
+                page["phash"] = page_hash(image_array, select_template(template_key))
+        return {"status": "sucesso", "pagina": page}
+    except Exception as e:
+        return {"status": "erro", "mensagem": str(e)}
+
+
+def process_image_bytes(image_bytes: bytes, page_number: int, template_key: str, debug: bool = False) -> Dict:
+    """read_image_bytes dentro do pool de processos; os tempos voltam em "timings"."""
+    timer = begin_request()
+    try:
+        refresh_templates()
+        outcome = read_image_bytes(image_bytes, page_number, template_key, debug, _worker_tracker)
+        if outcome["status"] == "sucesso":
+            outcome["timings"] = timer.snapshot()
+        return outcome
+    finally:
+        end_request()
+
+
+def read_image_in_process(image_bytes: bytes, page_number: int, template_key: str, debug: bool,
+                          tracker: Optional[RegistrationTracker]) -> Dict:
+    """
+    read_image_bytes no próprio worker (lote sem pool). As etapas já entram no
+    timer da requisição e nos histogramas; "timings" é só a parte desta folha.
+    """
+    timer = current_timer()
+    before = dict(timer.stages) if timer is not None else {}
+    start = time.perf_counter()
+    outcome = read_image_bytes(image_bytes, page_number, template_key, debug, tracker)
+    if outcome["status"] == "sucesso" and timer is not None:
+        page_timings = {stage: round(ms - before.get(stage, 0.0), 3) for stage, ms in timer.stages.items()
+                        if ms != before.get(stage)}
+        page_timings["total"] = round((time.perf_counter() - start) * 1000, 3)
+        outcome["timings"] = page_timings
+    return outcome
+
+
+class BatchLimitExceeded(ValueError):
+    """Lote acima de OMR_BATCH_MAX_FILES / OMR_BATCH_MAX_FILE_MB / OMR_BATCH_MAX_UNCOMPRESSED_MB."""
+
+
+class BatchUploads:
+    """
+    Folhas de um lote como (nome, leitor) e os spools do upload de onde elas
+    são lidas. O Flask fecha os arquivos do multipart no fim da requisição,
+    antes do streaming: os spools passam a ser do lote e são fechados no fim
+    dele (close).
+    """
+
+    def __init__(self):
+        self.items: List[Tuple[str, Callable[[], bytes]]] = []
+        self.streams = []
+        self.total_bytes = 0
+
+    def own(self, storage):
+        """Tira o spool do FileStorage (que a requisição fecharia) e o guarda no lote."""
+        stream = storage.stream
+        storage.stream = io.BytesIO()
+        self.streams.append(stream)
+        return stream
+
+    def add(self, name: str, size: int, reader: Callable[[], bytes]) -> None:
+        if len(self.items) >= BATCH_MAX_FILES:
+            raise BatchLimitExceeded(f"Lote com mais de {BATCH_MAX_FILES} imagens")
+        if size > BATCH_MAX_FILE_BYTES:
+            raise BatchLimitExceeded(f"{name}: {size} bytes, acima do limite por imagem ({BATCH_MAX_FILE_BYTES})")
+        self.total_bytes += size
+        if self.total_bytes > BATCH_MAX_UNCOMPRESSED_BYTES:
+            raise BatchLimitExceeded(f"Lote expandido acima de {BATCH_MAX_UNCOMPRESSED_BYTES} bytes")
+        self.items.append((name, reader))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def close(self) -> None:
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+
+
+def _stream_reader(stream) -> Callable[[], bytes]:
+    def read() -> bytes:
+        stream.seek(0)
+        return stream.read()
+    return read
+
+
+def _zip_reader(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Callable[[], bytes]:
+    def read() -> bytes:
+        # O zipfile não descomprime além de file_size (já conferido) e confere o CRC
+        return archive.read(info)
+    return read
+
+
+def collect_batch_uploads(files) -> BatchUploads:
+    """
+    Imagens do multipart ('images'/'image', repetidos) e de arquivos .zip, como
+    (nome, leitor): nada é lido aqui, cada folha é lida quando vai para o pool.
+    Os limites valem antes de ler qualquer folha, pelo tamanho declarado de
+    cada entrada (ZipInfo.file_size, que o zipfile não deixa ultrapassar):
+    um zip bomb é recusado sem descomprimir nada (BatchLimitExceeded).
+    """
+    batch = BatchUploads()
+    try:
+        for storage in files.getlist('images') + files.getlist('image'):
+            name = storage.filename or f"imagem_{len(batch) + 1}"
+            stream = batch.own(storage)
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(0)
+            if name.lower().endswith('.zip') or zipfile.is_zipfile(stream):
+                stream.seek(0)
+                archive = zipfile.ZipFile(stream)
+                for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                    entry = info.filename
+                    if info.is_dir() or entry.startswith('__MACOSX/') or not entry.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    batch.add(entry, info.file_size, _zip_reader(archive, info))
+            else:
+                batch.add(name, size, _stream_reader(stream))
+    except Exception:
+        batch.close()
         raise
+    return batch
+
+
+def stream_batch_results(batch: BatchUploads, template_key: str, debug: bool = False,
+                         timings: bool = False, duplicates: Optional[DuplicateCheck] = None):
+    """
+    Distribui as folhas no pool e gera uma linha NDJSON por folha, na ordem em que terminam.
+    batch: de collect_batch_uploads (fechado no fim); no máximo BATCH_IN_FLIGHT
+    folhas ficam lidas em memória (enviadas ao pool) ao mesmo tempo.
+    Com BATCH_WORKERS = 1 não há pool: as folhas são lidas uma a uma aqui mesmo,
+    em ordem (um pool de um processo só somaria serialização e IPC à leitura).
+    Folhas já no cache de resultados saem na hora, sem ir para o pool.
+    duplicates: sinaliza as possíveis duplicatas na ordem em que as folhas terminam.
+    """
+    pool = get_batch_pool() if BATCH_WORKERS > 1 else None
+    # Sem pool, o alinhamento em modo lote acompanha as folhas deste lote
+    tracker = RegistrationTracker() if pool is None and BATCH_ALIGNMENT else None
+    futures = {}
+    errors = 0
+    pending = enumerate(batch.items, start=1)
+
+    def result_line(idx: int, name: str, key: Optional[str], outcome: Dict, in_pool: bool) -> str:
+        nonlocal errors
+        page_timings = outcome.pop("timings", None)
+        if page_timings:
+            # Tempos medidos no processo do pool entram nos histogramas daqui
+            if in_pool:
+                record_timings(page_timings)
+            if timings:
+                outcome["timings"] = page_timings
+        if outcome["status"] != "sucesso":
+            errors += 1
+        else:
+            if duplicates is not None:
+                duplicates.register(outcome["pagina"], idx)
+            store_page(key, outcome["pagina"])
+            count_pages([outcome["pagina"]], template_key)
+        line = {"indice": idx, "arquivo": name, "template": template_key}
+        line.update(outcome)
+        return json.dumps(line, ensure_ascii=False) + "\n"
+
+    try:
+        while True:
+            for idx, (name, read) in pending:
+                line = {"indice": idx, "arquivo": name, "template": template_key}
+                try:
+                    data = read()
+                except Exception as e:
+                    # Entrada corrompida no zip (CRC, compressão): erro só desta folha
+                    errors += 1
+                    line.update({"status": "erro", "mensagem": str(e)})
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+                    continue
+                key = None if debug else page_cache_key(content_digest((data,)), template_key)
+                cached = cached_page(key, idx)
+                if cached is not None:
+                    if duplicates is not None:
+                        duplicates.register(cached, idx)
+                    line.update({"status": "sucesso", "pagina": cached})
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+                    continue
+                if pool is None:
+                    outcome = read_image_in_process(data, idx, template_key, debug, tracker)
+                    del data
+                    yield result_line(idx, name, key, outcome, False)
+                    continue
+                futures[pool.submit(process_image_bytes, data, idx, template_key, debug)] = (idx, name, key)
+                del data
+                if len(futures) >= BATCH_IN_FLIGHT:
+                    break
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx, name, key = futures.pop(future)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = {"status": "erro", "mensagem": str(e)}
+                yield result_line(idx, name, key, outcome, True)
+        yield json.dumps({"status": "concluido", "total_paginas": len(batch), "erros": errors}, ensure_ascii=False) + "\n"
+    finally:
+        # Cliente desconectou: não processar o resto do lote
+        for future in futures:
+            future.cancel()
+        batch.close()
 
 
 # ============================================================================
 # VALIDAÇÃO CHATGPT (ETAPA 8)
 # ============================================================================
 
-def validate_with_chatgpt_internal(image_bytes: bytes, omr_result: Dict[str, str], template_key: str, openai_api_key: str) -> Dict:
+# "page": página inteira; "crops": só o mosaico das questões ambíguas (validation_crops);
+# "batch": roteador por confiança + questões ambíguas de várias folhas na mesma chamada
+VALIDATION_MODE = os.getenv("OMR_VALIDATION_MODE", "page").lower()
+
+
+def chatgpt_completion(system_prompt: str, user_prompt: str, image_url: str, openai_api_key: str) -> Optional[Dict]:
+    """Uma chamada ao chat completions (texto + imagem); devolve o JSON da resposta ou None se não houver."""
+    chatgpt_payload = {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": system_prompt
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": user_prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": image_url}
+                    }
+                ]
+            }
+        ],
+        "max_tokens": 2000,
+        "temperature": 0.1
+    }
+    
+    headers = {
+        "Authorization": f"Bearer {openai_api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    # Session compartilhada: conexão keep-alive reaproveitada entre validações
+    with timed("validation"):
+        response = http_session().post(
+            OPENAI_API_URL,
+            headers=headers,
+            json=chatgpt_payload,
+            timeout=60
+        )
+    
+    if response.status_code != 200:
+        raise Exception(f"ChatGPT API error: {response.status_code}")
+    
+    raw_content = response.json()["choices"][0]["message"]["content"]
+    json_match = re.search(r'\{.*\}', raw_content, re.DOTALL)
+    return json.loads(json_match.group()) if json_match else None
+
+
+def validate_with_chatgpt_internal(image_bytes: ImageData, omr_result: Dict[str, str], template_key: str, openai_api_key: str) -> Dict:
     """
     Validação ChatGPT (Etapa 8).
     """
@@ -484,69 +1584,34 @@ def validate_with_chatgpt_internal(image_bytes: bytes, omr_result: Dict[str, str
         total_questions = AVAILABLE_TEMPLATES[template_key]["total_questions"]
         omr_array = [omr_result.get(str(i), None) for i in range(1, total_questions + 1)]
         
-        image = Image.open(io.BytesIO(image_bytes))
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-        
-        chatgpt_payload = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": f"You are an expert OMR validator. Validate {total_questions} questions. Return ONLY valid JSON."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"OMR: {json.dumps(omr_array)}. Return: {{\"answers\":[\"A\",...], \"corrections\": [{{\"q\": 5, \"omr\": \"A\", \"corrected\": \"B\", \"reason\": \"...\"}}]}}"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{img_base64}"}
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 2000,
-            "temperature": 0.1
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {openai_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Log removido para melhor performance
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=chatgpt_payload,
-            timeout=60
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"ChatGPT API error: {response.status_code}")
-        
-        chatgpt_data = response.json()
-        raw_content = chatgpt_data["choices"][0]["message"]["content"]
-        
-        import re
-        json_match = re.search(r'\{.*\}', raw_content, re.DOTALL)
-        if json_match:
-            validated_data = json.loads(json_match.group())
-            validated_answers = validated_data.get("answers", omr_array)
-            corrections = validated_data.get("corrections", [])
+        image = open_image(image_bytes)
+        if image.format in ("PNG", "JPEG"):
+            # Já é um formato aceito pela API: envia os bytes originais (sem reencodar)
+            mime = f"image/{image.format.lower()}"
+            img_base64 = base64.b64encode(image_bytes).decode('utf-8')
         else:
-            validated_answers = omr_array
-            corrections = []
+            buffered = io.BytesIO()
+            image.save(buffered, format="PNG")
+            mime = "image/png"
+            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
         
-        validated_dict = {str(i): validated_answers[i-1] for i in range(1, len(validated_answers) + 1)}
+        validated_data = chatgpt_completion(
+            f"You are an expert OMR validator. Validate {total_questions} questions. Return ONLY valid JSON.",
+            f"OMR: {json.dumps(omr_array)}. Return: {{\"answers\":[\"A\",...], \"corrections\": [{{\"q\": 5, \"omr\": \"A\", \"corrected\": \"B\", \"reason\": \"...\"}}]}}",
+            f"data:{mime};base64,{img_base64}",
+            openai_api_key,
+        )
+        validated_data = validated_data or {}
+        rows = {str(i): answer for i, answer in enumerate(omr_array, 1)}
+        returned = validated_data.get("answers")
+        if isinstance(returned, list):
+            returned = {str(i): answer for i, answer in enumerate(returned, 1)}
+        options = AVAILABLE_TEMPLATES[template_key]["options"]
+        validated_dict, corrections = checked_answers(rows, returned, {q: options for q in rows},
+                                                      validated_data.get("corrections"))
         
         corrections_count = len(corrections)
-        agreement_rate = sum(1 for i in range(len(omr_array)) if omr_array[i] == validated_answers[i]) / len(omr_array) * 100
+        agreement_rate = sum(1 for q, a in rows.items() if validated_dict[q] == a) / len(rows) * 100
         
         # Log removido para melhor performance
         
@@ -564,22 +1629,256 @@ def validate_with_chatgpt_internal(image_bytes: bytes, omr_result: Dict[str, str
         raise
 
 
+def checked_answers(rows: Dict[str, str], returned, options: Dict[str, List[str]],
+                    model_corrections) -> Tuple[Dict[str, str], List[Dict]]:
+    """
+    Respostas do modelo conferidas. rows: {rótulo: resposta do OMR}; returned:
+    {rótulo: resposta do modelo}; options: {rótulo: alternativas do template}.
+    Só entra uma alternativa da questão (maiúscula ou minúscula) ou NO_ANSWER;
+    qualquer outra coisa, ou rótulo desconhecido, mantém a resposta do OMR. As
+    correções são as linhas que de fato mudaram, com o "reason" do modelo
+    quando ele deu um (a lista de correções do modelo não é usada como está).
+    """
+    answers = dict(rows)
+    if isinstance(returned, dict):
+        for label, answer in returned.items():
+            label = str(label)
+            if label not in rows or not isinstance(answer, str):
+                continue
+            answer = answer.strip()
+            if answer.upper() in options[label]:
+                answers[label] = answer.upper()
+            elif answer == NO_ANSWER:
+                answers[label] = answer
+    reasons = {}
+    if isinstance(model_corrections, list):
+        reasons = {str(c.get("q")): c["reason"] for c in model_corrections
+                   if isinstance(c, dict) and isinstance(c.get("reason"), str)}
+    corrections = []
+    for label, omr in rows.items():
+        if answers[label] != omr:
+            correction = {"q": label, "omr": omr, "corrected": answers[label]}
+            if label in reasons:
+                correction["reason"] = reasons[label]
+            corrections.append(correction)
+    return answers, corrections
+
+
+def chatgpt_validate_rows(mosaic_jpeg: bytes, rows: Dict[str, str], options: Dict[str, List[str]],
+                          openai_api_key: str) -> Tuple[Dict[str, str], List[Dict]]:
+    """
+    Valida as linhas de um mosaico de recortes. rows: {rótulo da faixa: resposta
+    do OMR}; options: {rótulo: alternativas da questão}. Retorna ({rótulo:
+    resposta validada}, correções), conferidas por checked_answers.
+    """
+    labels = ", ".join(rows)
+    validated_data = chatgpt_completion(
+        f"You are an expert OMR validator. The image shows only rows {labels}, one question each, "
+        f"labeled at the left with the option letters above the bubbles. Return ONLY valid JSON.",
+        f"OMR: {json.dumps(rows)}. Return: {{\"answers\": {{\"<row label>\": \"A\", ...}}, \"corrections\": "
+        f"[{{\"q\": \"<row label>\", \"omr\": \"A\", \"corrected\": \"B\", \"reason\": \"...\"}}]}}",
+        f"data:image/jpeg;base64,{base64.b64encode(mosaic_jpeg).decode('utf-8')}",
+        openai_api_key,
+    )
+    if validated_data is None:
+        return dict(rows), []
+    return checked_answers(rows, validated_data.get("answers"), options, validated_data.get("corrections"))
+
+
+def crops_validation_result(omr_result: Dict[str, str], ambiguous: Dict[str, str], answers: Dict[str, str],
+                            corrections: List[Dict], payload_bytes: int, mode: str = "crops") -> Dict:
+    """Resultado no formato de validate_with_chatgpt_internal, com as respostas validadas das questões enviadas."""
+    validated_dict = dict(omr_result)
+    validated_dict.update(answers)
+    agreement = sum(1 for q, a in omr_result.items() if validated_dict.get(q) == a)
+    return {
+        "status": "success",
+        "mode": mode,
+        "chatgpt_validated": validated_dict,
+        "corrections": corrections,
+        "corrections_count": len(corrections),
+        "agreement_rate": round(agreement / max(1, len(omr_result)) * 100, 1),
+        "questions_sent": list(ambiguous),
+        "payload_bytes": payload_bytes,
+        "model": "gpt-4o-mini"
+    }
+
+
+def validate_with_chatgpt_crops(mosaic_jpeg: bytes, ambiguous: Dict[str, str], omr_result: Dict[str, str],
+                                options: List[str], openai_api_key: str) -> Dict:
+    """
+    Validação ChatGPT só das questões ambíguas (mosaico de recortes, ver validation_crops).
+    ambiguous: {questão: resposta do OMR} das linhas do mosaico; options:
+    alternativas do template. Sem questões ambíguas não há chamada à API.
+    Mesmo formato de validate_with_chatgpt_internal.
+    """
+    try:
+        answers: Dict[str, str] = {}
+        corrections: List[Dict] = []
+        if ambiguous:
+            labeled, corrections = chatgpt_validate_rows(
+                mosaic_jpeg, {f"Q{q}": a for q, a in ambiguous.items()}, {f"Q{q}": options for q in ambiguous},
+                openai_api_key
+            )
+            answers = {q: labeled[f"Q{q}"] for q in ambiguous}
+            corrections = [dict(c, q=c["q"][1:]) for c in corrections]
+        return crops_validation_result(omr_result, ambiguous, answers, corrections, len(mosaic_jpeg))
+
+    except Exception as e:
+        logger.error(f"[ChatGPT] Erro: {e}")
+        raise
+
+
+def validate_sheets_with_chatgpt(openai_api_key: str, sheets: List[Dict]) -> List[Dict]:
+    """
+    Uma chamada para as questões ambíguas de várias folhas (ValidationBatcher).
+    sheets: {"omr": respostas da folha, "ambiguous": {questão: resposta}, "strips": faixas,
+    "options": alternativas do template}.
+    As faixas são rotuladas F<folha>-Q<questão> e o resultado volta separado por folha.
+    """
+    labeled = []
+    rows: Dict[str, str] = {}
+    options: Dict[str, List[str]] = {}
+    for i, sheet in enumerate(sheets, 1):
+        for (q, answer), strip in zip(sheet["ambiguous"].items(), sheet["strips"]):
+            labeled.append((f"F{i}-Q{q}", strip))
+            rows[f"F{i}-Q{q}"] = answer
+            options[f"F{i}-Q{q}"] = sheet["options"]
+    mosaic = build_mosaic(labeled)
+    answers, corrections = chatgpt_validate_rows(mosaic, rows, options, openai_api_key)
+
+    results = []
+    for i, sheet in enumerate(sheets, 1):
+        prefix = f"F{i}-Q"
+        sheet_answers = {q: answers[prefix + q] for q in sheet["ambiguous"]}
+        sheet_corrections = [dict(c, q=str(c.get("q"))[len(prefix):]) for c in corrections
+                             if str(c.get("q", "")).startswith(prefix)]
+        result = crops_validation_result(sheet["omr"], sheet["ambiguous"], sheet_answers, sheet_corrections,
+                                         len(mosaic), mode="batch")
+        result["batch_sheets"] = len(sheets)
+        results.append(result)
+    return results
+
+
+def route_validation(reading: "PageReading", omr_answers: Dict[str, str], openai_api_key: str,
+                     callback_url: Optional[str], meta: Dict) -> Dict:
+    """
+    Roteador da validação em lote: a confiança da folha é a menor margem 1ª-2ª
+    entre as questões. Acima de OMR_VALIDATION_MARGIN a folha não é validada;
+    abaixo, as questões ambíguas entram no lote compartilhado entre folhas.
+    """
+    batcher = validation_batcher(validate_sheets_with_chatgpt)
+    confidence = sheet_margin(reading)
+    ambiguous, strips = ambiguous_strips(reading, omr_answers)
+    if not ambiguous:
+        batcher.skip()
+        return {"status": "skipped", "reason": "confident", "min_margin": round(confidence, 3)}
+    job = batcher.submit(openai_api_key, {"omr": omr_answers, "ambiguous": ambiguous, "strips": strips,
+                                          "options": reading.template["options"]},
+                         len(ambiguous), callback_url=callback_url, meta=meta)
+    return {
+        "status": "queued",
+        "job_id": job["job_id"],
+        "poll_url": f"/api/validation-jobs/{job['job_id']}",
+        "min_margin": round(confidence, 3),
+        "questions": len(ambiguous),
+    }
+
+
+# ============================================================================
+# PRODUÇÃO: PRÉ-CARGA E AQUECIMENTO (gunicorn.conf.py)
+# ============================================================================
+
+def preload_templates() -> None:
+    """
+    Compila os templates no tamanho de referência e no tamanho reduzido (> 3000px).
+    Chamado no master antes do fork: os workers herdam a geometria pronta.
+    """
+    with _startup.phase("preload_templates"):
+        for template in AVAILABLE_TEMPLATES.values():
+            width, height = template_page_size(template)
+            get_compiled_template(template, width, height)
+            reduced = target_size(width, height)
+            if reduced is not None:
+                get_compiled_template(template, *reduced)
+
+
+def synthetic_sheet(template: Dict) -> np.ndarray:
+    """Folha sintética (synthetic_sheets): marcadores P1-P4 e a 1ª alternativa de cada questão marcada."""
+    compiled = get_compiled_template(template, *template_page_size(template))
+    return render_marks(template, {key: compiled.options[:1] for key in compiled.question_keys})
+
+
+def warm_up() -> float:
+    """
+    Processa uma folha sintética por template (pools de thread do OpenCV, LUTs,
+    alocações) e decodifica um PNG (plugins do PIL) antes do worker aceitar
+    tráfego; ao final o processo passa a pronto (/ready). Retorna o tempo gasto (s).
+    """
+    start = time.perf_counter()
+    with _startup.phase("warm_up_decode"):
+        ok, png = cv2.imencode(".png", synthetic_sheet(AVAILABLE_TEMPLATES[DEFAULT_TEMPLATE_NAME]))
+        if ok:
+            decode_image_bytes(png.tobytes(), DEFAULT_TEMPLATE_NAME)
+    for key, template in AVAILABLE_TEMPLATES.items():
+        with _startup.phase(f"warm_up:{key}"):
+            process_omr_page(synthetic_sheet(template), template_name=key)
+    # Histogramas começam do tráfego real (o aquecimento é medido em /health)
+    REGISTRY.reset()
+    _startup.mark_ready()
+    return time.perf_counter() - start
+
+
 # ============================================================================
 # ENDPOINTS
 # ============================================================================
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
+    """Health check endpoint (liveness: responde sempre; "ready" indica o aquecimento concluído)"""
     return jsonify({
         "status": "ok",
+        "live": True,
+        "ready": _startup.ready,
+        "startup": _startup.info(),
         "service": "baddrow-omr-service",
         "default_template": DEFAULT_TEMPLATE_NAME,
         "templates": list(AVAILABLE_TEMPLATES.keys()),
-        "detection": "OpenCV"
+        "detection": "OpenCV",
+        "detection_engine": DETECTION_ENGINE,
+        "preprocess_engine": PREPROCESS_ENGINE,
+        "decode_engine": DECODE_ENGINE,
+        "roi_pipeline": ROI_PIPELINE,
+        "coarse_to_fine": {"enabled": COARSE_TO_FINE, "factor": C2F_FACTOR, "margin": C2F_MARGIN},
+        "batch_workers": BATCH_WORKERS,
+        "batch_alignment": BATCH_ALIGNMENT,
+        "pdf_render": PDF_RENDER_MODE,
+        "compiled_templates": template_cache_info(),
+        "template_registry": _registry.info(),
+        "result_cache": result_cache_info(),
+        "buffer_pool": buffer_pool_info(),
+        "page_screening": PAGE_SCREENING,
+        "duplicate_index": {"enabled": PAGE_HASH_ENABLED, **tenant_index().info()},
+        "validation_jobs": validation_jobs().info(),
+        "validation_mode": VALIDATION_MODE,
+        "validation_router": validation_batcher(validate_sheets_with_chatgpt).info()
     })
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 503 até o warm_up() do processo terminar."""
+    if not _startup.ready:
+        return jsonify({"status": "aquecendo", "startup": _startup.info()}), 503
+    return jsonify({"status": "ok", "ready_after_ms": _startup.ready_after})
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas do processo no formato texto do Prometheus."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/api/process-pdf', methods=['GET'])
 def process_pdf():
     """Processa PDF completo."""
@@ -590,32 +1889,58 @@ def process_pdf():
         
         template_name = request.args.get('template', DEFAULT_TEMPLATE_NAME)
         template_key = template_name.lower() if template_name and template_name.lower() in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
-        # Log removido para melhor performance
-        images = pdf_url_to_images(pdf_url)
-        # Log removido para melhor performance
-        
-        results = []
-        for page_num, image in enumerate(images, start=1):
-            try:
-                result = process_omr_page(image, page_num, template_name=template_key)
-                results.append(result)
-                # Log removido para melhor performance
-            except Exception as e:
-                logger.error(f"[PDF] Erro página {page_num}: {e}")
-                results.append({"pagina": page_num, "status": "erro", "mensagem": str(e)})
+        pdf_path = download_pdf_to_tempfile(pdf_url)
+
+        duplicates = request_duplicates()
+        if request.args.get('stream', 'false').lower() == 'true':
+            return Response(stream_with_context(stream_pdf_results(pdf_path, template_key, timings_requested(),
+                                                                   duplicates)),
+                            mimetype='application/x-ndjson')
+
+        try:
+            results = list(process_pdf_pages(pdf_path, template_key, duplicates))
+        finally:
+            os.remove(pdf_path)
         
-        return jsonify({
+        response_data = {
             "status": "sucesso",
             "paginas": results,
             "total_paginas": len(results),
+            "paginas_ignoradas": sum(1 for r in results if r.get("status") == "ignorada"),
+            "paginas_possiveis_duplicatas": sum(1 for r in results if "possivel_duplicata" in r),
             "template": template_key
-        })
+        }
+        response_data.update(timing_blocks())
+        return jsonify(response_data)
         
     except Exception as e:
         logger.error(f"[PDF] Erro: {e}")
         return jsonify({"status": "erro", "mensagem": str(e)}), 500
 
 
+@app.route('/api/process-pdf', methods=['POST'])
+def process_pdf_upload():
+    """Processa PDF enviado diretamente (multipart 'pdf' ou corpo application/pdf), com resposta NDJSON por página."""
+    try:
+        if 'pdf' in request.files:
+            source = request.files['pdf'].stream
+        elif request.mimetype == 'application/pdf':
+            source = request.stream
+        else:
+            return jsonify({"status": "erro", "mensagem": "Arquivo 'pdf' não fornecido"}), 400
+
+        template_name = request.values.get('template', DEFAULT_TEMPLATE_NAME)
+        template_key = template_name.lower() if template_name and template_name.lower() in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
+        pdf_path = save_pdf_to_tempfile(iter_stream_chunks(source))
+        return Response(stream_with_context(stream_pdf_results(pdf_path, template_key, timings_requested(),
+                                                               request_duplicates())),
+                        mimetype='application/x-ndjson')
+
+    except Exception as e:
+        logger.error(f"[PDF] Erro: {e}")
+        return jsonify({"status": "erro", "mensagem": str(e)}), 500
+
+
 @app.route('/api/process-image', methods=['POST'])
 def process_image():
     """Processa imagem individual."""
@@ -627,21 +1952,73 @@ def process_image():
         if image_file.filename == '':
             return jsonify({"status": "erro", "mensagem": "Arquivo vazio"}), 400
         
-        image_bytes = image_file.read()
-        # Log removido para melhor performance
-        image = Image.open(io.BytesIO(image_bytes))
-        image_array = np.array(image)
-        # Log removido para melhor performance
+        # Bytes ou mmap do spool, sem cópia; só o job assíncrono (modo página) copia
+        upload = open_upload(image_file)
         
         page_num = int(request.form.get('page', 1))
         template_name = request.form.get('template', DEFAULT_TEMPLATE_NAME)
         debug_mode = request.args.get('debug', 'false').lower() == 'true'
         validate_chatgpt = request.args.get('validate_with_chatgpt', 'false').lower() == 'true'
+        validation_async = request.args.get('validation_async', 'true').lower() == 'true'
+        validation_mode = request.args.get('validation_mode', VALIDATION_MODE).lower()
+        binary = request.args.get('format', 'json').lower() == 'npy'
         template_key = template_name.lower() if template_name and template_name.lower() in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
+        if binary:
+            # O .npy sai direto da leitura: sem validação, imagem de debug nem possíveis duplicatas do tenant
+            duplicates = request_duplicates()
+            unsupported = [name for name, requested in (
+                ("validate_with_chatgpt", validate_chatgpt),
+                ("debug", debug_mode),
+                ("tenant", duplicates is not None and duplicates.tenant is not None),
+            ) if requested]
+            if unsupported:
+                return jsonify({"status": "erro",
+                                "mensagem": f"format=npy não suporta: {', '.join(unsupported)}"}), 400
+        callback_url = request.values.get('callback_url')
+        if validate_chatgpt and validation_async:
+            # Recusado antes da leitura: o servidor só faz POST para hosts da allowlist
+            try:
+                check_callback_url(callback_url)
+            except CallbackNotAllowed as e:
+                return jsonify({"status": "erro", "mensagem": str(e)}), 400
         
-        # Log removido para melhor performance
-        result = process_omr_page(image_array, page_num, template_name=template_key, debug=debug_mode)
-        # Log removido para melhor performance
+        if binary:
+            # Arrays direto da leitura (o cache guarda só o JSON, sem a matriz de tinta)
+            image_array = decode_image_bytes(upload.data, template_key)
+            result, reading = read_omr_page(image_array, page_num, template_name=template_key,
+                                            buffers=request_buffers(), coarse=False)
+            count_pages([result], template_key)
+            sheet = reading.sheet()
+            return Response(sheet.to_npy(), mimetype=NPY_MIMETYPE, headers={
+                "X-OMR-Pagina": str(page_num),
+                "X-OMR-Template": template_key,
+                "X-OMR-Options": ",".join(sheet.options),
+                "X-OMR-Aligned": str(bool(result["alinhamento"].get("aligned"))).lower(),
+            })
+        
+        # Cache de resultados: acerto dispensa decodificação, alinhamento e detecção
+        result_key = None if debug_mode else page_cache_key(content_digest((upload.data,)), template_key)
+        result = cached_page(result_key, page_num)
+        reading = None
+        # Uploads anteriores do tenant (page_hash): sinaliza possíveis duplicatas
+        duplicates = None if debug_mode else request_duplicates()
+        if result is not None and duplicates is not None:
+            duplicates.register(result, page_num)
+        # Modo crops precisa da leitura (imagem alinhada + escuridão), mesmo com acerto no cache
+        needs_reading = validate_chatgpt and validation_mode in ("crops", "batch")
+        if result is None or needs_reading:
+            image_array = decode_image_bytes(upload.data, template_key)
+            fresh, reading = read_omr_page(image_array, page_num, template_name=template_key, debug=debug_mode,
+                                           buffers=request_buffers(), coarse=False if needs_reading else None)
+            if result is None:
+                result = fresh
+                if duplicates is not None:
+                    with timed("hash"):
+                        result["phash"] = page_hash(image_array, select_template(template_key))
+                    duplicates.register(result, page_num)
+                store_page(result_key, result)
+            del image_array
+            count_pages([fresh], template_key)
         
         response_data = {
             "status": "sucesso",
@@ -655,15 +2032,64 @@ def process_image():
             if not openai_api_key:
                 logger.warning("[Image] ChatGPT: API Key não fornecida")
                 response_data["chatgpt_validation"] = {"status": "skipped", "reason": "OPENAI_API_KEY não fornecida"}
-            else:
+            elif validation_async and validation_mode == "batch":
+                # Folha confiante não é validada; as ambíguas vão num lote entre folhas
                 try:
-                    # Log removido para melhor performance
-                    chatgpt_result = validate_with_chatgpt_internal(
+                    response_data["chatgpt_validation"] = route_validation(
+                        reading, dict(result["resultado"]["questoes"]), openai_api_key,
+                        callback_url, {"pagina": page_num, "template": template_key},
+                    )
+                except ValidationQueueFull as e:
+                    logger.warning(f"[Image] ChatGPT: {e}")
+                    response_data["chatgpt_validation"] = {"status": "rejected", "reason": str(e)}
+            elif validation_async:
+                # Resposta do OMR sai agora; a validação roda no pool (polling ou callback)
+                omr_answers = dict(result["resultado"]["questoes"])
+                if needs_reading:
+                    # O job guarda só o mosaico (KB), não a página nem a leitura
+                    mosaic, ambiguous = ambiguous_crops(reading, omr_answers)
+                    reading = None
+                    options = AVAILABLE_TEMPLATES[template_key]["options"]
+                    run = lambda: validate_with_chatgpt_crops(mosaic, ambiguous, omr_answers, options, openai_api_key)
+                else:
+                    # O job roda depois da requisição: precisa de bytes próprios (o mmap fecha no teardown)
+                    image_bytes = upload.to_bytes()
+                    run = lambda: validate_with_chatgpt_internal(
                         image_bytes=image_bytes,
-                        omr_result=result["resultado"]["questoes"],
+                        omr_result=omr_answers,
                         template_key=template_key,
                         openai_api_key=openai_api_key
                     )
+                try:
+                    job = validation_jobs().submit(
+                        run,
+                        callback_url=callback_url,
+                        meta={"pagina": page_num, "template": template_key},
+                    )
+                    response_data["chatgpt_validation"] = {
+                        "status": "queued",
+                        "job_id": job["job_id"],
+                        "poll_url": f"/api/validation-jobs/{job['job_id']}",
+                    }
+                except ValidationQueueFull as e:
+                    logger.warning(f"[Image] ChatGPT: {e}")
+                    response_data["chatgpt_validation"] = {"status": "rejected", "reason": str(e)}
+            else:
+                try:
+                    # Log removido para melhor performance
+                    if needs_reading:
+                        mosaic, ambiguous = ambiguous_crops(reading, result["resultado"]["questoes"])
+                        chatgpt_result = validate_with_chatgpt_crops(
+                            mosaic, ambiguous, result["resultado"]["questoes"],
+                            AVAILABLE_TEMPLATES[template_key]["options"], openai_api_key
+                        )
+                    else:
+                        chatgpt_result = validate_with_chatgpt_internal(
+                            image_bytes=upload.data,
+                            omr_result=result["resultado"]["questoes"],
+                            template_key=template_key,
+                            openai_api_key=openai_api_key
+                        )
                     response_data["chatgpt_validation"] = chatgpt_result
                     
                     if chatgpt_result.get("corrections_count", 0) > 0:
@@ -675,6 +2101,7 @@ def process_image():
                     logger.error(f"[Image] ChatGPT: Erro {e}")
                     response_data["chatgpt_validation"] = {"status": "error", "error": str(e)}
         
+        response_data.update(timing_blocks())
         return jsonify(response_data)
         
     except Exception as e:
@@ -682,6 +2109,44 @@ def process_image():
         return jsonify({"status": "erro", "mensagem": str(e)}), 500
 
 
+@app.route('/api/process-batch', methods=['POST'])
+def process_batch():
+    """Processa várias imagens (multipart ou zip) em paralelo, com resposta NDJSON em streaming."""
+    try:
+        try:
+            batch = collect_batch_uploads(request.files)
+        except (BatchLimitExceeded, zipfile.BadZipFile) as e:
+            status = 413 if isinstance(e, BatchLimitExceeded) else 400
+            return jsonify({"status": "erro", "mensagem": str(e)}), status
+        if not len(batch):
+            batch.close()
+            return jsonify({"status": "erro", "mensagem": "Nenhuma imagem fornecida ('images' ou .zip)"}), 400
+
+        template_name = request.form.get('template', DEFAULT_TEMPLATE_NAME)
+        template_key = template_name.lower() if template_name and template_name.lower() in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
+        debug_mode = request.args.get('debug', 'false').lower() == 'true'
+
+        return Response(
+            stream_with_context(stream_batch_results(batch, template_key, debug=debug_mode,
+                                                     timings=timings_requested(),
+                                                     duplicates=None if debug_mode else request_duplicates())),
+            mimetype='application/x-ndjson',
+        )
+
+    except Exception as e:
+        logger.error(f"[Batch] Erro: {e}", exc_info=True)
+        return jsonify({"status": "erro", "mensagem": str(e)}), 500
+
+
+@app.route('/api/validation-jobs/<job_id>', methods=['GET'])
+def validation_job_status(job_id):
+    """Estado de um job de validação: queued, running, done (com result) ou error."""
+    job = validation_jobs().get(job_id)
+    if job is None:
+        return jsonify({"status": "erro", "mensagem": "Job de validação não encontrado"}), 404
+    return jsonify(job)
+
+
 @app.route('/api/validate-with-chatgpt', methods=['POST'])
 def validate_with_chatgpt():
     """Endpoint híbrido: OMR + ChatGPT."""
@@ -696,22 +2161,38 @@ def validate_with_chatgpt():
         if not openai_api_key:
             return jsonify({"status": "erro", "mensagem": "OPENAI_API_KEY não fornecida"}), 400
         
-        image_bytes = image_file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        image_array = np.array(image)
+        upload = open_upload(image_file)
         
         template_key = template_name.lower() if template_name and template_name.lower() in AVAILABLE_TEMPLATES else DEFAULT_TEMPLATE_NAME
-        omr_result = process_omr_page(image_array, 1, template_name=template_key, debug=False)
+        validation_mode = request.args.get('validation_mode', VALIDATION_MODE).lower()
+        result_key = page_cache_key(content_digest((upload.data,)), template_key)
+        omr_result = cached_page(result_key, 1)
+        reading = None
+        if omr_result is None or validation_mode in ("crops", "batch"):
+            image_array = decode_image_bytes(upload.data, template_key)
+            fresh, reading = read_omr_page(image_array, 1, template_name=template_key, debug=False,
+                                           buffers=request_buffers(),
+                                           coarse=False if validation_mode in ("crops", "batch") else None)
+            del image_array
+            count_pages([fresh], template_key)
+            if omr_result is None:
+                omr_result = fresh
+                store_page(result_key, omr_result)
         omr_answers = omr_result["resultado"]["questoes"]
         
         logger.info(f"[ChatGPT Endpoint] OMR: {len(omr_answers)} questões")
         
-        chatgpt_result = validate_with_chatgpt_internal(
-            image_bytes=image_bytes,
-            omr_result=omr_answers,
-            template_key=template_key,
-            openai_api_key=openai_api_key
-        )
+        if validation_mode in ("crops", "batch"):
+            mosaic, ambiguous = ambiguous_crops(reading, omr_answers)
+            chatgpt_result = validate_with_chatgpt_crops(mosaic, ambiguous, omr_answers,
+                                                         AVAILABLE_TEMPLATES[template_key]["options"], openai_api_key)
+        else:
+            chatgpt_result = validate_with_chatgpt_internal(
+                image_bytes=upload.data,
+                omr_result=omr_answers,
+                template_key=template_key,
+                openai_api_key=openai_api_key
+            )
         
         return jsonify({
             "status": "sucesso",
@@ -724,7 +2205,9 @@ def validate_with_chatgpt():
                 "total_questions": AVAILABLE_TEMPLATES[template_key]["total_questions"]
             },
             "template": template_key,
-            "model": "gpt-4o-mini"
+            "validation_mode": chatgpt_result.get("mode", "page"),
+            "model": "gpt-4o-mini",
+            **timing_blocks()
         })
         
     except Exception as e:
@@ -737,4 +2220,7 @@ if __name__ == '__main__':
     logger.info("🚀 Iniciando serviço OMR (OpenCV + ChatGPT)...")
     logger.info(f"📋 Templates: {list(AVAILABLE_TEMPLATES.keys())} | default={DEFAULT_TEMPLATE_NAME}")
     logger.info(f"🌐 Servidor: http://0.0.0.0:{port}")
+    preload_templates()
+    warm_up()
+    logger.info(f"⏱️ Inicialização: {_startup.summary()}")
     app.run(host='0.0.0.0', port=port, debug=False)
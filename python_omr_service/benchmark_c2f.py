@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Benchmark da leitura em dois níveis (coarse_to_fine.py) contra a calibração.
+
+Para cada folha do corpus de calibração (calibration_corpus.py:
+gabarito_pintado.png e OMR_CALIBRATION_CORPUS) e para folhas sintéticas com
+gabarito conhecido (digitalização típica de benchmark_omr.py), lê a página por:
+
+- fixed: alinhamento + preprocess_pil_image + detect_bubbles_fixed (referência)
+- full: alinhamento + preprocess_image + detect_sheet_integral (padrão do serviço)
+- c2f: registration_transform + read_coarse_to_fine
+
+e reporta o tempo por página (alinhamento incluído, decodificação não), a
+concordância de cada questão com o fixed (todas e só as marcadas no
+gabarito; nas em branco o fixed responde a bolha vazia mais escura, que é
+ruído), a acurácia contra o gabarito e quantas questões foram relidas no
+nível fino.
+
+Uso:
+    python benchmark_c2f.py                                   # benchmarks/c2f.json
+    python benchmark_c2f.py --templates enem90_v5 --sheets 20 --scales 1,1.5
+    OMR_C2F_MARGIN=0.15 python benchmark_c2f.py --output benchmarks/c2f_015.json
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from benchmark_omr import BENCHMARK_DIR, SCAN_OPTIONS, _floats, _stats, environment  # noqa: E402
+from buffer_pool import page_buffers  # noqa: E402
+from calibration_corpus import calibration_files  # noqa: E402
+from coarse_to_fine import C2F_FACTOR, C2F_MARGIN, read_coarse_to_fine  # noqa: E402
+from integral_detection import detect_sheet_integral  # noqa: E402
+from omr_result import NO_ANSWER  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet, score  # noqa: E402
+
+ENGINES = ("fixed", "full", "c2f")
+
+
+def read_fixed(image: np.ndarray, template: Dict) -> Tuple[Dict[str, str], int]:
+    working = image
+    if "registration_marks" in template:
+        working, _info = app.align_with_registration_marks(image, template)
+    bw = app.preprocess_pil_image(Image.fromarray(working))
+    answers, _ = app.detect_bubbles_fixed(bw, template)
+    return answers, 0
+
+
+def read_full(image: np.ndarray, template: Dict) -> Tuple[Dict[str, str], int]:
+    with page_buffers() as buffers:
+        working = image
+        if "registration_marks" in template:
+            working, _info = app.align_with_registration_marks(image, template, None, buffers)
+        bw = app.preprocess_image(working, buffers)
+        sheet, _ = detect_sheet_integral(bw, template, buffers=buffers)
+    return sheet.to_dict(), 0
+
+
+def read_c2f(image: np.ndarray, template: Dict) -> Tuple[Dict[str, str], int]:
+    with page_buffers() as buffers:
+        M = None
+        if "registration_marks" in template:
+            M, _info = app.registration_transform(image, template, None, buffers)
+        reading = read_coarse_to_fine(image, template, M, buffers)
+        if reading is None:
+            return read_full(image, template)
+        return reading.sheet.to_dict(), reading.refined
+
+
+READERS: Dict[str, Callable] = {"fixed": read_fixed, "full": read_full, "c2f": read_c2f}
+
+
+def calibration_sheets() -> List[Tuple[str, str, np.ndarray, Optional[Dict]]]:
+    """(nome, template, imagem, gabarito=None) das folhas reais de calibração."""
+    return [(name, template_key, np.array(Image.open(path)), None)
+            for name, path, template_key in calibration_files(app.DEFAULT_TEMPLATE_NAME)]
+
+
+def synthetic_sheets(templates: List[str], scales: List[float], count: int,
+                     rng: np.random.Generator) -> List[Tuple[str, str, np.ndarray, Optional[Dict]]]:
+    """Folhas sintéticas decodificadas como no serviço (JPEG/PNG → array), com o gabarito."""
+    sheets = []
+    for key in templates:
+        template = app.AVAILABLE_TEMPLATES[key]
+        for scale in scales:
+            options = SheetOptions(**{**SCAN_OPTIONS.__dict__, "scale": scale})
+            for i in range(count):
+                sheet = generate_sheet(template, rng, options)
+                image = app.decode_image_bytes(sheet.encode(), key)
+                sheets.append((f"sintetico_{key}_x{scale}_{i}", key, image, sheet.truth))
+    return sheets
+
+
+def bench_group(label: str, template_key: str, sheets: List[Tuple[str, str, np.ndarray, Optional[Dict]]],
+                repeats: int) -> Dict:
+    """Tempos, concordância com o fixed e acurácia de um grupo de folhas do mesmo template."""
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    for engine in ENGINES:
+        READERS[engine](sheets[0][2], template)     # aquecimento (templates compilados, pool)
+    samples: Dict[str, List[float]] = {engine: [] for engine in ENGINES}
+    agree = {engine: 0 for engine in ENGINES}
+    agree_marked = {engine: 0 for engine in ENGINES}
+    errors = {engine: 0 for engine in ENGINES}
+    questions = marked = refined = 0
+    for _name, _key, image, truth in sheets:
+        answers = {}
+        for engine in ENGINES:
+            elapsed = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                answers[engine], extra = READERS[engine](image, template)
+                elapsed.append((time.perf_counter() - start) * 1000)
+            samples[engine].append(min(elapsed))
+            if engine == "c2f":
+                refined += extra
+        reference = answers["fixed"]
+        expected = truth["questoes"] if truth else {}
+        questions += len(reference)
+        marked_questions = [q for q, a in expected.items() if a is not None and a != NO_ANSWER]
+        marked += len(marked_questions)
+        for engine in ENGINES:
+            agree[engine] += sum(answers[engine].get(q) == a for q, a in reference.items())
+            agree_marked[engine] += sum(answers[engine].get(q) == reference[q] for q in marked_questions)
+            if truth:
+                result = score(answers[engine], truth)
+                errors[engine] += result["errors"] - result["blank_errors"]
+
+    fixed_ms = _stats(samples["fixed"])["median_ms"]
+    result = {
+        "group": label,
+        "template": template_key,
+        "sheets": len(sheets),
+        "size": [int(sheets[0][2].shape[1]), int(sheets[0][2].shape[0])],
+        "engines": {},
+        "refined_per_sheet": round(refined / len(sheets), 2),
+    }
+    for engine in ENGINES:
+        stats = _stats(samples[engine])
+        result["engines"][engine] = {
+            **stats,
+            "speedup_vs_fixed": round(fixed_ms / stats["median_ms"], 2),
+            "agreement_with_fixed": round(agree[engine] / questions, 4),
+            "agreement_marked": round(agree_marked[engine] / marked, 4) if marked else None,
+            "accuracy": round(1.0 - errors[engine] / marked, 4) if marked else None,
+        }
+    return result
+
+
+def run(templates: List[str], scales: List[float], count: int, repeats: int, seed: int) -> Dict:
+    rng = np.random.default_rng(seed)
+    groups: Dict[Tuple[str, str], List] = {}
+    for sheet in calibration_sheets():
+        groups.setdefault(("calibracao", sheet[1]), []).append(sheet)
+    for sheet in synthetic_sheets(templates, scales, count, rng):
+        groups.setdefault((sheet[0].rsplit("_", 1)[0], sheet[1]), []).append(sheet)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "c2f": {"factor": C2F_FACTOR, "margin": C2F_MARGIN},
+        "options": SCAN_OPTIONS.__dict__,
+        "seed": seed,
+        "groups": [],
+    }
+    for (label, key), sheets in groups.items():
+        if key not in templates:
+            continue
+        result = bench_group(label, key, sheets, repeats)
+        report["groups"].append(result)
+        engines = "  ".join(f"{e} {result['engines'][e]['median_ms']:.1f} ms" for e in ENGINES)
+        c2f = result["engines"]["c2f"]
+        marked = c2f["agreement_marked"]
+        print(f"{label:<26} {key:<10} {engines}  c2f x{c2f['speedup_vs_fixed']:.1f}  "
+              f"concordância {c2f['agreement_with_fixed']:.4f}"
+              f"{'' if marked is None else f' (marcadas {marked:.4f})'}  "
+              f"relidas/folha {result['refined_per_sheet']}")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Leitura coarse-to-fine vs detect_bubbles_fixed")
+    parser.add_argument("--templates", default=",".join(k for k, t in app.AVAILABLE_TEMPLATES.items()
+                                                        if "registration_marks" in t),
+                        help="templates separados por vírgula (padrão: os com marcadores)")
+    parser.add_argument("--scales", type=_floats, default=[1.0], help="fatores sobre o tamanho de referência")
+    parser.add_argument("--sheets", type=int, default=10, help="folhas sintéticas por template e escala")
+    parser.add_argument("--repeats", type=int, default=1, help="leituras por folha e motor (vale a melhor)")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "c2f.json"))
+    args = parser.parse_args(argv)
+
+    templates = [t.strip().lower() for t in args.templates.split(",") if t.strip()]
+    unknown = [t for t in templates if t not in app.AVAILABLE_TEMPLATES]
+    if unknown:
+        parser.error(f"templates desconhecidos: {unknown}")
+
+    app.preload_templates()
+    report = run(templates, args.scales, args.sheets, args.repeats, args.seed)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultado: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Benchmark do pipeline OMR com folhas sintéticas (synthetic_sheets.py).
+
+Para cada template e resolução (fator sobre o tamanho de referência), gera
+folhas com gabarito conhecido e mede cada etapa de uma página:
+
+- decode: bytes PNG/JPEG → array (decode_image_bytes)
+- align: marcadores P1-P4 + warp (align_with_registration_marks)
+- preprocess: binarização (preprocess_image)
+- detect: leitura das bolhas (detect_sheet_integral)
+- encode: resposta JSON (page_result + json.dumps) e .npy (SheetAnswers.to_npy)
+
+e a vazão (páginas/s, decode incluído) do caminho de várias páginas
+(process_omr_pages) para cada tamanho de lote. Também reporta a acurácia
+contra o gabarito, para que otimizações não troquem velocidade por erro.
+
+O resultado vai para um JSON (--output); com --baseline, compara as medianas
+com um resultado anterior e sai com código 1 se alguma etapa piorar mais que
+--threshold.
+
+Uso:
+    python benchmark_omr.py                                   # benchmarks/latest.json
+    python benchmark_omr.py --templates enem90_v5 --scales 0.5,1 --batch-sizes 1,16
+    python benchmark_omr.py --output benchmarks/base.json
+    python benchmark_omr.py --baseline benchmarks/base.json --threshold 0.15
+    OMR_DECODE_ENGINE=gray python benchmark_omr.py --scales 1,2 --output benchmarks/gray.json
+    OMR_BUFFER_POOL=false python benchmark_omr.py --output benchmarks/no_pool.json
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from buffer_pool import page_buffers  # noqa: E402
+from integral_detection import detect_sheet_integral  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet, score  # noqa: E402
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+STAGES = ("decode", "align", "preprocess", "detect", "encode_json", "encode_npy", "total")
+
+# Digitalização típica: leve rotação, desfoque, ruído e JPEG
+SCAN_OPTIONS = SheetOptions(blank_rate=0.05, double_rate=0.02, rotation=0.6, blur=0.8, noise=6, jpeg_quality=75)
+
+
+def _timed(fn: Callable, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "median_ms": round(statistics.median(ordered), 3),
+        "p90_ms": round(ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))], 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
+
+
+def page_stages(data: bytes, template: Dict, template_key: str) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Tempo (ms) de cada etapa de uma página e as respostas lidas (buffers do pool, como no serviço)."""
+    times: Dict[str, float] = {}
+    image, times["decode"] = _timed(app.decode_image_bytes, data, template_key)
+    with page_buffers() as buffers:
+        if "registration_marks" in template:
+            (working, alignment), times["align"] = _timed(app.align_with_registration_marks, image, template,
+                                                          None, buffers)
+        else:
+            working, alignment, times["align"] = image, {"aligned": False}, 0.0
+        bw, times["preprocess"] = _timed(app.preprocess_image, working, buffers)
+        (sheet, _darkness), times["detect"] = _timed(detect_sheet_integral, bw, template, (0, 0),
+                                                      (bw.shape[1], bw.shape[0]), buffers)
+    start = time.perf_counter()
+    answers = sheet.to_dict()
+    json.dumps(app.page_result(1, template_key, alignment, answers, False))
+    times["encode_json"] = (time.perf_counter() - start) * 1000
+    _, times["encode_npy"] = _timed(sheet.to_npy)
+    times["total"] = sum(times.values())
+    return times, answers
+
+
+def bench_resolution(template_key: str, scale: float, sheets: int, rng: np.random.Generator,
+                     options: SheetOptions) -> Dict:
+    """Etapas por página + acurácia para um template numa resolução."""
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    opts = SheetOptions(**{**options.__dict__, "scale": scale})
+    generated = [generate_sheet(template, rng, opts) for _ in range(sheets)]
+    payloads = [sheet.encode() for sheet in generated]
+
+    page_stages(payloads[0], template, template_key)    # aquecimento (tamanho novo)
+    samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    marked_errors = blank_errors = marked = blanks = 0
+    for sheet, data in zip(generated, payloads):
+        times, answers = page_stages(data, template, template_key)
+        for stage in STAGES:
+            samples[stage].append(times[stage])
+        result = score(answers, sheet.truth)
+        blanks += result["blank_questions"]
+        blank_errors += result["blank_errors"]
+        marked += result["questions"] - result["blank_questions"]
+        marked_errors += result["errors"] - result["blank_errors"]
+
+    height, width = generated[0].image.shape[:2]
+    return {
+        "template": template_key,
+        "scale": scale,
+        "size": [width, height],
+        "bytes": int(statistics.median(len(p) for p in payloads)),
+        "sheets": sheets,
+        "stages": {stage: _stats(values) for stage, values in samples.items()},
+        "accuracy": round(1.0 - marked_errors / marked, 4) if marked else 1.0,
+        "blank_accuracy": round(1.0 - blank_errors / blanks, 4) if blanks else 1.0,
+    }
+
+
+def bench_batches(template_key: str, batch_sizes: List[int], rng: np.random.Generator,
+                  options: SheetOptions, repeats: int) -> List[Dict]:
+    """Vazão do caminho de várias páginas (decode + process_omr_pages) por tamanho de lote."""
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    pool = [generate_sheet(template, rng, options).encode() for _ in range(max(batch_sizes))]
+    results = []
+    for size in batch_sizes:
+        payloads = pool[:size]
+        app.process_omr_pages([(1, app.decode_image_bytes(payloads[0], template_key))], template_key)
+        elapsed = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            pages = [(n, app.decode_image_bytes(data, template_key)) for n, data in enumerate(payloads, start=1)]
+            app.process_omr_pages(pages, template_key)
+            elapsed.append(time.perf_counter() - start)
+        best = min(elapsed)
+        results.append({
+            "template": template_key,
+            "batch_size": size,
+            "pages_per_second": round(size / best, 2),
+            "ms_per_page": round(best * 1000 / size, 3),
+        })
+    return results
+
+
+def environment() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpus": os.cpu_count(),
+        "machine": platform.machine(),
+        "detection_engine": app.DETECTION_ENGINE,
+        "preprocess_engine": app.PREPROCESS_ENGINE,
+        "decode_engine": app.DECODE_ENGINE,
+        "buffer_pool": app.buffer_pool_info()["enabled"],
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Etapas cuja mediana piorou mais que `threshold` (fração) em relação ao baseline."""
+    regressions = []
+    previous = {(r["template"], r["scale"]): r for r in baseline.get("resolutions", [])}
+    for result in current["resolutions"]:
+        old = previous.get((result["template"], result["scale"]))
+        if old is None:
+            continue
+        for stage, stats in result["stages"].items():
+            before = old["stages"].get(stage, {}).get("median_ms")
+            if before and stats["median_ms"] > before * (1 + threshold) and stats["median_ms"] - before > 0.05:
+                regressions.append(f"{result['template']} x{result['scale']} {stage}: "
+                                   f"{before:.2f} → {stats['median_ms']:.2f} ms")
+        if result["accuracy"] < old["accuracy"]:
+            regressions.append(f"{result['template']} x{result['scale']} acurácia: "
+                               f"{old['accuracy']:.4f} → {result['accuracy']:.4f}")
+    batches = {(r["template"], r["batch_size"]): r for r in baseline.get("batches", [])}
+    for result in current["batches"]:
+        old = batches.get((result["template"], result["batch_size"]))
+        if old and result["pages_per_second"] < old["pages_per_second"] / (1 + threshold):
+            regressions.append(f"{result['template']} lote {result['batch_size']}: "
+                               f"{old['pages_per_second']:.1f} → {result['pages_per_second']:.1f} páginas/s")
+    return regressions
+
+
+def run(templates: List[str], scales: List[float], batch_sizes: List[int], sheets: int,
+        repeats: int, seed: int, options: SheetOptions) -> Dict:
+    rng = np.random.default_rng(seed)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "options": options.__dict__,
+        "seed": seed,
+        "resolutions": [],
+        "batches": [],
+    }
+    for key in templates:
+        for scale in scales:
+            result = bench_resolution(key, scale, sheets, rng, options)
+            report["resolutions"].append(result)
+            stages = "  ".join(f"{s} {result['stages'][s]['median_ms']:.2f}" for s in STAGES)
+            print(f"{key:<10} x{scale:<5} {result['size'][0]}x{result['size'][1]:<5} {stages}  "
+                  f"acurácia {result['accuracy']:.4f}")
+        for result in bench_batches(key, batch_sizes, rng, options, repeats):
+            report["batches"].append(result)
+            print(f"{key:<10} lote {result['batch_size']:<4} {result['pages_per_second']:.1f} páginas/s "
+                  f"({result['ms_per_page']:.2f} ms/página)")
+    return report
+
+
+def _floats(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v]
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline OMR com folhas sintéticas")
+    parser.add_argument("--templates", default=",".join(app.AVAILABLE_TEMPLATES),
+                        help="templates separados por vírgula (padrão: todos)")
+    parser.add_argument("--scales", type=_floats, default=[0.75, 1.0, 1.25],
+                        help="fatores sobre o tamanho de referência")
+    parser.add_argument("--batch-sizes", type=_ints, default=[1, 8, 32])
+    parser.add_argument("--sheets", type=int, default=10, help="folhas por resolução")
+    parser.add_argument("--repeats", type=int, default=3, help="repetições por tamanho de lote (vale a melhor)")
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--clean", action="store_true", help="folhas sem distorções (só marcações)")
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_DIR, "latest.json"))
+    parser.add_argument("--baseline", help="resultado anterior para comparação")
+    parser.add_argument("--threshold", type=float, default=0.10, help="piora tolerada (fração da mediana)")
+    args = parser.parse_args(argv)
+
+    templates = [t.strip().lower() for t in args.templates.split(",") if t.strip()]
+    unknown = [t for t in templates if t not in app.AVAILABLE_TEMPLATES]
+    if unknown:
+        parser.error(f"templates desconhecidos: {unknown}")
+
+    app.preload_templates()
+    options = SheetOptions() if args.clean else SCAN_OPTIONS
+    report = run(templates, args.scales, args.batch_sizes, args.sheets, args.repeats, args.seed, options)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Resultado: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            return 1
+        print(f"✅ Sem regressões acima de {args.threshold:.0%} em relação a {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
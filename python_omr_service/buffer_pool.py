@@ -0,0 +1,163 @@
+"""
+Pool de buffers reutilizáveis do caminho quente (uma página = vários arrays
+do tamanho da página).
+
+Cada página alocava de novo o cinza e o binário de Otsu do alinhamento, a
+saída do warpPerspective, o cinza do pré-processamento, a imagem binarizada,
+a integral da ROI de bolhas e, no debug, a cópia BGR. Arrays grandes vêm de
+mmap/munmap do malloc: cada página paga page faults e zera memória de novo,
+e o RSS oscila com o tráfego. Aqui as etapas escrevem (dst=/out=) em arrays
+tirados de um pool por (shape, dtype):
+
+    with page_buffers() as buffers:
+        gray = buffers.take((h, w))
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=gray)
+        ...
+    # na saída, tudo o que foi tomado volta ao pool
+
+Quem toma um buffer é dono dele até o fim do escopo (BufferLease): nada que
+saia do escopo pode apontar para esses arrays (PageReading e respostas de
+debug ficam dentro dele; o resultado JSON não guarda arrays).
+
+Um pool por processo (worker do gunicorn ou do pool do lote), com lock:
+são poucas operações por página, e threads por requisição (servidor de
+desenvolvimento) reaproveitam os mesmos buffers. Os buffers livres são
+limitados a OMR_BUFFER_POOL_MB; acima disso, saem primeiro os tamanhos usados
+há mais tempo (fotos de celular de tamanhos variados não acumulam). Com
+OMR_BUFFER_POOL=false, take() é só np.empty.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+
+import numpy as np
+
+BUFFER_POOL_ENABLED = os.getenv("OMR_BUFFER_POOL", "true").lower() == "true"
+BUFFER_POOL_MAX_BYTES = int(os.getenv("OMR_BUFFER_POOL_MB", "256")) * 1024 * 1024
+
+Key = Tuple[Tuple[int, ...], str]
+
+
+class BufferPool:
+    """Arrays livres por (shape, dtype), com limite de bytes guardados."""
+
+    def __init__(self, max_bytes: int = BUFFER_POOL_MAX_BYTES, enabled: bool = BUFFER_POOL_ENABLED):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._free: "OrderedDict[Key, List[np.ndarray]]" = OrderedDict()
+        self.free_bytes = 0
+        self.allocations = 0
+        self.reuses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    def take(self, shape: Sequence[int], dtype=np.uint8) -> np.ndarray:
+        """Array (conteúdo indefinido, como np.empty) de shape/dtype."""
+        shape = tuple(int(n) for n in shape)
+        dtype = np.dtype(dtype)
+        key = (shape, dtype.str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                array = free.pop()
+                self.free_bytes -= array.nbytes
+                self.reuses += 1
+                return array
+            self.allocations += 1
+        return np.empty(shape, dtype=dtype)
+
+    def give(self, array: np.ndarray) -> None:
+        """Devolve um array tomado com take(); ninguém mais pode usá-lo."""
+        if not self.enabled or array.nbytes > self.max_bytes:
+            return
+        key = (array.shape, array.dtype.str)
+        with self._lock:
+            self._free.setdefault(key, []).append(array)
+            self._free.move_to_end(key)
+            self.free_bytes += array.nbytes
+            while self.free_bytes > self.max_bytes:
+                oldest, arrays = next(iter(self._free.items()))
+                evicted = arrays.pop(0)
+                self.free_bytes -= evicted.nbytes
+                self.evictions += 1
+                if not arrays:
+                    del self._free[oldest]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._free.clear()
+            self.free_bytes = 0
+
+    def info(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "allocations": self.allocations,
+            "reuses": self.reuses,
+            "evictions": self.evictions,
+            "free_bytes": self.free_bytes,
+            "free_buffers": sum(len(arrays) for arrays in self._free.values()),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class BufferLease:
+    """Buffers tomados num escopo (uma página, um lote, uma requisição); release() devolve todos."""
+
+    __slots__ = ("pool", "arrays")
+
+    def __init__(self, pool: BufferPool):
+        self.pool = pool
+        self.arrays: List[np.ndarray] = []
+
+    def take(self, shape: Sequence[int], dtype=np.uint8) -> np.ndarray:
+        array = self.pool.take(shape, dtype)
+        self.arrays.append(array)
+        return array
+
+    def transfer(self, array: np.ndarray, other: "BufferLease") -> None:
+        """Passa um array deste escopo para outro (que vive mais); no-op se ele não for daqui."""
+        for i, owned in enumerate(self.arrays):
+            if owned is array:
+                other.arrays.append(self.arrays.pop(i))
+                return
+
+    def release(self) -> None:
+        arrays, self.arrays = self.arrays, []
+        for array in arrays:
+            self.pool.give(array)
+
+    def __enter__(self) -> "BufferLease":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+def take(buffers: Optional[BufferLease], shape: Sequence[int], dtype=np.uint8) -> np.ndarray:
+    """buffers.take(...) ou, sem escopo, np.empty."""
+    if buffers is None:
+        return np.empty(tuple(shape), dtype=dtype)
+    return buffers.take(shape, dtype)
+
+
+_buffer_pool: Optional[BufferPool] = None
+_buffer_pool_lock = Lock()
+
+
+def buffer_pool() -> BufferPool:
+    """Pool do processo."""
+    global _buffer_pool
+    with _buffer_pool_lock:
+        if _buffer_pool is None:
+            _buffer_pool = BufferPool()
+        return _buffer_pool
+
+
+def page_buffers() -> BufferLease:
+    """Escopo de buffers no pool do processo."""
+    return BufferLease(buffer_pool())
+
+
+def buffer_pool_info() -> Dict:
+    return buffer_pool().info()
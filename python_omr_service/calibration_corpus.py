@@ -0,0 +1,88 @@
+"""
+Corpus de calibração compartilhado por test_equivalence.py e benchmark_c2f.py.
+
+PNG/JPG de attached_assets (e PDFs, se pdf2image + poppler estiverem
+instalados) mais os caminhos extras de OMR_CALIBRATION_CORPUS (arquivos ou
+diretórios separados por ':'). As folhas reais de calibração são as de
+CALIBRATION_SHEETS (com o template delas) e todas as imagens de
+OMR_CALIBRATION_CORPUS (com o template padrão de quem chama).
+
+    for name, path, template_key in calibration_files(DEFAULT_TEMPLATE_NAME):
+        ...
+    for name, image in corpus_images():     # todas as imagens, páginas de PDF incluídas
+        ...
+"""
+from typing import List, Set, Tuple
+import glob
+import logging
+import os
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "attached_assets")
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+
+# Folhas reais de calibração e seus templates (imagens de OMR_CALIBRATION_CORPUS usam o padrão)
+CALIBRATION_SHEETS = {
+    "gabarito_pintado.png": "enem90_v5",
+}
+
+
+def corpus_paths() -> List[str]:
+    """Imagens e PDFs de attached_assets e de OMR_CALIBRATION_CORPUS, em ordem alfabética por diretório."""
+    dirs = [ASSETS_DIR] + [p for p in os.getenv("OMR_CALIBRATION_CORPUS", "").split(":") if p]
+    paths = []
+    for d in dirs:
+        if os.path.isfile(d):
+            paths.append(d)
+            continue
+        for pattern in IMAGE_PATTERNS + ("*.pdf",):
+            paths.extend(sorted(glob.glob(os.path.join(d, pattern))))
+    return paths
+
+
+def extra_corpus_names() -> Set[str]:
+    """Nomes dos arquivos que vêm de OMR_CALIBRATION_CORPUS (fora de attached_assets)."""
+    names = set()
+    for path in corpus_paths():
+        if not os.path.abspath(path).startswith(os.path.abspath(ASSETS_DIR)):
+            names.add(os.path.basename(path))
+    return names
+
+
+def sheet_template(name: str, default_template: str) -> str:
+    """Template de uma folha real de calibração (CALIBRATION_SHEETS ou o padrão)."""
+    return CALIBRATION_SHEETS.get(name, default_template)
+
+
+def calibration_files(default_template: str) -> List[Tuple[str, str, str]]:
+    """(nome, caminho, template) das imagens reais de calibração (sem PDFs)."""
+    extra = extra_corpus_names()
+    files = []
+    for path in corpus_paths():
+        name = os.path.basename(path)
+        if path.lower().endswith(".pdf") or (name not in CALIBRATION_SHEETS and name not in extra):
+            continue
+        files.append((name, path, sheet_template(name, default_template)))
+    return files
+
+
+def corpus_images(pdf_dpi: int = 150) -> List[Tuple[str, np.ndarray]]:
+    """[(nome, np.ndarray)] de todo o corpus; página de PDF vira "<pdf>#p<n>"."""
+    corpus = []
+    for path in corpus_paths():
+        name = os.path.basename(path)
+        if path.lower().endswith(".pdf"):
+            try:
+                from pdf2image import convert_from_path
+                pages = convert_from_path(path, dpi=pdf_dpi)
+            except Exception as e:
+                logger.warning(f"PDF ignorado ({name}): {e}")
+                continue
+            corpus.extend((f"{name}#p{i}", np.array(p)) for i, p in enumerate(pages, start=1))
+        else:
+            corpus.append((name, np.array(Image.open(path))))
+    return corpus
@@ -0,0 +1,176 @@
+"""
+Leitura das bolhas em dois níveis (coarse-to-fine).
+
+O pipeline completo gera a página alinhada inteira, reduz para até 3000px
+com Lanczos (Pillow), binariza e só então lê as bolhas. Quase todas as
+questões têm uma bolha muito mais escura que as outras e seriam decididas
+numa imagem bem menor. Aqui:
+
+- nível grosso: a mesma homografia P1-P4, composta com a escala, gera direto
+  a página em 1/k da grade de leitura (k até OMR_C2F_FACTOR, limitado para a
+  bolha ter pelo menos C2F_MIN_RADIUS px); cinza, autocontraste + threshold
+  (LUT do histograma dessa página) e leitura de todas as bolhas pela
+  integral, como no motor integral;
+- decisão: a questão fica decidida no nível grosso se a bolha mais escura
+  tem pelo menos OMR_C2F_MARGIN a mais de tinta que a segunda e a escada de
+  thresholds dá a mesma decisão com um erro de até metade disso por bolha;
+- nível fino: as demais (margem pequena, em branco, duas marcações) são
+  relidas num recorte da linha na grade de leitura, gerado como no pipeline
+  ROI (warp só do recorte + Lanczos com box), com o LUT do nível grosso.
+
+As questões relidas têm a escuridão do pipeline completo, a menos do LUT: o
+histograma do autocontraste vem da página no nível grosso (amostras
+bilineares da mesma página), não da página reduzida inteira. As decididas no
+nível grosso guardam a escuridão dele (a tinta no .npy é uma estimativa).
+benchmark_c2f.py mede a concordância com detect_bubbles_fixed e o ganho.
+"""
+from typing import Dict, Optional, Tuple
+import math
+import os
+
+import cv2
+import numpy as np
+
+from buffer_pool import BufferLease, take
+from compiled_template import CompiledTemplate, get_compiled_template
+from fast_preprocess import binarize_lut, gray_histogram, target_size
+from integral_detection import bubble_darkness, decide_answers
+from omr_result import SheetAnswers
+from roi_pipeline import LANCZOS_SUPPORT, resample_roi, warp_roi
+from validation_crops import row_margins
+
+COARSE_TO_FINE = os.getenv("OMR_COARSE_TO_FINE", "false").lower() == "true"
+C2F_FACTOR = int(os.getenv("OMR_C2F_FACTOR", "4"))
+# Margem 1ª-2ª (fração de tinta) para decidir no nível grosso
+C2F_MARGIN = float(os.getenv("OMR_C2F_MARGIN", "0.25"))
+
+# Raio mínimo da bolha no nível grosso (px): abaixo disso o compilado usa 4 e lê papel em volta
+C2F_MIN_RADIUS = 4
+
+
+class CoarseToFineReading:
+    """Resultado da leitura em dois níveis: respostas, escuridão [Q, O] e questões relidas."""
+
+    __slots__ = ("sheet", "darkness", "factor", "refined")
+
+    def __init__(self, sheet: SheetAnswers, darkness: np.ndarray, factor: int, refined: int):
+        self.sheet = sheet
+        self.darkness = darkness
+        self.factor = factor
+        self.refined = refined
+
+
+def reading_grid(page_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Tamanho (width, height) em que o pipeline completo lê as bolhas de uma página page_size."""
+    return target_size(*page_size) or page_size
+
+
+def coarse_factor(compiled: CompiledTemplate) -> int:
+    """Fator k do nível grosso para a grade de leitura de `compiled` (1 = não compensa)."""
+    return max(1, min(C2F_FACTOR, compiled.radius // C2F_MIN_RADIUS))
+
+
+def _scale_matrix(page_size: Tuple[int, int], size: Tuple[int, int]) -> np.ndarray:
+    """Página page_size → size, com os centros dos pixels alinhados (amostra o meio de cada bloco)."""
+    sx, sy = size[0] / page_size[0], size[1] / page_size[1]
+    return np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]], dtype=np.float64)
+
+
+def _gray(image: np.ndarray, buffers: Optional[BufferLease]) -> np.ndarray:
+    if image.ndim == 2:
+        return image
+    code = cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(image, code, dst=take(buffers, image.shape[:2]))
+
+
+def settled_rows(darkness: np.ndarray, compiled: CompiledTemplate, margin: float = C2F_MARGIN) -> np.ndarray:
+    """
+    Questões [Q] decididas no nível grosso: margem 1ª-2ª de pelo menos `margin`
+    e mesma decisão da escada de thresholds com erro de até margin/2 de tinta
+    em cada bolha (a escuridão é 1 - (1 - tinta) / 255).
+    """
+    margins = row_margins(darkness)
+    error = margin / 2 / 255.0
+    first = darkness.max(axis=-1)
+    lead = margins / 255.0
+    low = first - error > compiled.thresholds_for(lead - 2 * error)
+    high = first + error > compiled.thresholds_for(lead + 2 * error)
+    return (margins >= margin) & (low == high)
+
+
+def _source_span(start: int, stop: int, size: int, grid: int) -> Tuple[int, int]:
+    """Pixels da página (tamanho size) que o Lanczos usa para gerar [start, stop) da grade `grid`."""
+    if size == grid:
+        return start, stop
+    scale = size / grid
+    margin = LANCZOS_SUPPORT + 1.5
+    return max(0, math.floor((start - margin) * scale)), min(size, math.ceil((stop + margin) * scale))
+
+
+def _refine_row(image: np.ndarray, M: Optional[np.ndarray], page_size: Tuple[int, int],
+                compiled: CompiledTemplate, row: int, lut: np.ndarray,
+                buffers: Optional[BufferLease]) -> Optional[np.ndarray]:
+    """Escuridão [O] de uma questão na grade de leitura (None se o recorte não cobrir as bolhas)."""
+    valid = compiled.areas[row] > 0
+    if not valid.any():
+        return None
+    y1, y2, x1, x2 = (compiled.bounds[row, valid, i] for i in range(4))
+    gy0, gy1, gx0, gx1 = int(y1.min()), int(y2.max()), int(x1.min()), int(x2.max())
+    width, height = page_size
+    sx0, sx1 = _source_span(gx0, gx1, width, compiled.width)
+    sy0, sy1 = _source_span(gy0, gy1, height, compiled.height)
+    box = (sx0, sy0, sx1, sy1)
+    crop = image[sy0:sy1, sx0:sx1] if M is None else warp_roi(image, M, box, buffers)
+    gray, (oy, ox), grid = resample_roi(crop, page_size, box, buffers)
+    if grid != (compiled.width, compiled.height):
+        return None
+    if oy > gy0 or ox > gx0 or oy + gray.shape[0] < gy1 or ox + gray.shape[1] < gx1:
+        return None
+    bw = cv2.LUT(gray, lut, dst=take(buffers, gray.shape))
+    darkness = np.zeros(compiled.areas.shape[1], dtype=np.float64)
+    for opt in np.flatnonzero(valid).tolist():
+        by1, by2, bx1, bx2 = compiled.bounds[row, opt].tolist()
+        area = int(compiled.areas[row, opt])
+        # Mesma conta de _darkness_from_corners: soma inteira exata / área / 255.0
+        white = int(bw[by1 - oy:by2 - oy, bx1 - ox:bx2 - ox].sum(dtype=np.int64))
+        darkness[opt] = (area * 255 - white) / area / 255.0
+    return darkness
+
+
+def read_coarse_to_fine(image: np.ndarray, template: Dict, M: Optional[np.ndarray] = None,
+                        buffers: Optional[BufferLease] = None) -> Optional[CoarseToFineReading]:
+    """
+    Lê as bolhas de `image` em dois níveis. M: homografia P1-P4 para a página
+    de referência (None = a própria imagem é a página, sem alinhamento).
+    None se o template for pequeno demais para um nível grosso (k < 2): usar
+    o pipeline completo.
+    """
+    if M is None:
+        page_size = (image.shape[1], image.shape[0])
+        to_page = np.eye(3)
+    else:
+        page_size = (template["reference_size"]["width"], template["reference_size"]["height"])
+        to_page = M
+    compiled = get_compiled_template(template, *reading_grid(page_size))
+    k = coarse_factor(compiled)
+    if k < 2:
+        return None
+
+    coarse_size = (compiled.width // k, compiled.height // k)
+    dst = take(buffers, (coarse_size[1], coarse_size[0]) + image.shape[2:], image.dtype)
+    coarse = cv2.warpPerspective(image, _scale_matrix(page_size, coarse_size) @ to_page, coarse_size, dst=dst)
+    gray = _gray(coarse, buffers)
+    lut = binarize_lut(gray_histogram(gray))
+    bw = cv2.LUT(gray, lut, dst=take(buffers, gray.shape))
+    coarse_compiled = get_compiled_template(template, *coarse_size)
+    darkness = bubble_darkness(bw, coarse_compiled, buffers=buffers)
+
+    refined = 0
+    for row in np.flatnonzero(~settled_rows(darkness, coarse_compiled)).tolist():
+        fine = _refine_row(image, M, page_size, compiled, row, lut, buffers)
+        if fine is not None:
+            darkness[row] = fine
+            refined += 1
+    marked_idx, is_marked = decide_answers(darkness, compiled)
+    return CoarseToFineReading(SheetAnswers.from_detection(compiled, darkness, marked_idx, is_marked),
+                               darkness, k, refined)
@@ -0,0 +1,176 @@
+"""
+Templates compilados: geometria do gabarito já escalada para um tamanho de imagem.
+
+Os templates em AVAILABLE_TEMPLATES são dicts em coordenadas de referência.
+compile_template converte um template para (width, height) em arrays NumPy
+(centros, cantos das bolhas, ROI, alternativas, escada de thresholds,
+marcadores esperados) e get_compiled_template memoiza o resultado numa LRU
+limitada por (nome do template, width, height). Um lote do scanner com tamanho
+fixo paga o layout uma vez só.
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+import os
+
+import numpy as np
+
+# Escada de thresholds de detect_bubbles_fixed: (margem mínima 1ª-2ª, threshold)
+THRESHOLD_LADDER = ((0.2, 0.2), (0.1, 0.3))
+LADDER_FALLBACK_THRESHOLD = 0.4
+SINGLE_OPTION_THRESHOLD = 0.3
+NORMALIZED_TEMPLATE_THRESHOLD = 0.6
+
+TEMPLATE_CACHE_SIZE = int(os.getenv("OMR_TEMPLATE_CACHE_SIZE", "32"))
+
+
+class CompiledTemplate:
+    """Geometria de um template para uma resolução específica."""
+
+    __slots__ = (
+        "name", "template", "width", "height", "scale_x", "scale_y", "total_questions",
+        "question_ids", "question_keys", "options", "option_labels",
+        "radius", "centers", "bounds", "areas", "roi", "corners",
+        "ladder_margins", "ladder_thresholds",
+        "mark_names", "expected_marks", "mark_margin",
+    )
+
+    def __init__(self, name: str, template: Dict, width: int, height: int):
+        self.name = name
+        self.template = template
+        self.width = width
+        self.height = height
+        self.total_questions = template.get("total_questions", 0)
+        self.options: List[str] = list(template["options"])
+
+        if "questions" in template:
+            ref_w = template["reference_size"]["width"]
+            ref_h = template["reference_size"]["height"]
+            self.scale_x = width / ref_w
+            self.scale_y = height / ref_h
+            self.radius = max(4, int(template.get("bubble_radius", 19) * max(self.scale_x, self.scale_y)))
+            questions = template["questions"]
+            ids = [q["id"] for q in questions]
+            cx = np.array([[int(x * self.scale_x) for x in q["x_positions"]] for q in questions], dtype=np.int64)
+            cy = np.array([int(q["y"] * self.scale_y) for q in questions], dtype=np.int64)
+            if len(self.options) >= 2:
+                margins = [m for m, _ in THRESHOLD_LADDER]
+                thresholds = [t for _, t in THRESHOLD_LADDER] + [LADDER_FALLBACK_THRESHOLD]
+            else:
+                margins, thresholds = [], [SINGLE_OPTION_THRESHOLD]
+        else:
+            # Template 45 questões (normalizado)
+            self.scale_x = 1.0
+            self.scale_y = 1.0
+            self.radius = max(4, int(width * 0.006))
+            question_y = template["question_y"][:self.total_questions]
+            ids = list(range(1, len(question_y) + 1))
+            row_x = [int(width * x_norm) for x_norm in template["option_x"]]
+            cx = np.array([row_x for _ in question_y], dtype=np.int64)
+            cy = np.array([int(height * y_norm) for y_norm in question_y], dtype=np.int64)
+            margins, thresholds = [], [NORMALIZED_TEMPLATE_THRESHOLD]
+        cx = cx.reshape(len(ids), -1)
+
+        self.question_ids = np.array(ids, dtype=np.int64)
+        self.question_keys = [str(q_id) for q_id in ids]
+        self.option_labels = np.array(self.options)
+        self.centers = np.stack([cx, np.broadcast_to(cy[:, None], cx.shape)], axis=-1)
+        self.ladder_margins = np.array(margins, dtype=np.float64)
+        self.ladder_thresholds = np.array(thresholds, dtype=np.float64)
+
+        # Cantos (y1, y2, x1, x2) com o mesmo recorte de read_region
+        r = self.radius
+        cy_grid = self.centers[..., 1]
+        y1 = np.clip(cy_grid - r, 0, height)
+        y2 = np.maximum(np.clip(cy_grid + r, 0, height), y1)
+        x1 = np.clip(cx - r, 0, width)
+        x2 = np.maximum(np.clip(cx + r, 0, width), x1)
+        self.bounds = np.stack([y1, y2, x1, x2], axis=-1)
+        self.areas = (y2 - y1) * (x2 - x1)
+
+        # ROI = caixa que envolve todas as bolhas; cantos relativos à integral da ROI
+        valid = self.areas > 0
+        if valid.any():
+            self.roi = np.array([y1[valid].min(), y2[valid].max(), x1[valid].min(), x2[valid].max()], dtype=np.int64)
+        else:
+            self.roi = np.zeros(4, dtype=np.int64)
+        roi_h = int(self.roi[1] - self.roi[0])
+        roi_w = int(self.roi[3] - self.roi[2])
+        self.corners = (
+            np.clip(y1 - self.roi[0], 0, roi_h),
+            np.clip(y2 - self.roi[0], 0, roi_h),
+            np.clip(x1 - self.roi[2], 0, roi_w),
+            np.clip(x2 - self.roi[2], 0, roi_w),
+        )
+
+        # Marcadores de registro esperados (find_registration_marks)
+        marks = template.get("registration_marks")
+        if marks and "reference_size" in template:
+            mark_sx = width / template["reference_size"]["width"]
+            mark_sy = height / template["reference_size"]["height"]
+            self.mark_names = list(marks.keys())
+            self.expected_marks = np.array(
+                [(int(v[0] * mark_sx), int(v[1] * mark_sy)) for v in marks.values()], dtype=np.int64
+            )
+            self.mark_margin = int(30 * max(mark_sx, mark_sy))
+        else:
+            self.mark_names = []
+            self.expected_marks = np.zeros((0, 2), dtype=np.int64)
+            self.mark_margin = 0
+
+    @property
+    def roi_slices(self) -> Tuple[slice, slice]:
+        """Fatias (linhas, colunas) da ROI de bolhas na imagem."""
+        return slice(int(self.roi[0]), int(self.roi[1])), slice(int(self.roi[2]), int(self.roi[3]))
+
+    def thresholds_for(self, margins: np.ndarray) -> np.ndarray:
+        """Aplica a escada de thresholds a margens 1ª-2ª (qualquer shape)."""
+        if not self.ladder_margins.size:
+            return np.full(np.shape(margins), self.ladder_thresholds[0])
+        step = (np.asarray(margins)[..., None] <= self.ladder_margins).sum(axis=-1)
+        return self.ladder_thresholds[step]
+
+
+_cache: "OrderedDict[Tuple[str, int, int], CompiledTemplate]" = OrderedDict()
+_cache_lock = Lock()
+
+
+def template_name(template: Dict) -> str:
+    """Nome usado como chave do cache (fallback: id do dict)."""
+    return template.get("name") or f"template_{id(template)}"
+
+
+def get_compiled_template(template: Dict, width: int, height: int) -> CompiledTemplate:
+    """Retorna o template compilado para (nome, width, height), memoizado em LRU."""
+    key = (template_name(template), int(width), int(height))
+    with _cache_lock:
+        compiled = _cache.get(key)
+        # Template recarregado com o mesmo nome: recompila
+        if compiled is not None and compiled.template is template:
+            _cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledTemplate(key[0], template, key[1], key[2])
+    with _cache_lock:
+        _cache[key] = compiled
+        _cache.move_to_end(key)
+        while len(_cache) > TEMPLATE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def clear_template_cache(name: Optional[str] = None) -> None:
+    """Invalida o cache (todo, ou só as entradas de um template)."""
+    with _cache_lock:
+        if name is None:
+            _cache.clear()
+            return
+        for key in [k for k in _cache if k[0] == name]:
+            del _cache[key]
+
+
+def template_cache_info() -> Dict:
+    """Estado do cache para /health."""
+    with _cache_lock:
+        return {"size": len(_cache), "max_size": TEMPLATE_CACHE_SIZE,
+                "entries": [f"{n}@{w}x{h}" for n, w, h in _cache]}
@@ -0,0 +1,136 @@
+"""
+Pré-processamento OMR com primitivas NumPy/OpenCV.
+
+Saída bit a bit idêntica a preprocess_pil_image (app.py, "NÃO ALTERAR"):
+array uint8 com 0 (preto) e 1 (branco), como np.array de uma imagem modo '1'.
+
+- Redimensionamento > 3000px e conversão RGB→L continuam no Pillow: o Lanczos
+  com antialias e o arredondamento L24 do Pillow não têm equivalente exato no
+  cv2 (cv2.cvtColor diverge em ~0,1% dos pixels). Imagens já em cinza (2D, ou
+  RGB com R == G == B) não passam pelo Pillow, e se precisarem de resize ele é
+  feito em 1 canal (mesmo resultado, 1/3 do custo).
+- Autocontraste (cutoff=2%) e threshold < 100 viram um único LUT de 256
+  entradas aplicado com cv2.LUT, direto em uint8 0/1 (sem modo '1').
+- Com buffers (buffer_pool.BufferLease), o cinza e a imagem binarizada são
+  escritos em arrays do pool em vez de alocados a cada página.
+
+A equivalência é verificada por test_equivalence.py no corpus de calibração.
+"""
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from buffer_pool import BufferLease, take
+from image_decode import pil_to_array
+
+# MANTIDOS IGUAIS A preprocess_pil_image - NÃO ALTERAR (afeta calibração)
+MAX_SIZE = 3000
+AUTOCONTRAST_CUTOFF = 2
+BW_THRESHOLD = 100
+
+# cv2.calcHist conta em float32: exato até 2^24 pixels por bin
+_CALCHIST_EXACT_LIMIT = 1 << 24
+
+
+def target_size(width: int, height: int) -> Optional[Tuple[int, int]]:
+    """Tamanho após a redução de preprocess_pil_image, ou None se não reduz."""
+    if max(width, height) <= MAX_SIZE:
+        return None
+    ratio = MAX_SIZE / max(width, height)
+    return int(width * ratio), int(height * ratio)
+
+
+def _is_gray_rgb(image: np.ndarray) -> bool:
+    """True se R == G == B em todos os pixels (amostra de linhas antes da checagem completa)."""
+    sample = image[::64]
+    if not (np.array_equal(sample[..., 0], sample[..., 1]) and np.array_equal(sample[..., 0], sample[..., 2])):
+        return False
+    return np.array_equal(image[..., 0], image[..., 1]) and np.array_equal(image[..., 0], image[..., 2])
+
+
+def to_gray(image: np.ndarray, buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """Equivalente a np.asarray(Image.fromarray(image).resize(...).convert("L"))."""
+    height, width = image.shape[:2]
+    return resize_to_gray(image, target_size(width, height), buffers=buffers)
+
+
+def _pil_gray(pil_img: Image.Image, buffers: Optional[BufferLease]) -> np.ndarray:
+    width, height = pil_img.size
+    return pil_to_array(pil_img, take(buffers, (height, width)))
+
+
+def resize_to_gray(image: np.ndarray, size: Optional[Tuple[int, int]],
+                   box: Optional[Tuple[float, float, float, float]] = None,
+                   buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """
+    Cinza (modo L) de image, redimensionada com LANCZOS para size se size não for None.
+    box segue Image.resize(box=...): só essa região da origem é reamostrada.
+    Pode devolver image (ou uma view dela) se ela já for cinza contígua no tamanho final.
+    """
+    gray = None
+    if image.dtype == np.uint8 and image.ndim == 2:
+        gray = image
+    elif image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] in (3, 4):
+        # RGBA com resize usa alfa pré-multiplicado no Pillow: só vale o atalho sem resize
+        if (image.shape[2] == 3 or size is None) and _is_gray_rgb(image):
+            gray = image[..., 0]
+
+    if gray is None:
+        pil_img = Image.fromarray(image)
+        if size:
+            pil_img = pil_img.resize(size, Image.Resampling.LANCZOS, box=box)
+        return _pil_gray(pil_img.convert("L"), buffers)
+
+    if size:
+        resized = Image.fromarray(np.ascontiguousarray(gray)).resize(size, Image.Resampling.LANCZOS, box=box)
+        return _pil_gray(resized, buffers)
+    if gray.flags.c_contiguous:
+        return gray
+    out = take(buffers, gray.shape)
+    np.copyto(out, gray)
+    return out
+
+
+def gray_histogram(gray: np.ndarray) -> np.ndarray:
+    """Histograma de 256 bins (int64)."""
+    if gray.size < _CALCHIST_EXACT_LIMIT:
+        return cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    return np.bincount(gray.ravel(), minlength=256).astype(np.int64)
+
+
+def autocontrast_lut(hist: np.ndarray, cutoff: int = AUTOCONTRAST_CUTOFF) -> np.ndarray:
+    """
+    LUT de ImageOps.autocontrast(cutoff=...) para um histograma de modo L.
+
+    Cortar cutoff% dos pixels de cada ponta e pegar o primeiro/último bin que
+    sobra é o mesmo que o primeiro bin com soma acumulada > corte.
+    """
+    hist = np.asarray(hist, dtype=np.int64)
+    n = int(hist.sum())
+    cut = int(n * cutoff // 100)
+    identity = np.arange(256, dtype=np.uint8)
+    if n == 0:
+        return identity
+
+    lo = int(np.argmax(np.cumsum(hist) > cut))
+    hi = 255 - int(np.argmax(np.cumsum(hist[::-1]) > cut))
+    if hi <= lo:
+        return identity
+
+    scale = 255.0 / (hi - lo)
+    offset = -lo * scale
+    values = np.trunc(np.arange(256) * scale + offset)
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def binarize_lut(hist: np.ndarray) -> np.ndarray:
+    """Autocontraste + threshold em um LUT só: 0 se < BW_THRESHOLD, senão 1."""
+    return (autocontrast_lut(hist) >= BW_THRESHOLD).astype(np.uint8)
+
+
+def preprocess_array(image: np.ndarray, buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """Pré-processa a imagem para OMR - idêntico a preprocess_pil_image(Image.fromarray(image))."""
+    gray = to_gray(image, buffers)
+    return cv2.LUT(gray, binarize_lut(gray_histogram(gray)), dst=take(buffers, gray.shape))
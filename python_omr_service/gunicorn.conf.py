@@ -0,0 +1,63 @@
+"""
+Servidor de produção do serviço OMR (gunicorn, pre-fork).
+
+    cd python_omr_service && gunicorn -c gunicorn.conf.py app:app
+
+- O app (templates compilados, tabelas) é carregado uma vez no master e os
+  workers herdam a memória por copy-on-write (preload_app).
+- Cada worker fixa as threads internas do OpenCV (OMR_CV_THREADS, padrão 1):
+  o paralelismo vem dos workers, sem oversubscription.
+- Cada worker processa uma folha sintética por template antes de aceitar conexões
+  e só então responde 200 em /ready (readiness; /health é liveness).
+- Reload gracioso: `kill -HUP <pid do master>` troca os workers sem derrubar
+  as requisições em andamento (graceful_timeout). Para carregar código novo
+  com preload_app, usar `kill -USR2` (novo master) seguido de `kill -TERM` no antigo.
+"""
+import logging
+import multiprocessing
+import os
+
+_cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5002')}"
+workers = int(os.getenv("OMR_WORKERS", "0")) or _cpus
+threads = int(os.getenv("OMR_WORKER_THREADS", "1"))
+worker_class = "gthread" if threads > 1 else "sync"
+preload_app = True
+
+# PDFs longos e lotes em streaming passam bem de 30s
+timeout = int(os.getenv("OMR_WORKER_TIMEOUT", "300"))
+graceful_timeout = int(os.getenv("OMR_GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+# Recicla workers periodicamente (fragmentação de memória com imagens grandes)
+max_requests = int(os.getenv("OMR_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("OMR_LOG_LEVEL", "info")
+
+CV_THREADS = int(os.getenv("OMR_CV_THREADS", "1"))
+
+# Cada worker teria um pool de lote do tamanho da máquina: divide os núcleos. Com
+# um worker por núcleo (padrão) dá 1 e o lote é lido no próprio worker, sem pool;
+# para um lote grande usar vários núcleos, OMR_WORKERS menor que os núcleos
+os.environ.setdefault("OMR_BATCH_WORKERS", str(max(1, _cpus // workers)))
+
+
+def on_starting(server):
+    import app as omr_app
+    omr_app.preload_templates()
+    server.log.info(f"Templates pré-compilados: {omr_app.template_cache_info()['size']}")
+
+
+def post_fork(server, worker):
+    import cv2
+    cv2.setNumThreads(CV_THREADS)
+
+
+def post_worker_init(worker):
+    import app as omr_app
+    elapsed = omr_app.warm_up()
+    logging.getLogger("gunicorn.error").info(
+        f"Worker {worker.pid} aquecido em {elapsed * 1000:.0f} ms ({omr_app.startup_profile().summary()})")
@@ -0,0 +1,120 @@
+"""
+Decodificação das imagens enviadas.
+
+- "pil" (padrão): Pillow, colorido e em resolução cheia, como na calibração.
+  O mesmo array de np.array(img), mas copiado em faixas de ~1 MB direto para
+  o array final: np.array(img) passa por img.tobytes() (blocos + join) e
+  ainda copia o resultado, três buffers do tamanho da página ao mesmo tempo.
+- "gray": decodificadores do OpenCV direto em cinza (o pipeline só usa
+  luminância). JPEG muito maior que o reference_size do template é
+  decodificado já reduzido (escala de DCT do libjpeg: 1/2, 1/4 ou 1/8),
+  sem nunca ficar abaixo do tamanho de referência; uma foto de celular ou
+  um scan a 600 DPI paga uma fração da decodificação e da memória.
+  Orientação EXIF ignorada, como no Pillow.
+
+O cabeçalho (formato e tamanho) é lido pelo Pillow sem decodificar pixels.
+`data` pode ser bytes ou o mmap de um upload em disco (upload_ingest): os
+dois caminhos leem direto dele, sem copiar o arquivo.
+Formatos fora de DIRECT_FORMATS, e qualquer falha do OpenCV, seguem no Pillow.
+O cinza do libjpeg (canal Y) e a redução por DCT não são bit a bit iguais ao
+caminho do Pillow; test_equivalence.py valida que as respostas não mudam.
+"""
+from typing import Optional, Tuple, Union
+import io
+import mmap
+
+import cv2
+import numpy as np
+from PIL import Image
+
+DIRECT_FORMATS = ("JPEG", "PNG", "TIFF", "BMP", "WEBP")
+
+# Fatores de redução do libjpeg (maior primeiro) e o flag do cv2 de cada um
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+# Maior redução por DCT (entra na versão da leitura do cache de resultados)
+MAX_REDUCTION = _REDUCED_FLAGS[0][0]
+
+ImageData = Union[bytes, mmap.mmap]
+
+
+def open_image(data: ImageData) -> Image.Image:
+    """Image.open sem copiar: o mmap já é um arquivo; bytes via BytesIO (compartilha o buffer)."""
+    if isinstance(data, mmap.mmap):
+        data.seek(0)
+        return Image.open(data)
+    return Image.open(io.BytesIO(data))
+
+
+def image_header(data: ImageData) -> Tuple[Optional[str], Tuple[int, int]]:
+    """(formato, (width, height)) sem decodificar os pixels."""
+    with open_image(data) as img:
+        return img.format, img.size
+
+
+def reduction_factor(size: Tuple[int, int], reference_size: Optional[Tuple[int, int]]) -> int:
+    """Maior fator 2/4/8 que mantém a imagem reduzida >= reference_size nas duas dimensões."""
+    if not reference_size:
+        return 1
+    width, height = size
+    ref_w, ref_h = reference_size
+    for factor, _flag in _REDUCED_FLAGS:
+        if width // factor >= ref_w and height // factor >= ref_h:
+            return factor
+    return 1
+
+# Modos em que np.array(img) é o buffer cru em uint8 (canais por pixel)
+_BAND_MODES = {"L": 1, "RGB": 3, "RGBA": 4}
+_BAND_BYTES = 1 << 20
+
+
+def pil_to_array(img: Image.Image, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    np.array(img) sem a página inteira em bytes: faixas de linhas copiadas direto
+    no array. out: array de destino (buffer_pool) com o shape de np.array(img).
+    """
+    channels = _BAND_MODES.get(img.mode)
+    if channels is None:
+        return np.array(img)
+    width, height = img.size
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    if out is None or out.shape != shape or out.dtype != np.uint8:
+        out = np.empty(shape, dtype=np.uint8)
+    img.load()
+    rows = max(1, _BAND_BYTES // max(1, width * channels))
+    for top in range(0, height, rows):
+        bottom = min(height, top + rows)
+        band = img.crop((0, top, width, bottom)).tobytes()
+        out[top:bottom] = np.frombuffer(band, dtype=np.uint8).reshape((bottom - top,) + shape[1:])
+    return out
+
+
+def decode_pil(data: ImageData) -> np.ndarray:
+    with open_image(data) as img:
+        return pil_to_array(img)
+
+
+def decode_gray(data: ImageData, reference_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """Cinza 2D uint8; JPEG grande vem reduzido até perto de reference_size (width, height)."""
+    image_format, size = image_header(data)
+    if image_format not in DIRECT_FORMATS:
+        return decode_pil(data)
+    flag = cv2.IMREAD_GRAYSCALE
+    if image_format == "JPEG":
+        factor = reduction_factor(size, reference_size)
+        flag = dict(_REDUCED_FLAGS).get(factor, cv2.IMREAD_GRAYSCALE)
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is None or image.dtype != np.uint8:
+        return decode_pil(data)
+    return image
+
+
+def decode_image(data: ImageData, mode: str = "pil", reference_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """Decodifica no modo dado ("pil" ou "gray")."""
+    if mode == "gray":
+        return decode_gray(data, reference_size)
+    return decode_pil(data)
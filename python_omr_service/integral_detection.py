@@ -0,0 +1,183 @@
+"""
+Detecção de bolhas por imagem integral (OpenCV).
+
+Mesmas respostas de detect_bubbles_fixed: cada bolha é a média do quadrado
+[cy-r, cy+r) x [cx-r, cx+r) da imagem invertida, mas todas as somas saem de
+uma única cv2.integral da ROI de respostas, lida com indexação vetorizada.
+Com buffers (buffer_pool.BufferLease), a integral e a cópia BGR do debug
+são escritas em arrays do pool.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from buffer_pool import BufferLease, take
+from compiled_template import CompiledTemplate, get_compiled_template
+from omr_result import NO_ANSWER, SheetAnswers
+
+
+def _integral_buffer(compiled: CompiledTemplate, buffers: Optional[BufferLease]) -> Optional[np.ndarray]:
+    """Destino da integral da ROI de bolhas: (H+1, W+1), int32 enquanto a soma couber, senão float64."""
+    if buffers is None:
+        return None
+    rows, cols = compiled.roi_slices
+    height, width = rows.stop - rows.start, cols.stop - cols.start
+    dtype = np.int32 if height * width * 255 < 2 ** 31 else np.float64
+    return buffers.take((height + 1, width + 1), dtype)
+
+
+def _roi_integral(image_array: np.ndarray, compiled: CompiledTemplate, origin: Tuple[int, int],
+                  out: Optional[np.ndarray] = None) -> np.ndarray:
+    """cv2.integral só da ROI de bolhas (origin = (y, x) de image_array na página)."""
+    rows, cols = compiled.roi_slices
+    oy, ox = origin
+    # Recorte como view: o cv2 aceita o passo de linha da página, sem cópia
+    roi = image_array[rows.start - oy:rows.stop - oy, cols.start - ox:cols.stop - ox]
+    if roi.shape != (rows.stop - rows.start, cols.stop - cols.start):
+        raise ValueError("Região das bolhas fora do recorte da imagem")
+    # int32 basta enquanto a soma total da ROI couber; senão float64 (exato até 2^53)
+    sdepth = cv2.CV_32S if roi.size * 255 < 2 ** 31 else cv2.CV_64F
+    if out is None:
+        return cv2.integral(roi, sdepth=sdepth)
+    return cv2.integral(roi, sum=out, sdepth=sdepth)
+
+
+def _corner_sums(integral: np.ndarray, compiled: CompiledTemplate) -> np.ndarray:
+    """Os 4 cantos (y2x2, y1x2, y2x1, y1x1) de cada bolha na integral da ROI: [4, Q, O] int64."""
+    y1, y2, x1, x2 = compiled.corners
+    return integral[np.stack([y2, y1, y2, y1]), np.stack([x2, x2, x1, x1])].astype(np.int64)
+
+
+def _darkness_from_corners(corners: np.ndarray, compiled: CompiledTemplate) -> np.ndarray:
+    """Escuridão [..., Q, O] a partir dos cantos [..., 4, Q, O] (uma ou várias páginas)."""
+    areas = compiled.areas
+    darkness = np.zeros(corners.shape[:-3] + areas.shape, dtype=np.float64)
+    valid = areas > 0
+    white = corners[..., 0, :, :] - corners[..., 1, :, :] - corners[..., 2, :, :] + corners[..., 3, :, :]
+    # inverted = 255 - image: soma invertida sem materializar a imagem invertida
+    inverted_sum = areas * 255 - white
+    darkness[..., valid] = inverted_sum[..., valid] / areas[valid] / 255.0
+    return darkness
+
+
+def bubble_darkness(image_array: np.ndarray, compiled: CompiledTemplate, origin: Tuple[int, int] = (0, 0),
+                    buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """
+    Escuridão média (0-1) de cada bolha [Q, O] na imagem invertida.
+
+    A integral é calculada só sobre a ROI que envolve todas as bolhas.
+    Soma inteira exata / área / 255.0 reproduz bit a bit np.mean(region) / 255.0.
+    origin = (y, x) de image_array na página, quando ela é só um recorte.
+    """
+    if not (compiled.areas > 0).any():
+        return np.zeros(compiled.areas.shape, dtype=np.float64)
+    integral = _roi_integral(image_array, compiled, origin, _integral_buffer(compiled, buffers))
+    return _darkness_from_corners(_corner_sums(integral, compiled), compiled)
+
+
+def bubble_darkness_batch(images: Sequence[np.ndarray], compiled: CompiledTemplate,
+                          origins: Optional[Sequence[Tuple[int, int]]] = None,
+                          buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """
+    bubble_darkness de N páginas com a mesma geometria: [N, Q, O].
+    Por página só a cv2.integral e a leitura dos cantos; subtrações, divisões
+    e máscaras saem numa única operação vetorizada para o lote. (Empilhar as
+    integrais inteiras em [N, H+1, W+1] custa mais em cópia do que economiza.)
+    """
+    if not (compiled.areas > 0).any():
+        return np.zeros((len(images),) + compiled.areas.shape, dtype=np.float64)
+    if origins is None:
+        origins = [(0, 0)] * len(images)
+    corners = np.empty((len(images), 4) + compiled.areas.shape, dtype=np.int64)
+    # Uma integral por vez: o mesmo destino serve para todas as páginas
+    integral = _integral_buffer(compiled, buffers)
+    for i, (image, origin) in enumerate(zip(images, origins)):
+        corners[i] = _corner_sums(_roi_integral(image, compiled, origin, integral), compiled)
+    return _darkness_from_corners(corners, compiled)
+
+
+def decide_answers(darkness: np.ndarray, compiled: CompiledTemplate) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (alternativa mais escura, marcada?) de cada questão, com a escada de thresholds
+    da calibração. darkness [..., Q, O]: uma página ou um lote inteiro de uma vez.
+    """
+    marked_idx = np.argmax(darkness, axis=-1)
+    max_darkness = np.take_along_axis(darkness, marked_idx[..., None], axis=-1)[..., 0]
+    if darkness.shape[-1] >= 2:
+        margins = max_darkness - np.partition(darkness, -2, axis=-1)[..., -2]
+    else:
+        margins = np.zeros_like(max_darkness)
+    return marked_idx, max_darkness > compiled.thresholds_for(margins)
+
+
+def detect_sheet_integral(image_array: np.ndarray, template: Dict, origin: Tuple[int, int] = (0, 0),
+                          page_size: Optional[Tuple[int, int]] = None,
+                          buffers: Optional[BufferLease] = None) -> Tuple[SheetAnswers, np.ndarray]:
+    """detect_bubbles_integral sem o dict: (SheetAnswers, escuridão [Q, O])."""
+    if page_size is None:
+        height, width = image_array.shape
+    else:
+        width, height = page_size
+    compiled = get_compiled_template(template, width, height)
+    darkness = bubble_darkness(image_array, compiled, origin, buffers)
+    marked_idx, is_marked = decide_answers(darkness, compiled)
+    return SheetAnswers.from_detection(compiled, darkness, marked_idx, is_marked), darkness
+
+
+def detect_sheets_integral(images: Sequence[np.ndarray], template: Dict, page_size: Tuple[int, int],
+                           origins: Optional[Sequence[Tuple[int, int]]] = None,
+                           buffers: Optional[BufferLease] = None) -> List[Tuple[SheetAnswers, np.ndarray]]:
+    """
+    detect_sheet_integral para N páginas binarizadas do mesmo tamanho (width, height):
+    escuridão e escada de thresholds calculadas para o lote inteiro de uma vez.
+    """
+    compiled = get_compiled_template(template, *page_size)
+    darkness = bubble_darkness_batch(images, compiled, origins, buffers)
+    marked_idx, is_marked = decide_answers(darkness, compiled)
+    return [(SheetAnswers.from_detection(compiled, darkness[i], marked_idx[i], is_marked[i]), darkness[i])
+            for i in range(len(images))]
+
+
+def detect_bubbles_integral(image_array: np.ndarray, template: Dict, debug: bool = False,
+                            origin: Tuple[int, int] = (0, 0),
+                            page_size: Optional[Tuple[int, int]] = None,
+                            buffers: Optional[BufferLease] = None) -> Tuple[Dict[str, str], Optional[np.ndarray]]:
+    """
+    Equivalente vetorizado de detect_bubbles_fixed.
+    Se image_array for um recorte, page_size = (width, height) da página e
+    origin = (y, x) do recorte nela; o debug é desenhado só no recorte.
+    Retorna: (answers_dict, debug_image)
+    """
+    if page_size is None:
+        height, width = image_array.shape
+    else:
+        width, height = page_size
+    compiled = get_compiled_template(template, width, height)
+    darkness = bubble_darkness(image_array, compiled, origin, buffers)
+    marked_idx, is_marked = decide_answers(darkness, compiled)
+
+    options = compiled.options
+    answers = SheetAnswers.from_detection(compiled, darkness, marked_idx, is_marked).to_dict()
+
+    if not debug:
+        return answers, None
+
+    debug_image = cv2.cvtColor(image_array, cv2.COLOR_GRAY2BGR, dst=take(buffers, image_array.shape + (3,)))
+    # Mesma ordem de desenho de detect_bubbles_fixed (sobreposições idênticas)
+    radius = compiled.radius
+    oy, ox = origin
+    for row, q_id in enumerate(compiled.question_ids.tolist()):
+        centers = (compiled.centers[row] - (ox, oy)).tolist()
+        row_cy = centers[0][1]
+        for opt, (opt_cx, _) in enumerate(centers):
+            if compiled.areas[row, opt] > 0:
+                cv2.circle(debug_image, (opt_cx, row_cy), radius, (0, 255, 0), 1)
+        opt = int(marked_idx[row])
+        marked = bool(is_marked[row])
+        color = (0, 0, 255) if marked else (255, 0, 0)
+        opt_cx = centers[opt][0]
+        cv2.circle(debug_image, (opt_cx, row_cy), radius + 2, color, 2)
+        cv2.putText(debug_image, f"Q{q_id}:{options[opt]}", (opt_cx + radius + 3, row_cy),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.3, color, 1)
+    return answers, debug_image
@@ -0,0 +1,332 @@
+"""
+Tempos por etapa e métricas no formato texto do Prometheus (GET /metrics).
+
+    with timed("align"):
+        ...
+
+timed() mede a etapa com perf_counter, observa o histograma
+omr_stage_duration_seconds{stage} e, se a thread estiver atendendo uma
+requisição (begin_request), soma o tempo no StageTimer dela: é esse timer
+que vira o bloco "timings" da resposta (?timings=true) e o header
+Server-Timing. Custo: alguns microssegundos por etapa (uma página leva
+dezenas de milissegundos).
+
+Memória por requisição (Linux): begin_request(track_memory=True) guarda o
+VmRSS do início e, se for a única requisição em andamento, zera o pico do
+processo (VmHWM, via /proc/self/clear_refs). No fim, VmHWM - VmRSS inicial é
+quanto a requisição fez o worker crescer no pior momento: o número para
+dimensionar o limite de upload. Com requisições simultâneas no mesmo
+processo o pico é compartilhado ("exclusive": false) e não entra no
+histograma. Custo: ~20 µs (duas leituras de /proc/self/status).
+
+Sem dependência nova: contadores, gauges e histogramas simples com lock,
+renderizados à mão. As métricas são do processo; com vários workers do
+gunicorn cada scrape vê o worker que atendeu (label pid).
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock, local
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import os
+import time
+
+# Bytes: de 16 MB a 2 GB (pico de memória por requisição)
+MEMORY_BUCKETS = tuple(float(mb * 1024 * 1024) for mb in (16, 32, 64, 128, 256, 512, 1024, 2048))
+
+# Segundos: de 1 ms (detecção) a 60 s (validação por LLM)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por bucket (não cumulativa) + overflow, soma, total]
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items()]
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List = []
+        # Coletores chamados no scrape: [(nome, tipo, ajuda, [(labels, valor)])]
+        self.collectors: List[Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self) -> None:
+        """Zera as métricas registradas (após o aquecimento: só tráfego real nos histogramas)."""
+        for metric in self.metrics:
+            metric.reset()
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collector in self.collectors:
+            for name, kind, help_text, values in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in values:
+                    lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "omr_stage_duration_seconds", "Duração de cada etapa do processamento", ("stage",)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "omr_request_duration_seconds", "Duração das requisições (até o fim do streaming)", ("endpoint",)))
+REQUESTS = REGISTRY.register(Counter(
+    "omr_requests_total", "Requisições atendidas", ("endpoint", "status")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "omr_requests_in_flight", "Requisições em andamento"))
+PAGES = REGISTRY.register(Counter(
+    "omr_pages_processed_total", "Páginas lidas pelo detector (sem contar acertos do cache)", ("template",)))
+PAGES_SKIPPED = REGISTRY.register(Counter(
+    "omr_pages_skipped_total", "Páginas de PDF ignoradas na triagem (em branco, sem marcadores)",
+    ("template", "reason")))
+DUPLICATE_CANDIDATES = REGISTRY.register(Counter(
+    "omr_duplicate_candidates_total",
+    "Possíveis duplicatas: hash e respostas iguais aos de uma página anterior do job ou do tenant",
+    ("template", "scope")))
+C2F_QUESTIONS = REGISTRY.register(Counter(
+    "omr_c2f_questions_total", "Questões decididas no nível grosso ou relidas no fino (leitura coarse-to-fine)",
+    ("template", "level")))
+ALIGNMENT_FAILURES = REGISTRY.register(Counter(
+    "omr_alignment_failures_total", "Páginas em que os marcadores P1-P4 não foram encontrados", ("template",)))
+REQUEST_PEAK_MEMORY = REGISTRY.register(Histogram(
+    "omr_request_peak_memory_bytes", "Pico de memória (VmHWM) acima do RSS do início da requisição",
+    ("endpoint",), buckets=MEMORY_BUCKETS))
+_process_start = time.time()
+
+
+def _process_collector():
+    # pid no scrape: workers do gunicorn (fork) respondem com o próprio pid
+    return [("omr_process_start_time_seconds", "gauge", "Início do processo (epoch)",
+             [({"pid": str(os.getpid())}, _process_start)])]
+
+
+REGISTRY.collectors.append(_process_collector)
+
+
+_MB = 1024 * 1024
+
+
+def memory_status() -> Optional[Tuple[int, int]]:
+    """(VmRSS, VmHWM) do processo em bytes; None fora do Linux."""
+    try:
+        with open("/proc/self/status", "rb") as f:
+            text = f.read()
+    except OSError:
+        return None
+    values = {}
+    for line in text.splitlines():
+        if line.startswith((b"VmRSS:", b"VmHWM:")):
+            name, value = line.split(b":", 1)
+            values[name] = int(value.split()[0]) * 1024
+    if len(values) != 2:
+        return None
+    return values[b"VmRSS"], values[b"VmHWM"]
+
+
+def reset_peak_memory() -> bool:
+    """Zera o VmHWM do processo (passa a valer o RSS atual)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class MemoryProbe:
+    """Pico de memória de uma requisição: VmHWM no fim menos VmRSS no começo."""
+
+    __slots__ = ("start_rss", "exclusive")
+
+    def __init__(self, exclusive: bool):
+        self.exclusive = exclusive and reset_peak_memory()
+        status = memory_status()
+        self.start_rss = status[0] if status else None
+
+    def peak_bytes(self) -> Optional[int]:
+        status = memory_status()
+        if status is None or self.start_rss is None:
+            return None
+        return max(0, status[1] - self.start_rss)
+
+    def snapshot(self) -> Dict:
+        status = memory_status()
+        if status is None or self.start_rss is None:
+            return {}
+        rss, hwm = status
+        return {
+            "rss_start_mb": round(self.start_rss / _MB, 1),
+            "rss_end_mb": round(rss / _MB, 1),
+            "peak_mb": round(hwm / _MB, 1),
+            "peak_delta_mb": round(max(0, hwm - self.start_rss) / _MB, 1),
+            "exclusive": self.exclusive,
+        }
+
+
+class StageTimer:
+    """Milissegundos por etapa de uma requisição (e, opcionalmente, o pico de memória)."""
+
+    __slots__ = ("start", "stages", "memory")
+
+    def __init__(self, memory: Optional[MemoryProbe] = None):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.memory = memory
+
+    def add(self, stage: str, ms: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def snapshot(self) -> Dict[str, float]:
+        timings = {stage: round(ms, 3) for stage, ms in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.start) * 1000, 3)
+        return timings
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing (etapa;dur=ms)."""
+        return ", ".join(f"{stage};dur={ms:.2f}" for stage, ms in self.snapshot().items())
+
+
+_local = local()
+
+
+def begin_request(track_memory: bool = False, exclusive: bool = False) -> StageTimer:
+    """Timer da requisição da thread; track_memory mede o pico (exclusive: zera o VmHWM antes)."""
+    timer = _local.timer = StageTimer(MemoryProbe(exclusive) if track_memory else None)
+    return timer
+
+
+def end_request() -> Optional[StageTimer]:
+    timer = getattr(_local, "timer", None)
+    _local.timer = None
+    return timer
+
+
+def current_timer() -> Optional[StageTimer]:
+    return getattr(_local, "timer", None)
+
+
+def record(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, stage)
+    timer = getattr(_local, "timer", None)
+    if timer is not None:
+        timer.add(stage, seconds * 1000)
+
+
+def record_timings(timings: Dict[str, float]) -> None:
+    """Etapas medidas em outro processo (pool do lote), em ms."""
+    for stage, ms in timings.items():
+        if stage != "total":
+            record(stage, ms / 1000)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,85 @@
+"""
+Resultado compacto de uma folha: arrays em vez de dict de strings.
+
+- codes: uint8 [Q], 0 = não respondeu, i + 1 = alternativa i
+- ink: float16 [Q, O], fração de tinta de cada bolha (0-1)
+- flags: uint8 [Q], bitmask FLAG_BLANK / FLAG_MULTIPLE
+
+A escuridão da detecção fica em [254/255, 1] (imagem binarizada 0/1) e
+perderia quase toda a resolução em float16; por isso a matriz guarda a
+fração de tinta (ink_fraction), que ocupa 0-1 inteiro.
+
+to_dict() reproduz resultado.questoes; to_npy() é a codificação binária
+(?format=npy) para clientes de alto volume: um .npy de registros de 14
+bytes por questão (5 alternativas), sem chaves nem strings repetidas.
+"""
+from typing import Dict, List
+import io
+
+import numpy as np
+
+NO_ANSWER = "Não respondeu"
+
+FLAG_BLANK = 1      # resposta "Não respondeu" (pela escada de thresholds)
+FLAG_MULTIPLE = 2   # duas ou mais alternativas com tinta >= MULTIPLE_MARK_INK
+
+MULTIPLE_MARK_INK = 0.5
+
+NPY_MIMETYPE = "application/x-npy"
+
+
+def ink_fraction(darkness: np.ndarray) -> np.ndarray:
+    """Fração de pixels pretos de cada bolha a partir da escuridão da detecção."""
+    return np.clip(1.0 - 255.0 * (1.0 - darkness), 0.0, 1.0)
+
+
+class SheetAnswers:
+    """Respostas de uma folha em arrays (uma linha por questão do template)."""
+
+    __slots__ = ("question_keys", "options", "total_questions", "codes", "ink", "flags")
+
+    def __init__(self, question_keys: List[str], options: List[str], total_questions: int,
+                 codes: np.ndarray, ink: np.ndarray, flags: np.ndarray):
+        self.question_keys = question_keys      # compartilhada com o template compilado
+        self.options = options
+        self.total_questions = total_questions
+        self.codes = codes
+        self.ink = ink
+        self.flags = flags
+
+    @classmethod
+    def from_detection(cls, compiled, darkness: np.ndarray, marked_idx: np.ndarray,
+                       is_marked: np.ndarray) -> "SheetAnswers":
+        """A partir da escuridão [Q, O] e da decisão do detector (argmax + escada)."""
+        ink = ink_fraction(darkness)
+        codes = np.where(is_marked, marked_idx + 1, 0).astype(np.uint8)
+        flags = np.where(is_marked, 0, FLAG_BLANK).astype(np.uint8)
+        flags |= np.where((ink >= MULTIPLE_MARK_INK).sum(axis=1) >= 2, FLAG_MULTIPLE, 0).astype(np.uint8)
+        return cls(compiled.question_keys, compiled.options, compiled.total_questions,
+                   codes, ink.astype(np.float16), flags)
+
+    def to_dict(self) -> Dict[str, str]:
+        """Mesmo dict de resultado.questoes (questões fora do template = "Não respondeu")."""
+        labels = [NO_ANSWER] + self.options
+        answers = dict(zip(self.question_keys, (labels[c] for c in self.codes.tolist())))
+        for q in range(1, self.total_questions + 1):
+            if str(q) not in answers:
+                answers[str(q)] = NO_ANSWER
+        return answers
+
+    def records(self) -> np.ndarray:
+        """Array estruturado [Q] (question_id, code, flags, ink[O]) para a codificação binária."""
+        dtype = np.dtype([("question_id", "<u2"), ("code", "u1"), ("flags", "u1"),
+                          ("ink", "<f2", (len(self.options),))])
+        records = np.empty(len(self.question_keys), dtype=dtype)
+        records["question_id"] = [int(q) for q in self.question_keys]
+        records["code"] = self.codes
+        records["flags"] = self.flags
+        records["ink"] = self.ink
+        return records
+
+    def to_npy(self) -> bytes:
+        """Arquivo .npy (np.load) com records(); alternativas e página vão nos headers HTTP."""
+        buffer = io.BytesIO()
+        np.save(buffer, self.records(), allow_pickle=False)
+        return buffer.getvalue()
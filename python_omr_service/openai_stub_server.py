@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Servidor local no lugar da API do ChatGPT (testes e carga offline).
+
+- POST /v1/chat/completions: devolve as respostas do OMR recebidas no prompt
+  ("OMR: [...]", ou {"questão": ...} no modo crops) como validadas, sem
+  correções, após --latency-ms.
+- POST /callback: guarda o corpo (callbacks dos jobs de validação).
+- POST /redirect/?to=<url>: responde 307 para <url> (testa que o callback não
+  segue redirecionamentos).
+- GET /callbacks: lista os callbacks recebidos.
+
+Uso:
+    python openai_stub_server.py --port 5099 --latency-ms 800
+    OMR_OPENAI_API_URL=http://127.0.0.1:5099/v1/chat/completions python app.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import re
+import time
+
+
+class StubState:
+    def __init__(self, latency_ms: int):
+        self.latency_ms = latency_ms
+        self.lock = Lock()
+        self.completions = 0
+        self.callbacks: List[dict] = []
+        self.redirects = 0
+        # Tamanho (caracteres do data URL) das imagens recebidas, por chamada
+        self.image_chars: List[int] = []
+
+
+def _completion(omr_answers) -> dict:
+    content = json.dumps({"answers": omr_answers, "corrections": []})
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_POST(self):
+            if self.path.startswith("/v1/chat/completions"):
+                payload = self._read_json()
+                text = ""
+                image_chars = 0
+                for message in payload.get("messages", []):
+                    content = message.get("content")
+                    parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+                    text += " ".join(p.get("text", "") for p in parts if p.get("type") == "text")
+                    image_chars += sum(len(p["image_url"]["url"]) for p in parts if p.get("type") == "image_url")
+                match = re.search(r"OMR: (\[.*?\]|\{.*?\})\.", text)
+                answers = json.loads(match.group(1)) if match else []
+                time.sleep(state.latency_ms / 1000.0)
+                with state.lock:
+                    state.completions += 1
+                    state.image_chars.append(image_chars)
+                self._send_json(200, _completion(answers))
+            elif self.path.startswith("/redirect/"):
+                self._read_json()
+                target = parse_qs(urlsplit(self.path).query).get("to", ["/callback"])[0]
+                with state.lock:
+                    state.redirects += 1
+                self.send_response(307)
+                self.send_header("Location", target)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            elif self.path.startswith("/callback"):
+                payload = self._read_json()
+                with state.lock:
+                    state.callbacks.append(payload)
+                self._send_json(200, {"ok": True})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_GET(self):
+            if self.path.startswith("/callbacks"):
+                with state.lock:
+                    self._send_json(200, list(state.callbacks))
+            else:
+                self._send_json(404, {"error": "not found"})
+
+    return Handler
+
+
+def start_stub_server(port: int = 0, latency_ms: int = 0, host: str = "127.0.0.1"):
+    """Sobe o servidor numa thread; retorna (server, state). port=0 escolhe uma porta livre."""
+    state = StubState(latency_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stand-in local da API do ChatGPT")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--latency-ms", type=int, default=800)
+    args = parser.parse_args(argv)
+    state = StubState(args.latency_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"Stub ChatGPT em http://{args.host}:{args.port}/v1/chat/completions (latência {args.latency_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
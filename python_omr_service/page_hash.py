@@ -0,0 +1,252 @@
+"""
+Hash perceptual das páginas e detecção de páginas quase duplicadas.
+
+Coordenadores reenviam a mesma digitalização e alimentadores de scanner puxam
+duas vezes a mesma folha (double-feed). O cache de resultados só pega bytes
+idênticos; uma nova digitalização da mesma folha tem outro ruído, outra
+posição e outro JPEG.
+
+Um pHash clássico (DCT da página em 32x32) não serve: todas as folhas do
+template são o mesmo formulário impresso e só diferem nas bolhas marcadas,
+que somem na média. O hash aqui é da tinta:
+
+- miniatura da triagem (page_screening.PageThumbnail), pixels abaixo do limite
+  de tinta (bolhas preenchidas, marcadores, escrita; o contorno impresso das
+  bolhas é claro e fica de fora);
+- a máscara é levada pela homografia dos marcadores P1-P4 achados na
+  miniatura a uma grade PAGE_HASH_GRID x PAGE_HASH_GRID (rotação e
+  deslocamento da digitalização somem); sem os 4 marcadores, a página inteira;
+- 1 bit por célula: fração de tinta acima de HASH_CELL_INK.
+
+Em folhas sintéticas (grade 32, 1024 bits): a mesma folha digitalizada de
+novo (ruído, ±1,5°, ±2% de escala, JPEG) fica a até ~25 bits; folhas com
+marcações aleatórias, a 85+ bits. Mas folhas que diferem em poucas respostas
+ficam perto: 1, 5, 10 e 15 respostas diferentes dão ~1-2, 7-10, 15-21 e 25
+bits, dentro do ruído de uma nova digitalização. Então o hash só aponta as
+páginas parecidas (até OMR_DUPLICATE_DISTANCE bits), e a página é sinalizada
+se as respostas lidas forem iguais às da anterior em todas as questões
+(answers_digest; folhas sem nenhuma questão marcada não entram).
+
+Nem assim é duplicata certa: dois alunos com as mesmas respostas (cola,
+gabarito copiado) dão hash e respostas iguais, e nada no hash separa os
+alunos (nome e matrícula são manuscritos, finos demais para a miniatura). Por
+isso o bloco é "possivel_duplicata": um aviso para conferir, nunca motivo para
+descartar a página; quem junta os alunos (Node) deduplica pela identificação
+do aluno, não por ele. Pelo mesmo motivo o resultado da anterior nunca é
+reaproveitado: a página é sempre lida (reenvio dos mesmos bytes sai do cache
+de resultados).
+
+Índices (distância de Hamming por varredura linear, poucos µs por hash):
+- por job (um PDF, um lote): DuplicateCheck, vive durante a requisição;
+- por tenant (parâmetro tenant / header X-OMR-Tenant): TenantIndex do
+  processo, os OMR_DUPLICATE_INDEX_SIZE hashes mais recentes de cada um, com
+  o hash das respostas da página.
+"""
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+from omr_result import NO_ANSWER
+from page_screening import PageThumbnail
+
+PAGE_HASH_ENABLED = os.getenv("OMR_PAGE_HASH", "true").lower() == "true"
+PAGE_HASH_GRID = int(os.getenv("OMR_PAGE_HASH_GRID", "32"))
+DUPLICATE_DISTANCE = int(os.getenv("OMR_DUPLICATE_DISTANCE", "40"))
+DUPLICATE_INDEX_SIZE = int(os.getenv("OMR_DUPLICATE_INDEX_SIZE", "4096"))
+DUPLICATE_TENANTS = int(os.getenv("OMR_DUPLICATE_TENANTS", "256"))
+
+HASH_CELL_INK = 0.03
+# A máscara é reamostrada em HASH_OVERSAMPLE x a grade antes da média por célula
+HASH_OVERSAMPLE = 4
+
+SCOPE_JOB = "job"
+SCOPE_TENANT = "tenant"
+
+
+def page_hash(image: np.ndarray, template: Dict, thumb: Optional[PageThumbnail] = None) -> str:
+    """Hash da tinta da página (hex, PAGE_HASH_GRID² bits)."""
+    if thumb is None:
+        thumb = PageThumbnail(image)
+    mask = (thumb.gray < thumb.ink).astype(np.float32)
+    side = PAGE_HASH_GRID * HASH_OVERSAMPLE
+    marks = thumb.marks(template)
+    if len(marks) == 4 and {"p1", "p2", "p3", "p4"} <= marks.keys():
+        src = np.float32([marks["p1"], marks["p2"], marks["p3"], marks["p4"]])
+        dst = np.float32([[0, 0], [side, 0], [0, side], [side, side]])
+        canonical = cv2.warpPerspective(mask, cv2.getPerspectiveTransform(src, dst), (side, side))
+    else:
+        canonical = cv2.resize(mask, (side, side), interpolation=cv2.INTER_AREA)
+    cells = cv2.resize(canonical, (PAGE_HASH_GRID, PAGE_HASH_GRID), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(cells.ravel() > HASH_CELL_INK)
+    return bits.tobytes().hex()
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Distância de Hamming entre dois hashes hex."""
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def answers_digest(result: Dict) -> Optional[str]:
+    """
+    Hash das respostas lidas da página (None se não foi lida, erro ou ignorada,
+    ou se nenhuma questão foi marcada: folhas em branco são todas iguais).
+    """
+    if result.get("status") in ("erro", "ignorada"):
+        return None
+    answers = result.get("resultado", {}).get("questoes")
+    if not answers or all(answer == NO_ANSWER for answer in answers.values()):
+        return None
+    payload = json.dumps(answers, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def duplicate_flag(match: Dict) -> Dict:
+    """Bloco "possivel_duplicata" do resultado da página."""
+    return {"pagina": match["pagina"], "distancia": match["distancia"], "escopo": match["escopo"]}
+
+
+class DuplicateIndex:
+    """Hashes recentes (até max_items) com a referência de cada página."""
+
+    def __init__(self, max_items: Optional[int] = None):
+        self._entries: Deque[Tuple[int, Dict]] = deque(maxlen=max_items)
+        self._lock = Lock()
+
+    def find(self, phash: str, max_distance: int = DUPLICATE_DISTANCE) -> List[Tuple[Dict, int]]:
+        """Entradas a até max_distance bits, da mais próxima para a mais distante."""
+        value = int(phash, 16)
+        with self._lock:
+            entries = list(self._entries)
+        found = []
+        for other, entry in entries:
+            distance = (value ^ other).bit_count()
+            if distance <= max_distance:
+                found.append((entry, distance))
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def add(self, phash: str, entry: Dict) -> Dict:
+        with self._lock:
+            self._entries.append((int(phash, 16), entry))
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TenantIndex:
+    """Um DuplicateIndex por tenant (LRU de OMR_DUPLICATE_TENANTS tenants por processo)."""
+
+    def __init__(self, max_tenants: int = DUPLICATE_TENANTS, max_items: int = DUPLICATE_INDEX_SIZE):
+        self.max_tenants = max_tenants
+        self.max_items = max_items
+        self._indexes: "OrderedDict[str, DuplicateIndex]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, tenant: str) -> DuplicateIndex:
+        with self._lock:
+            index = self._indexes.get(tenant)
+            if index is None:
+                index = self._indexes[tenant] = DuplicateIndex(self.max_items)
+                while len(self._indexes) > self.max_tenants:
+                    self._indexes.popitem(last=False)
+            self._indexes.move_to_end(tenant)
+            return index
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {"tenants": len(self._indexes), "hashes": sum(len(i) for i in self._indexes.values())}
+
+
+class DuplicateCheck:
+    """
+    Possíveis duplicatas de um job: as páginas anteriores do próprio job e, com
+    tenant, as dos uploads anteriores do tenant. O hash só dá candidatas; a
+    possível duplicata é a candidata com as mesmas respostas lidas.
+
+        candidates = check.match(phash)         # [{"pagina", "distancia", "escopo", "entry"}]
+        entry = check.add(phash, page_number)   # no índice do job
+        ...                                     # leitura
+        match = check.confirm(candidates, result)
+        check.complete(entry, result)
+        check.publish(result)                   # no índice do tenant
+
+    register() faz tudo isso para uma página já lida.
+    """
+
+    def __init__(self, tenant: Optional[DuplicateIndex] = None):
+        self.job = DuplicateIndex()
+        self.tenant = tenant
+
+    def match(self, phash: str) -> List[Dict]:
+        """Páginas anteriores com hash parecido (as do job antes das do tenant, cada escopo por distância)."""
+        candidates = []
+        for scope, index in ((SCOPE_JOB, self.job), (SCOPE_TENANT, self.tenant)):
+            if index is None:
+                continue
+            for entry, distance in index.find(phash):
+                candidates.append({"pagina": entry["pagina"], "distancia": distance, "escopo": scope, "entry": entry})
+        return candidates
+
+    @staticmethod
+    def confirm(candidates: List[Dict], result: Dict) -> Optional[Dict]:
+        """Primeira candidata já lida com as mesmas respostas de `result` (None = não é possível duplicata)."""
+        digest = answers_digest(result)
+        if digest is None:
+            return None
+        for candidate in candidates:
+            if candidate["entry"]["respostas"] == digest:
+                return candidate
+        return None
+
+    def add(self, phash: str, page_number: int) -> Dict:
+        """Registra a página no job; o resultado entra depois (complete)."""
+        return self.job.add(phash, {"pagina": page_number, "respostas": None})
+
+    @staticmethod
+    def complete(entry: Dict, result: Dict) -> None:
+        entry["respostas"] = answers_digest(result)
+
+    def publish(self, result: Dict) -> None:
+        """Página lida entra no índice do tenant, só com o hash das respostas."""
+        if self.tenant is None or not result.get("phash") or result.get("status") in ("erro", "ignorada"):
+            return
+        self.tenant.add(result["phash"], {"pagina": result.get("pagina"), "respostas": answers_digest(result)})
+
+    def register(self, result: Dict, page_number: int) -> Optional[Dict]:
+        """Sinaliza (result["possivel_duplicata"]) e registra uma página já lida com result["phash"]."""
+        phash = result.get("phash")
+        if not phash:
+            return None
+        match = self.confirm(self.match(phash), result)
+        if match is not None:
+            result["possivel_duplicata"] = duplicate_flag(match)
+        self.complete(self.add(phash, page_number), result)
+        self.publish(result)
+        return match
+
+
+_tenant_index: Optional[TenantIndex] = None
+_tenant_index_lock = Lock()
+
+
+def tenant_index() -> TenantIndex:
+    """Índice por tenant do processo."""
+    global _tenant_index
+    with _tenant_index_lock:
+        if _tenant_index is None:
+            _tenant_index = TenantIndex()
+        return _tenant_index
+
+
+def duplicate_check(tenant: Optional[str]) -> Optional[DuplicateCheck]:
+    """DuplicateCheck de um job (None com OMR_PAGE_HASH=false)."""
+    if not PAGE_HASH_ENABLED:
+        return None
+    return DuplicateCheck(tenant_index().get(tenant) if tenant else None)
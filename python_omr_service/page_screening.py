@@ -0,0 +1,191 @@
+"""
+Triagem das páginas de PDFs em lote: versos, capas e instruções saem antes da leitura.
+
+Sem triagem, toda página passa por alinhamento, pré-processamento e leitura
+das 450 bolhas só para devolver 90 respostas arbitrárias. Aqui a decisão sai
+só da miniatura (fator inteiro, ~OMR_SCREEN_WIDTH px de largura, em cinza):
+
+- histograma: papel = nível do percentil 90; tinta = abaixo de metade do
+  papel, conteúdo = mais de CONTENT_DELTA níveis abaixo do papel
+- assinatura dos marcadores (PageThumbnail.marks): todos os P1-P4 do
+  template achados = folha de respostas
+- assinatura da grade (PageThumbnail.grid_contrast): nas posições onde a
+  leitura vai procurar as bolhas, o papel entre alternativas vizinhas é mais
+  claro que as bolhas (contorno impresso, marcações). Folhas reais que o
+  pipeline lê sem alinhamento (como a gabarito_pintado.png de calibração, sem
+  os marcadores onde o template espera) passam por aqui.
+
+Página sem nenhuma das duas assinaturas é ignorada: "pagina_em_branco" com
+tinta abaixo de OMR_SCREEN_BLANK (verso com ruído, sujeira, decalque), senão
+"sem_gabarito" (capa, instruções). Nenhum alinhamento completo é feito para
+decidir. A triagem é opcional (OMR_PAGE_SCREENING, padrão false).
+
+A miniatura (PageThumbnail) é reaproveitada pelo hash da página (page_hash);
+a busca dos marcadores nela normaliza o hash.
+"""
+from typing import Dict, Optional, Tuple
+import math
+import os
+
+import cv2
+import numpy as np
+
+from compiled_template import get_compiled_template, template_name
+
+PAGE_SCREENING = os.getenv("OMR_PAGE_SCREENING", "false").lower() == "true"
+SCREEN_WIDTH = int(os.getenv("OMR_SCREEN_WIDTH", "320"))
+# Fração da miniatura com tinta abaixo da qual a página ignorada está em branco
+SCREEN_BLANK_INK = float(os.getenv("OMR_SCREEN_BLANK", "0.005"))
+# Contraste mínimo da grade (níveis de cinza, papel entre bolhas - bolhas)
+SCREEN_GRID_CONTRAST = float(os.getenv("OMR_SCREEN_GRID", "4"))
+
+CONTENT_DELTA = 32
+PAPER_PERCENTILE = 0.9
+# Mancha de marcador: preenchimento mínimo da caixa e área mínima (px da miniatura).
+# Sem restrição de proporção: rotação e corte na borda da página deixam o
+# marcador fino, e o alinhamento aceita esses marcadores. Sujeira de scanner
+# fica em 1-3 px; o marcador, mesmo cortado pela borda, em 8+
+MARK_MIN_FILL = 0.5
+MARK_MIN_AREA = 4
+
+REASON_BLANK = "pagina_em_branco"
+REASON_NOT_SHEET = "sem_gabarito"
+
+
+
+def thumbnail(image: np.ndarray, width: int = SCREEN_WIDTH) -> np.ndarray:
+    """
+    Miniatura em cinza com pelo menos `width` px de largura. A redução é por um
+    fator inteiro k (INTER_AREA vira média de blocos k×k, ~3x mais rápido que
+    um fator qualquer); as sobras da borda direita/inferior ficam de fora.
+    """
+    h, w = image.shape[:2]
+    k = w // width
+    if k > 1 and h >= k:
+        image = cv2.resize(image[:h - h % k, :w - w % k], (w // k, h // k), interpolation=cv2.INTER_AREA)
+    if image.ndim == 3:
+        code = cv2.COLOR_RGBA2GRAY if image.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+        image = cv2.cvtColor(image, code)
+    return image
+
+
+def ink_levels(hist: np.ndarray) -> Tuple[int, int, int]:
+    """(papel, limite de tinta, limite de conteúdo) a partir do histograma da miniatura."""
+    cumulative = np.cumsum(hist)
+    paper = int(np.searchsorted(cumulative, cumulative[-1] * PAPER_PERCENTILE))
+    return paper, paper // 2, max(0, paper - CONTENT_DELTA)
+
+
+def _mark_blob(window: np.ndarray, paper: int, content: int, max_side: int) -> Optional[Tuple[float, float]]:
+    """
+    Centroide (na janela) de uma mancha escura compacta e sólida, ou None (nada
+    escuro, foto, borda escura). O limite é o meio entre o papel e o ponto mais
+    escuro da janela: marcador desfocado ou cortado pela borda da página fica
+    claro demais na miniatura para o limite de tinta da página.
+    """
+    darkest = int(window.min())
+    if darkest >= content:
+        return None
+    binary = (window < (paper + darkest) // 2).view(np.uint8)
+    count, _labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count < 2:
+        return None
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    _x, _y, w, h, area = stats[largest]
+    if max(w, h) > max_side or area < max(MARK_MIN_AREA, MARK_MIN_FILL * w * h):
+        return None
+    return float(centroids[largest][0]), float(centroids[largest][1])
+
+
+class PageThumbnail:
+    """Miniatura em cinza de uma página + níveis do histograma (triagem e hash da página usam a mesma)."""
+
+    __slots__ = ("gray", "page_size", "hist", "paper", "ink", "content_level", "_marks")
+
+    def __init__(self, image: np.ndarray):
+        self.gray = thumbnail(image)
+        self.page_size = (image.shape[1], image.shape[0])
+        self.hist = np.bincount(self.gray.ravel(), minlength=256)
+        self.paper, self.ink, self.content_level = ink_levels(self.hist)
+        self._marks: Dict[str, Dict[str, Tuple[float, float]]] = {}
+
+    def fraction_below(self, level: int) -> float:
+        return float(self.hist[:level].sum()) / self.gray.size
+
+    def marks(self, template: Dict) -> Dict[str, Tuple[float, float]]:
+        """Marcadores P1-P4 com assinatura: {nome: (x, y)} na miniatura."""
+        key = template_name(template)
+        if key not in self._marks:
+            self._marks[key] = self._find_marks(template)
+        return self._marks[key]
+
+    def _find_marks(self, template: Dict) -> Dict[str, Tuple[float, float]]:
+        compiled = get_compiled_template(template, *self.page_size)
+        th, tw = self.gray.shape
+        sx, sy = tw / self.page_size[0], th / self.page_size[1]
+        margin = max(2, math.ceil(2 * compiled.mark_margin * max(sx, sy)))
+        found = {}
+        for name, (x, y) in zip(compiled.mark_names, compiled.expected_marks.tolist()):
+            cx, cy = int(x * sx), int(y * sy)
+            x0, y0 = max(0, cx - margin), max(0, cy - margin)
+            window = self.gray[y0:cy + margin + 1, x0:cx + margin + 1]
+            blob = _mark_blob(window, self.paper, self.content_level, margin) if window.size else None
+            if blob is not None:
+                found[name] = (blob[0] + x0, blob[1] + y0)
+        return found
+
+    def grid_contrast(self, template: Dict) -> float:
+        """
+        Mediana, entre as questões, de (papel entre alternativas vizinhas -
+        média das bolhas) em níveis de cinza da miniatura, nas posições da
+        página sem alinhamento (onde a leitura procura quando faltam
+        marcadores). Folha de respostas: > 10; texto, capa ou verso: ~0
+        (sujeira de scanner puxa para cima, ~1 a cada 1000 pontos). Template
+        sem bolhas vizinhas: inf (sem assinatura, nunca ignora a página).
+        """
+        compiled = get_compiled_template(template, *self.page_size)
+        if compiled.centers.shape[1] < 2:
+            return math.inf
+        th, tw = self.gray.shape
+        sx, sy = tw / self.page_size[0], th / self.page_size[1]
+        centers = compiled.centers.astype(np.float64)
+        gaps = (centers[:, 1:] + centers[:, :-1]) / 2
+        centers, gaps = centers * (sx, sy), gaps * (sx, sy)
+
+        r = max(1, int(round(compiled.radius * sx)))
+        cx = np.clip(np.rint(centers[..., 0]).astype(np.int64), r, tw - r - 1)
+        cy = np.clip(np.rint(centers[..., 1]).astype(np.int64), r, th - r - 1)
+        integral = cv2.integral(self.gray)
+        bubbles = (integral[cy + r + 1, cx + r + 1] - integral[cy - r, cx + r + 1]
+                   - integral[cy + r + 1, cx - r] + integral[cy - r, cx - r]) / (2 * r + 1) ** 2
+        gx = np.clip(np.rint(gaps[..., 0]).astype(np.int64), 0, tw - 1)
+        gy = np.clip(np.rint(gaps[..., 1]).astype(np.int64), 0, th - 1)
+        paper = self.gray[gy, gx].astype(np.float64)
+        return float(np.median(paper.mean(axis=1) - bubbles.mean(axis=1)))
+
+
+def screen_page(image: np.ndarray, template: Dict, thumb: Optional[PageThumbnail] = None) -> Optional[Dict]:
+    """
+    None se a página é folha de respostas (todos os marcadores do template ou
+    a grade de bolhas na miniatura): seguir com a leitura. Senão a página a
+    ignorar: {"motivo", "tinta", "conteudo", "grade", "marcadores",
+    "marcadores_esperados"}.
+    """
+    if thumb is None:
+        thumb = PageThumbnail(image)
+    expected = len(template.get("registration_marks", {})) if "reference_size" in template else 0
+    found = len(thumb.marks(template)) if expected else 0
+    if expected and found == expected:
+        return None
+    grid = thumb.grid_contrast(template)
+    if grid >= SCREEN_GRID_CONTRAST:
+        return None
+    ink = thumb.fraction_below(thumb.ink)
+    return {
+        "motivo": REASON_BLANK if ink < SCREEN_BLANK_INK else REASON_NOT_SHEET,
+        "tinta": round(ink, 4),
+        "conteudo": round(thumb.fraction_below(thumb.content_level), 4),
+        "grade": round(grid, 1),
+        "marcadores": found,
+        "marcadores_esperados": expected,
+    }
@@ -0,0 +1,249 @@
+"""
+Cache de resultados OMR endereçado por conteúdo.
+
+Retentativas de job no Node e reenvios do mesmo PDF da turma reprocessam
+folhas idênticas. A chave é o SHA-256 dos bytes da imagem (ou do PDF + página)
+mais template (conteúdo, não só o nome), flag de alinhamento e versão do
+detector; o valor é o resultado da página sem o número da página.
+
+Dois níveis:
+- memória: LRU (OrderedDict) de poucas centenas de resultados por processo;
+- disco: um JSON por chave num diretório limitado em bytes, com despejo LRU
+  pelo mtime (atualizado a cada acerto). Gravação atômica (tmp + os.replace),
+  então vários processos podem compartilhar o diretório.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterable, Iterator, Optional
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("OMR_RESULT_CACHE", "true").lower() == "true"
+RESULT_CACHE_DIR = os.getenv("OMR_RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "omr_result_cache"))
+RESULT_CACHE_MAX_MB = int(os.getenv("OMR_RESULT_CACHE_MAX_MB", "256"))
+RESULT_CACHE_MEMORY_ITEMS = int(os.getenv("OMR_RESULT_CACHE_MEMORY_ITEMS", "512"))
+
+# Ao estourar o limite do disco, despeja até esta fração dele
+_EVICT_TARGET = 0.9
+
+
+def content_digest(chunks: Iterable[bytes]) -> str:
+    """SHA-256 (hex) de um conteúdo lido em blocos."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def template_fingerprint(template: Dict) -> str:
+    """Hash curto do conteúdo do template: editar a geometria invalida o cache."""
+    payload = json.dumps(template, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def cache_key(content_hash: str, template_key: str, template: Dict, align_marks: bool, detector_version: str) -> str:
+    """Chave do resultado: conteúdo + template + alinhamento + versão do detector."""
+    parts = (content_hash, template_key, template_fingerprint(template), "align" if align_marks else "raw", detector_version)
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Memória (LRU) na frente de um diretório limitado em bytes (LRU por mtime)."""
+
+    def __init__(self, directory: str, max_bytes: int, memory_items: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = Lock()
+        self._disk_bytes: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _remember(self, key: str, value: Dict) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cópia do resultado guardado, ou None."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(value)
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self._remember(key, value)
+            self.disk_hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Dict) -> None:
+        """Guarda o resultado nos dois níveis (falha de disco só vira log)."""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._remember(key, value)
+            self.stores += 1
+        if self.max_bytes <= 0:
+            return
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            # Regravar a mesma chave troca o arquivo: o tamanho antigo sai da conta
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"[Cache] Falha ao gravar resultado: {e}")
+            return
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_bytes()
+            else:
+                self._disk_bytes += len(data) - replaced
+            over_limit = self._disk_bytes > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _entries(self):
+        """[(mtime, tamanho, caminho)] dos resultados em disco."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _scan_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        """Remove os menos usados (mtime mais antigo) até _EVICT_TARGET do limite."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * _EVICT_TARGET
+        removed = 0
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+            self.evictions += removed
+
+    def clear(self) -> None:
+        """Esvazia memória e disco."""
+        with self._lock:
+            self._memory.clear()
+        for _mtime, _size, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = 0
+
+    def info(self) -> Dict:
+        """Contadores de acerto/erro e ocupação."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": True,
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "max_bytes": self.max_bytes,
+                "directory": self.directory,
+            }
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Cache do processo (None se OMR_RESULT_CACHE=false)."""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 1024 * 1024, RESULT_CACHE_MEMORY_ITEMS)
+        return _result_cache
+
+
+def result_cache_info() -> Dict:
+    cache = get_result_cache()
+    return cache.info() if cache is not None else {"enabled": False}
+
+
+@contextmanager
+def temporary_result_cache(max_bytes: int = 16 * 1024 * 1024, memory_items: int = 64) -> Iterator[Optional[ResultCache]]:
+    """
+    Troca o cache do processo por um num diretório temporário, removido no fim:
+    testes e benchmarks não acertam resultados de outras execuções nem deixam
+    arquivos em RESULT_CACHE_DIR. None com OMR_RESULT_CACHE=false.
+    """
+    global _result_cache
+    with tempfile.TemporaryDirectory(prefix="omr_result_cache_") as directory:
+        with _result_cache_lock:
+            previous = _result_cache
+            _result_cache = ResultCache(directory, max_bytes, memory_items)
+        try:
+            yield get_result_cache()
+        finally:
+            with _result_cache_lock:
+                _result_cache = previous
@@ -0,0 +1,127 @@
+"""
+Pipeline restrito à ROI do gabarito (roi_gabarito do template).
+
+O pipeline completo alinha, reduz (> 3000px), autocontrasta e binariza a página
+inteira, mas só lê as bolhas. Aqui cada etapa toca apenas a ROI, mantendo a
+mesma geometria da página inteira:
+
+- alinhamento: a mesma homografia P1-P4, composta com uma translação, gera
+  direto o recorte da ROI (em vez da página de referência inteira);
+- redução: Image.resize(box=...) reamostra só a ROI na grade da página
+  reduzida, com os mesmos coeficientes Lanczos, descartando as bordas em que o
+  kernel sairia do recorte;
+- detecção: o template é compilado para o tamanho da página (virtual) e lido
+  com deslocamento (origin) dentro do recorte.
+
+Estatística do autocontraste: o histograma (cortes de 2%) é o da ROI na página
+reduzida, não o da página inteira. É a única diferença de definição em relação
+ao pipeline completo; test_equivalence.py compara as respostas dos dois no
+corpus de calibração.
+"""
+import math
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from buffer_pool import BufferLease, take
+from fast_preprocess import binarize_lut, gray_histogram, resize_to_gray, target_size
+
+# Suporte do kernel LANCZOS do Pillow (em pixels de saída)
+LANCZOS_SUPPORT = 3.0
+
+
+class RoiPage:
+    """Recorte binarizado da ROI + onde ele fica na página (virtual) reduzida."""
+
+    __slots__ = ("bw", "origin", "page_size", "source", "source_box", "source_page_size")
+
+    def __init__(self, bw: np.ndarray, origin: Tuple[int, int], page_size: Tuple[int, int],
+                 source: Optional[np.ndarray] = None, source_box: Optional[Tuple[int, int, int, int]] = None,
+                 source_page_size: Optional[Tuple[int, int]] = None):
+        self.bw = bw
+        self.origin = origin          # (y, x) do recorte na página reduzida
+        self.page_size = page_size    # (width, height) da página reduzida
+        self.source = source                      # recorte antes da binarização
+        self.source_box = source_box              # (x0, y0, x1, y1) dele na página de trabalho
+        self.source_page_size = source_page_size  # (width, height) da página de trabalho
+
+
+def template_roi_box(template: Dict, width: int, height: int) -> Optional[Tuple[int, int, int, int]]:
+    """roi_gabarito escalada para uma página width x height: (x0, y0, x1, y1)."""
+    roi = template.get("roi_gabarito")
+    if not roi or "reference_size" not in template:
+        return None
+    scale_x = width / template["reference_size"]["width"]
+    scale_y = height / template["reference_size"]["height"]
+    x0 = max(0, int(roi["x_inicio"] * scale_x))
+    y0 = max(0, int(roi["y_inicio"] * scale_y))
+    x1 = min(width, int(roi["x_fim"] * scale_x))
+    y1 = min(height, int(roi["y_fim"] * scale_y))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+
+def warp_roi(image: np.ndarray, M: np.ndarray, box: Tuple[int, int, int, int],
+             buffers: Optional[BufferLease] = None) -> np.ndarray:
+    """cv2.warpPerspective(image, M, ref_size)[y0:y1, x0:x1] sem gerar a página inteira."""
+    x0, y0, x1, y1 = box
+    shift = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]], dtype=np.float64)
+    dst = take(buffers, (y1 - y0, x1 - x0) + image.shape[2:], image.dtype)
+    return cv2.warpPerspective(image, shift @ M, (x1 - x0, y1 - y0), dst=dst)
+
+
+def _resized_span(start: int, stop: int, size: int, new_size: int) -> Tuple[int, int]:
+    """Pixels [j0, j1) da página reduzida cujo kernel cabe inteiro em [start, stop) da original."""
+    scale = size / new_size
+    margin = LANCZOS_SUPPORT + 0.5
+    j0 = 0 if start == 0 else math.ceil(start / scale + margin)
+    j1 = new_size if stop == size else math.floor(stop / scale - margin)
+    return j0, max(j0, j1)
+
+
+def resample_roi(roi_image: np.ndarray, page_size: Tuple[int, int], box: Tuple[int, int, int, int],
+                 buffers: Optional[BufferLease] = None) -> Tuple[np.ndarray, Tuple[int, int], Tuple[int, int]]:
+    """
+    Cinza do recorte roi_image, que ocupa box=(x0, y0, x1, y1) numa página
+    page_size=(width, height), na mesma grade que preprocess_array(página) usaria:
+    (cinza, origin (y, x) dele na página reduzida, (width, height) da página reduzida).
+    """
+    width, height = page_size
+    x0, y0, x1, y1 = box
+    new_size = target_size(width, height)
+    if new_size is None:
+        gray = resize_to_gray(roi_image, None, buffers=buffers)
+        origin = (y0, x0)
+        page = (width, height)
+    else:
+        new_w, new_h = new_size
+        jx0, jx1 = _resized_span(x0, x1, width, new_w)
+        jy0, jy1 = _resized_span(y0, y1, height, new_h)
+        scale_x = width / new_w
+        scale_y = height / new_h
+        resample_box = (jx0 * scale_x - x0, jy0 * scale_y - y0, jx1 * scale_x - x0, jy1 * scale_y - y0)
+        gray = resize_to_gray(roi_image, (jx1 - jx0, jy1 - jy0), box=resample_box, buffers=buffers)
+        origin = (jy0, jx0)
+        page = (new_w, new_h)
+    return gray, origin, page
+
+
+def preprocess_roi(roi_image: np.ndarray, page_size: Tuple[int, int], box: Tuple[int, int, int, int],
+                   buffers: Optional[BufferLease] = None) -> RoiPage:
+    """
+    Binariza (0/1) o recorte roi_image, que ocupa box=(x0, y0, x1, y1) numa página
+    page_size=(width, height), na mesma grade que preprocess_array(página) usaria.
+    """
+    gray, origin, page = resample_roi(roi_image, page_size, box, buffers)
+    bw = cv2.LUT(gray, binarize_lut(gray_histogram(gray)), dst=take(buffers, gray.shape))
+    return RoiPage(bw, origin, page, roi_image, box, page_size)
+
+
+def roi_contains(page: RoiPage, bubble_roi: np.ndarray) -> bool:
+    """True se a caixa das bolhas (y1, y2, x1, x2 na página) está dentro do recorte."""
+    oy, ox = page.origin
+    h, w = page.bw.shape
+    by1, by2, bx1, bx2 = (int(v) for v in bubble_roi)
+    return by1 >= oy and bx1 >= ox and by2 <= oy + h and bx2 <= ox + w
@@ -31,5 +31,10 @@ echo "   Serviço disponível em: http://localhost:5002"
 echo "   (Porta 5002 para evitar conflito com AirPlay no macOS)"
 echo ""
 
+# Produção (gunicorn, um worker por núcleo): ./start_service.sh prod
+if [ "$1" = "prod" ]; then
+    exec gunicorn -c gunicorn.conf.py app:app
+fi
+
 python app.py
 
@@ -0,0 +1,82 @@
+"""
+Perfil de inicialização (cold start) do serviço.
+
+Em deploy com autoscaling cada processo novo paga os imports (Flask, NumPy,
+OpenCV) e o primeiro acesso aos caminhos quentes (pools de thread do OpenCV,
+plugins do PIL, tabelas). Este módulo registra a duração de cada fase para
+o /health e separa as duas perguntas do orquestrador:
+
+- vivo (liveness): o processo responde HTTP;
+- pronto (readiness): imports feitos e aquecimento concluído (mark_ready).
+
+Dependências raramente usadas (pdf2image, cliente HTTP da validação) são
+importadas com lazy_import no primeiro uso, que também entra no perfil.
+"""
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, Optional
+import importlib
+import os
+import time
+
+
+class StartupProfile:
+    """Durações (ms) das fases de inicialização de um processo."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.lazy_imports: Dict[str, float] = {}
+        self.ready = False
+        self.ready_after: Optional[float] = None
+        self._lock = Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 2)
+
+    def lazy_import(self, module: str):
+        """importlib.import_module, registrando o tempo da primeira importação."""
+        if module in self.lazy_imports:
+            return importlib.import_module(module)
+        with self._lock:
+            start = time.perf_counter()
+            loaded = importlib.import_module(module)
+            self.lazy_imports.setdefault(module, round((time.perf_counter() - start) * 1000, 2))
+        return loaded
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        self.ready_after = round((time.perf_counter() - self._start) * 1000, 2)
+
+    def summary(self) -> str:
+        """Uma linha para o log: fases e tempo total até pronto."""
+        phases = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.phases.items())
+        return f"{phases} | pronto em {self.ready_after or 0:.0f} ms"
+
+    def info(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "ready": self.ready,
+            "ready_after_ms": self.ready_after,
+            "phases_ms": dict(self.phases),
+            "lazy_imports_ms": dict(self.lazy_imports),
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+
+_profile = StartupProfile()
+
+
+def startup_profile() -> StartupProfile:
+    """Perfil do processo atual (workers do gunicorn herdam as fases de import do master)."""
+    return _profile
+
+
+def lazy_import(module: str):
+    return _profile.lazy_import(module)
@@ -0,0 +1,238 @@
+"""
+Folhas de resposta sintéticas com gabarito conhecido (ground truth).
+
+Renderiza qualquer template de AVAILABLE_TEMPLATES no tamanho de referência:
+contorno de todas as bolhas, marcadores P1-P4 e as marcações do aluno
+(simples, em branco ou duplas), seguidas das distorções de uma digitalização
+real: escala, rotação, desfoque, ruído e artefatos de JPEG.
+
+    rng = np.random.default_rng(7)
+    sheet = generate_sheet(template, rng, SheetOptions(rotation=1.5, noise=8, jpeg_quality=60))
+    sheet.image          # np.ndarray RGB
+    sheet.encode()       # bytes PNG/JPEG (o que o cliente enviaria)
+    sheet.truth          # dict serializável em JSON (respostas esperadas + distorções)
+
+    python synthetic_sheets.py --template enem90_v5 --count 20 --rotation 1.5 --jpeg-quality 60 --out /tmp/folhas
+
+Questões com marcação dupla ficam em truth["marks"] com as duas letras e
+truth["questoes"] = None: o detector escolhe a mais escura e o resultado
+compacto sinaliza FLAG_MULTIPLE, então elas não entram na contagem de acertos.
+"""
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+import json
+
+import cv2
+import numpy as np
+
+from compiled_template import get_compiled_template, template_name
+from omr_result import NO_ANSWER
+
+# Folha usada para templates normalizados (sem reference_size): A4 a 150 DPI
+DEFAULT_PAGE_SIZE = (1240, 1754)
+
+MARK_HALF_SIZE = 12     # marcadores P1-P4: quadrados de 25 px
+PAPER = 245
+RING = 150              # contorno impresso das bolhas
+
+
+def template_page_size(template: Dict) -> Tuple[int, int]:
+    """(width, height) de referência do template."""
+    if "reference_size" in template:
+        return template["reference_size"]["width"], template["reference_size"]["height"]
+    return DEFAULT_PAGE_SIZE
+
+
+@dataclass
+class SheetOptions:
+    """Marcações e distorções de uma folha sintética (valores padrão = folha limpa)."""
+
+    blank_rate: float = 0.05        # fração de questões em branco
+    double_rate: float = 0.0        # fração de questões com duas alternativas marcadas
+    fill: float = 0.85              # raio da marcação / raio da bolha
+    ink: int = 40                   # tom da caneta (0 = preto)
+    rotation: float = 0.0           # graus (sentido anti-horário)
+    scale: float = 1.0              # fator sobre o tamanho de referência
+    blur: float = 0.0               # sigma do desfoque gaussiano (px)
+    noise: float = 0.0              # desvio-padrão do ruído gaussiano (níveis de cinza)
+    jpeg_quality: Optional[int] = None   # None = PNG sem perdas
+
+
+@dataclass
+class SyntheticSheet:
+    image: np.ndarray
+    truth: Dict
+    data: Optional[bytes] = None    # JPEG da geração (jpeg_quality) ou PNG gerado em encode()
+
+    def encode(self) -> bytes:
+        """Bytes da folha como chegariam ao serviço (o JPEG da geração, ou PNG sem perdas)."""
+        if self.data is None:
+            ok, buffer = cv2.imencode(".png", cv2.cvtColor(self.image, cv2.COLOR_RGB2BGR),
+                                      [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            if not ok:
+                raise ValueError("Falha ao codificar a folha sintética")
+            self.data = buffer.tobytes()
+        return self.data
+
+    def truth_json(self) -> str:
+        return json.dumps(self.truth, ensure_ascii=False)
+
+
+def random_marks(template: Dict, rng: np.random.Generator, options: SheetOptions) -> Dict[str, List[str]]:
+    """{questão: alternativas marcadas} ([] = em branco, 2 letras = marcação dupla)."""
+    compiled = get_compiled_template(template, *template_page_size(template))
+    letters = compiled.options
+    marks = {}
+    for key in compiled.question_keys:
+        draw = rng.random()
+        if draw < options.blank_rate:
+            marks[key] = []
+        elif draw < options.blank_rate + options.double_rate and len(letters) >= 2:
+            marks[key] = sorted(rng.choice(letters, size=2, replace=False).tolist(), key=letters.index)
+        else:
+            marks[key] = [letters[int(rng.integers(len(letters)))]]
+    return marks
+
+
+def registration_homography(template: Dict) -> Optional[np.ndarray]:
+    """
+    Homografia página de referência → folha impressa. O alinhamento do serviço
+    leva P1-P4 aos cantos da página de referência (onde valem as coordenadas
+    das questões); a folha impressa tem P1-P4 nas posições registration_marks.
+    """
+    if "registration_marks" not in template or "reference_size" not in template:
+        return None
+    width, height = template_page_size(template)
+    marks = template["registration_marks"]
+    corners = np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+    printed = np.float32([marks["p1"], marks["p2"], marks["p3"], marks["p4"]])
+    return cv2.getPerspectiveTransform(corners, printed)
+
+
+def render_marks(template: Dict, marks: Dict[str, List[str]], fill: float = 0.85, ink: int = 40) -> np.ndarray:
+    """Folha limpa (RGB, tamanho de referência) com as marcações dadas."""
+    width, height = template_page_size(template)
+    sheet = np.full((height, width, 3), PAPER, dtype=np.uint8)
+    compiled = get_compiled_template(template, width, height)
+    radius = compiled.radius
+    for row, key in enumerate(compiled.question_keys):
+        for col, letter in enumerate(compiled.options):
+            center = tuple(compiled.centers[row, col].tolist())
+            cv2.circle(sheet, center, radius, (RING,) * 3, 1, cv2.LINE_AA)
+            if letter in marks.get(key, ()):
+                cv2.circle(sheet, center, max(1, int(radius * fill)), (ink,) * 3, -1, cv2.LINE_AA)
+    M = registration_homography(template)
+    if M is not None:
+        sheet = cv2.warpPerspective(sheet, M, (width, height), flags=cv2.INTER_AREA, borderValue=(PAPER,) * 3)
+        for x, y in template["registration_marks"].values():
+            sheet[y - MARK_HALF_SIZE:y + MARK_HALF_SIZE + 1, x - MARK_HALF_SIZE:x + MARK_HALF_SIZE + 1] = 0
+    return sheet
+
+
+def distort(image: np.ndarray, options: SheetOptions, rng: np.random.Generator) -> np.ndarray:
+    """Escala, rotação, desfoque e ruído (o JPEG é aplicado na codificação)."""
+    if options.scale != 1.0:
+        h, w = image.shape[:2]
+        size = (max(1, int(round(w * options.scale))), max(1, int(round(h * options.scale))))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA if options.scale < 1 else cv2.INTER_LINEAR)
+    if options.rotation:
+        h, w = image.shape[:2]
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), options.rotation, 1.0)
+        image = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_LINEAR, borderValue=(PAPER,) * 3)
+    if options.blur > 0:
+        image = cv2.GaussianBlur(image, (0, 0), options.blur)
+    if options.noise > 0:
+        noisy = image.astype(np.int16) + rng.normal(0, options.noise, image.shape[:2])[..., None].astype(np.int16)
+        image = np.clip(noisy, 0, 255).astype(np.uint8)
+    return image
+
+
+def expected_answers(marks: Dict[str, List[str]], total_questions: int) -> Dict[str, Optional[str]]:
+    """Respostas esperadas no formato de resultado.questoes (None = marcação dupla)."""
+    answers: Dict[str, Optional[str]] = {}
+    for q in range(1, total_questions + 1):
+        marked = marks.get(str(q), [])
+        answers[str(q)] = marked[0] if len(marked) == 1 else (None if marked else NO_ANSWER)
+    return answers
+
+
+def generate_sheet(template: Dict, rng: np.random.Generator, options: Optional[SheetOptions] = None,
+                   marks: Optional[Dict[str, List[str]]] = None) -> SyntheticSheet:
+    """Folha sintética do template com marcações aleatórias (ou `marks`) e as distorções de `options`."""
+    options = options or SheetOptions()
+    if marks is None:
+        marks = random_marks(template, rng, options)
+    image = distort(render_marks(template, marks, options.fill, options.ink), options, rng)
+    data = None
+    if options.jpeg_quality:
+        # Artefatos já na imagem: .image e .encode() descrevem a mesma folha
+        ok, buffer = cv2.imencode(".jpg", cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                                  [cv2.IMWRITE_JPEG_QUALITY, options.jpeg_quality])
+        data = buffer.tobytes()
+        image = cv2.cvtColor(cv2.imdecode(buffer, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    truth = {
+        "template": template_name(template),
+        "size": [int(image.shape[1]), int(image.shape[0])],
+        "options": asdict(options),
+        "marks": marks,
+        "questoes": expected_answers(marks, template.get("total_questions", len(marks))),
+    }
+    return SyntheticSheet(image, truth, data)
+
+
+def score(answers: Dict[str, str], truth: Dict) -> Dict:
+    """
+    Acertos da leitura contra o gabarito, separados em questões marcadas e em
+    branco (questões com marcação dupla não contam).
+    """
+    expected = {q: a for q, a in truth["questoes"].items() if a is not None}
+    wrong = sorted((q for q, a in expected.items() if answers.get(q) != a), key=int)
+    blank = [q for q, a in expected.items() if a == NO_ANSWER]
+    blank_errors = sum(1 for q in blank if q in wrong)
+    marked = len(expected) - len(blank)
+    return {
+        "questions": len(expected),
+        "errors": len(wrong),
+        "wrong": wrong,
+        "accuracy": 1.0 - (len(wrong) - blank_errors) / marked if marked else 1.0,
+        "blank_questions": len(blank),
+        "blank_errors": blank_errors,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Gera folhas + gabaritos (sheet_000.png/.jpg + sheet_000.json) num diretório."""
+    import argparse
+    import os
+
+    from template_registry import template_registry
+
+    parser = argparse.ArgumentParser(description="Gera folhas de resposta sintéticas com gabarito")
+    parser.add_argument("--template", default="enem90_v5")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--out", default="synthetic_sheets")
+    parser.add_argument("--seed", type=int, default=7)
+    defaults = SheetOptions()
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value) if value is not None else int,
+                            default=value)
+    args = parser.parse_args(argv)
+
+    templates = template_registry().templates
+    if args.template not in templates:
+        parser.error(f"template desconhecido: {args.template} (disponíveis: {sorted(templates)})")
+    options = SheetOptions(**{field: getattr(args, field) for field in asdict(defaults)})
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+    extension = "jpg" if options.jpeg_quality else "png"
+    for i in range(args.count):
+        sheet = generate_sheet(templates[args.template], rng, options)
+        with open(os.path.join(args.out, f"sheet_{i:03d}.{extension}"), "wb") as f:
+            f.write(sheet.encode())
+        with open(os.path.join(args.out, f"sheet_{i:03d}.json"), "w", encoding="utf-8") as f:
+            f.write(sheet.truth_json())
+    print(f"{args.count} folhas em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
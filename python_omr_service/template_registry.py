@@ -0,0 +1,288 @@
+"""
+Registro de templates de gabarito: definições em JSON num diretório.
+
+- Cada templates/<nome>.json é validado (validate_definition) e compilado
+  para um .npz em templates/.compiled/ (arrays de coordenadas + metadados),
+  identificado pelo hash do JSON. Nas cargas seguintes o .npz é lido direto,
+  sem parse do JSON nem validação.
+- refresh() olha o diretório (no máximo a cada OMR_TEMPLATES_RELOAD_SECONDS):
+  JSON novo ou alterado é recarregado no próprio worker, sem restart. Uma
+  definição inválida é registrada no log e a versão anterior continua valendo.
+- O dict `templates` é sempre o mesmo objeto (atualizado no lugar), então
+  quem guardou a referência (AVAILABLE_TEMPLATES) enxerga as recargas.
+
+Layout novo para um cliente = um JSON novo no diretório.
+"""
+from threading import Lock
+from typing import Dict, List, Optional
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from compiled_template import clear_template_cache
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.getenv("OMR_TEMPLATES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+TEMPLATES_COMPILED_DIR = os.getenv("OMR_TEMPLATES_COMPILED_DIR", os.path.join(TEMPLATES_DIR, ".compiled"))
+TEMPLATES_RELOAD_SECONDS = float(os.getenv("OMR_TEMPLATES_RELOAD_SECONDS", "5"))
+
+# Versão do formato .npz (mudar invalida os compilados antigos)
+COMPILED_FORMAT = 1
+
+MARK_NAMES = ("p1", "p2", "p3", "p4")
+ROI_KEYS = ("y_inicio", "y_fim", "x_inicio", "x_fim")
+
+
+class TemplateError(ValueError):
+    """Definição de template inválida."""
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _require(condition: bool, message: str) -> None:
+    if not condition:
+        raise TemplateError(message)
+
+
+def validate_definition(definition: Dict) -> None:
+    """
+    Valida a estrutura de um template. Dois formatos:
+    - coordenadas de referência: reference_size + questions [{id, y, x_positions}]
+    - normalizado (0-1): option_x + question_y
+    Levanta TemplateError com o campo problemático.
+    """
+    _require(isinstance(definition, dict), "template deve ser um objeto JSON")
+    name = definition.get("name")
+    _require(isinstance(name, str) and name and name == name.lower(), "name: string minúscula obrigatória")
+    total = definition.get("total_questions")
+    _require(_is_int(total) and total > 0, "total_questions: inteiro > 0")
+    options = definition.get("options")
+    _require(isinstance(options, list) and options and all(isinstance(o, str) and o for o in options),
+             "options: lista de strings")
+    _require(len(set(options)) == len(options), "options: alternativas repetidas")
+
+    if "questions" in definition:
+        size = definition.get("reference_size")
+        _require(isinstance(size, dict) and _is_int(size.get("width")) and _is_int(size.get("height"))
+                 and size["width"] > 0 and size["height"] > 0, "reference_size: {width, height} inteiros > 0")
+        questions = definition["questions"]
+        _require(isinstance(questions, list) and questions, "questions: lista não vazia")
+        _require(len(questions) <= total, "questions: mais questões que total_questions")
+        ids = set()
+        for i, q in enumerate(questions):
+            _require(isinstance(q, dict) and _is_int(q.get("id")), f"questions[{i}].id: inteiro")
+            _require(q["id"] not in ids, f"questions[{i}].id: {q['id']} repetido")
+            ids.add(q["id"])
+            _require(_is_number(q.get("y")) and 0 <= q["y"] < size["height"], f"questions[{i}].y fora da página")
+            xs = q.get("x_positions")
+            _require(isinstance(xs, list) and len(xs) == len(options)
+                     and all(_is_number(x) and 0 <= x < size["width"] for x in xs),
+                     f"questions[{i}].x_positions: {len(options)} posições dentro da página")
+        if "bubble_radius" in definition:
+            _require(_is_number(definition["bubble_radius"]) and definition["bubble_radius"] > 0,
+                     "bubble_radius: número > 0")
+        marks = definition.get("registration_marks")
+        if marks is not None:
+            _require(isinstance(marks, dict) and sorted(marks) == list(MARK_NAMES), "registration_marks: p1..p4")
+            for mark, point in marks.items():
+                _require(isinstance(point, (list, tuple)) and len(point) == 2 and all(_is_int(v) for v in point)
+                         and 0 <= point[0] < size["width"] and 0 <= point[1] < size["height"],
+                         f"registration_marks.{mark}: [x, y] inteiros dentro da página")
+        roi = definition.get("roi_gabarito")
+        if roi is not None:
+            _require(isinstance(roi, dict) and all(_is_int(roi.get(k)) for k in ROI_KEYS),
+                     f"roi_gabarito: {', '.join(ROI_KEYS)} inteiros")
+            _require(roi["y_inicio"] < roi["y_fim"] and roi["x_inicio"] < roi["x_fim"], "roi_gabarito: início >= fim")
+    else:
+        option_x = definition.get("option_x")
+        question_y = definition.get("question_y")
+        _require(isinstance(option_x, list) and len(option_x) == len(options)
+                 and all(_is_number(x) and 0 <= x <= 1 for x in option_x),
+                 f"option_x: {len(options)} posições normalizadas (0-1)")
+        _require(isinstance(question_y, list) and len(question_y) >= total
+                 and all(_is_number(y) and 0 <= y <= 1 for y in question_y),
+                 "question_y: uma posição normalizada (0-1) por questão")
+
+
+def _normalize(definition: Dict) -> Dict:
+    """Marcadores como tuplas (como nos templates em código)."""
+    if "registration_marks" in definition:
+        definition["registration_marks"] = {k: tuple(v) for k, v in definition["registration_marks"].items()}
+    return definition
+
+
+def compile_definition(definition: Dict) -> bytes:
+    """Definição validada -> .npz: questões como arrays, o resto como JSON."""
+    meta = {k: v for k, v in definition.items() if k != "questions"}
+    arrays = {"format": np.array(COMPILED_FORMAT), "meta": np.array(json.dumps(meta, ensure_ascii=False))}
+    if "questions" in definition:
+        questions = definition["questions"]
+        arrays["question_ids"] = np.array([q["id"] for q in questions], dtype=np.int64)
+        arrays["question_y"] = np.array([q["y"] for q in questions])
+        arrays["question_x"] = np.array([q["x_positions"] for q in questions])
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def load_compiled(data: bytes) -> Dict:
+    """Inverso de compile_definition."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        if int(npz["format"]) != COMPILED_FORMAT:
+            raise TemplateError("formato compilado antigo")
+        definition = json.loads(str(npz["meta"]))
+        if "question_ids" in npz:
+            definition["questions"] = [
+                {"id": q_id, "y": y, "x_positions": xs}
+                for q_id, y, xs in zip(npz["question_ids"].tolist(), npz["question_y"].tolist(),
+                                       npz["question_x"].tolist())
+            ]
+    return definition
+
+
+class TemplateRegistry:
+    """Templates carregados de um diretório de JSONs, com recarga a quente."""
+
+    def __init__(self, directory: str = TEMPLATES_DIR, compiled_dir: str = TEMPLATES_COMPILED_DIR,
+                 reload_seconds: float = TEMPLATES_RELOAD_SECONDS):
+        self.directory = directory
+        self.compiled_dir = compiled_dir
+        self.reload_seconds = reload_seconds
+        self.templates: Dict[str, Dict] = {}
+        self.errors: Dict[str, str] = {}
+        self._files: Dict[str, tuple] = {}      # caminho -> (mtime_ns, size, nome)
+        self._revisions: Dict[str, str] = {}    # nome -> hash do JSON
+        self._lock = Lock()
+        self._last_scan = 0.0
+        # Templates que não saem do registro se o JSON sumir (o padrão do serviço)
+        self.required: set = set()
+
+    def _compiled_path(self, stem: str, revision: str) -> str:
+        return os.path.join(self.compiled_dir, f"{stem}.{revision}.npz")
+
+    def _load_file(self, path: str) -> Dict:
+        """Carrega um JSON (pelo .npz compilado se existir para este conteúdo)."""
+        with open(path, "rb") as f:
+            raw = f.read()
+        revision = hashlib.sha256(raw).hexdigest()[:16]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        compiled_path = self._compiled_path(stem, revision)
+        try:
+            with open(compiled_path, "rb") as f:
+                definition = load_compiled(f.read())
+        except (OSError, ValueError, KeyError):
+            try:
+                definition = json.loads(raw)
+            except ValueError as e:
+                raise TemplateError(f"JSON inválido: {e}")
+            validate_definition(definition)
+            _require(definition["name"] == stem, f"name '{definition['name']}' diferente do arquivo '{stem}.json'")
+            data = compile_definition(definition)
+            self._write_compiled(stem, revision, data)
+            # Mesma forma da carga pelo .npz (tipos numéricos iguais em todos os workers)
+            definition = load_compiled(data)
+        self._revisions[stem] = revision
+        return _normalize(definition)
+
+    def _write_compiled(self, stem: str, revision: str, data: bytes) -> None:
+        """Grava o .npz (atômico) e remove versões antigas do mesmo template."""
+        try:
+            os.makedirs(self.compiled_dir, exist_ok=True)
+            target = self._compiled_path(stem, revision)
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+            for entry in os.scandir(self.compiled_dir):
+                if entry.name.startswith(f"{stem}.") and entry.name.endswith(".npz") and entry.path != target:
+                    os.remove(entry.path)
+        except OSError as e:
+            # Diretório só leitura: segue com a definição do JSON
+            logger.warning(f"[Templates] Não foi possível gravar o compilado de {stem}: {e}")
+
+    def _scan(self) -> Dict[str, tuple]:
+        found = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError as e:
+            logger.error(f"[Templates] Diretório {self.directory}: {e}")
+            return found
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                found[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return found
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """Recarrega templates novos/alterados/removidos; retorna os nomes que mudaram."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_scan < self.reload_seconds:
+                return []
+            self._last_scan = now
+            changed = []
+            found = self._scan()
+            for path, signature in sorted(found.items()):
+                previous = self._files.get(path)
+                if previous is not None and previous[:2] == signature:
+                    continue
+                stem = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    definition = self._load_file(path)
+                except (OSError, TemplateError) as e:
+                    logger.error(f"[Templates] {os.path.basename(path)} ignorado: {e}")
+                    self.errors[stem] = str(e)
+                    # Não tenta de novo até o arquivo mudar; a versão anterior continua
+                    self._files[path] = signature + (previous[2] if previous else None,)
+                    continue
+                self.errors.pop(stem, None)
+                self._files[path] = signature + (stem,)
+                if stem in self.templates:
+                    clear_template_cache(stem)
+                self.templates[stem] = definition
+                changed.append(stem)
+            for path in [p for p in self._files if p not in found]:
+                stem = self._files.pop(path)[2]
+                if stem in self.required:
+                    logger.error(f"[Templates] {stem}.json removido; mantendo a versão carregada (template obrigatório)")
+                    continue
+                if stem is not None and self.templates.pop(stem, None) is not None:
+                    clear_template_cache(stem)
+                    self._revisions.pop(stem, None)
+                    changed.append(stem)
+            return changed
+
+    def info(self) -> Dict:
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "templates": {name: self._revisions.get(name) for name in sorted(self.templates)},
+                "errors": dict(self.errors),
+                "reload_seconds": self.reload_seconds,
+            }
+
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = Lock()
+
+
+def template_registry() -> TemplateRegistry:
+    """Registro do processo (carregado no primeiro uso)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry()
+            _registry.refresh(force=True)
+        return _registry
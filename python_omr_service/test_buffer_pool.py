@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Pool de buffers (buffer_pool.py):
+
+- take/give reaproveitam por (shape, dtype) e respeitam o limite de bytes
+- páginas lidas com buffers do pool dão o mesmo resultado que sem pool, e
+  buffers reaproveitados (com lixo da página anterior) não vazam para a
+  página seguinte
+- alocações e RSS ficam estáveis numa sequência longa de folhas
+
+Uso:
+    python test_buffer_pool.py
+    python -m pytest test_buffer_pool.py
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from buffer_pool import BufferLease, BufferPool, buffer_pool  # noqa: E402
+from metrics import memory_status  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+TEMPLATE = "enem90_v5"
+
+
+def test_pool_reuse_and_limit():
+    pool = BufferPool(max_bytes=3000, enabled=True)
+    with BufferLease(pool) as lease:
+        a = lease.take((10, 100))
+        b = lease.take((10, 100), np.int32)
+    assert pool.info()["free_buffers"] == 1 and pool.evictions == 0   # int32 (4000 B) passa do limite
+    with BufferLease(pool) as lease:
+        assert lease.take((10, 100)) is a
+        assert lease.take((10, 100), np.int32) is not b
+    assert pool.allocations == 3 and pool.reuses == 1
+
+    outer, inner = BufferLease(pool), BufferLease(pool)
+    kept = inner.take((5, 5))
+    inner.transfer(kept, outer)
+    inner.release()
+    assert pool.take((5, 5)) is not kept
+    outer.release()
+    assert pool.take((5, 5)) is kept
+
+
+def test_pooled_pages_match_and_stay_flat():
+    template = app.AVAILABLE_TEMPLATES[TEMPLATE]
+    rng = np.random.default_rng(5)
+    images = [app.decode_image_bytes(generate_sheet(template, rng, SheetOptions(noise=4)).encode(), TEMPLATE)
+              for _ in range(3)]
+    expected = [app.read_omr_page(image, template_name=TEMPLATE)[0] for image in images]
+
+    pool = buffer_pool()
+    if not pool.enabled:
+        return
+    for image in images:
+        app.process_omr_page(image, template_name=TEMPLATE)
+    allocations = pool.allocations
+    rss = []
+    for n in range(30):
+        # Buffers reaproveitados trazem a página anterior: o resultado tem que ser o da folha atual
+        assert app.process_omr_page(images[n % 3], template_name=TEMPLATE) == expected[n % 3]
+        status = memory_status()
+        if status is not None:
+            rss.append(status[0])
+    assert pool.allocations == allocations, "o caminho quente voltou a alocar"
+    if rss:
+        assert rss[-1] - rss[4] < 16 * 1024 * 1024, f"RSS cresceu {(rss[-1] - rss[4]) / 2 ** 20:.1f} MB"
+
+    batch = app.process_omr_pages(list(enumerate(images, start=1)), TEMPLATE)
+    assert [page["resultado"] for page in batch] == [page["resultado"] for page in expected]
+
+
+if __name__ == "__main__":
+    for test in (test_pool_reuse_and_limit, test_pooled_pages_match_and_stay_flat):
+        test()
+        print(f"✅ {test.__name__}")
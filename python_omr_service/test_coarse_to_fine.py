@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Leitura em dois níveis (coarse_to_fine.py):
+
+- folhas sintéticas (rotação, escala, desfoque, ruído, JPEG) e a folha de
+  calibração: mesmas respostas de detect_bubbles_fixed em todas as questões
+  marcadas; as em branco e as com duas marcações são relidas no nível fino
+- process_omr_pages(coarse=True): resultado marcado "coarse_to_fine", com as
+  questões relidas em /metrics; template pequeno demais para o nível grosso
+  (enem45) cai no pipeline completo
+
+Uso:
+    python test_coarse_to_fine.py
+    python -m pytest test_coarse_to_fine.py
+"""
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from coarse_to_fine import read_coarse_to_fine  # noqa: E402
+from omr_result import NO_ANSWER  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+CALIBRATION_SHEET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "attached_assets",
+                                 "gabarito_pintado.png")
+
+SCANS = (
+    SheetOptions(noise=4),
+    SheetOptions(rotation=1.0, blur=0.8, noise=6, jpeg_quality=75),
+    SheetOptions(rotation=-0.8, scale=1.5, noise=4, jpeg_quality=85),
+)
+
+
+def _fixed(image, template):
+    working, _ = app.align_with_registration_marks(image, template)
+    answers, _ = app.detect_bubbles_fixed(app.preprocess_pil_image(Image.fromarray(working)), template)
+    return answers
+
+
+def _coarse(image, template):
+    M, _info = app.registration_transform(image, template)
+    return read_coarse_to_fine(image, template, M)
+
+
+def test_marked_answers_match_fixed():
+    rng = np.random.default_rng(25)
+    for name in ("enem90", "enem90_v5"):
+        template = app.AVAILABLE_TEMPLATES[name]
+        for options in SCANS:
+            sheet = generate_sheet(template, rng, SheetOptions(**{**options.__dict__, "double_rate": 0.03}))
+            image = app.decode_image_bytes(sheet.encode(), name)
+            reference = _fixed(image, template)
+            reading = _coarse(image, template)
+            answers = reading.sheet.to_dict()
+            truth = sheet.truth["questoes"]
+            unclear = [q for q, a in truth.items() if a is None or a == NO_ANSWER]
+            assert reading.factor >= 2 and reading.refined >= len(unclear), (name, options, reading.refined)
+            marked = [q for q in truth if q not in unclear]
+            assert [answers[q] for q in marked] == [reference[q] for q in marked], (name, options)
+
+    if os.path.exists(CALIBRATION_SHEET):
+        template = app.AVAILABLE_TEMPLATES["enem90_v5"]
+        image = np.array(Image.open(CALIBRATION_SHEET))
+        assert _coarse(image, template).sheet.to_dict() == _fixed(image, template)
+
+
+def test_process_omr_pages_coarse():
+    template_key = "enem90_v5"
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    rng = np.random.default_rng(26)
+    options = SheetOptions(blank_rate=0.0, rotation=0.6, noise=5, jpeg_quality=80)
+    pages = [(n, app.decode_image_bytes(generate_sheet(template, rng, options).encode(), template_key))
+             for n in (1, 2)]
+    fine_before = app.C2F_QUESTIONS.value(template_key, "fine")
+    coarse_before = app.C2F_QUESTIONS.value(template_key, "coarse")
+
+    coarse = app.process_omr_pages(pages, template_key, coarse=True)
+    full = app.process_omr_pages(pages, template_key, coarse=False)
+    for c, f in zip(coarse, full):
+        assert c["pipeline"] == "coarse_to_fine" and "pipeline" not in f
+        assert c["resultado"] == f["resultado"] and c["alinhamento"] == f["alinhamento"]
+    assert app.process_omr_page(pages[0][1], 1, template_name=template_key, coarse=True) == coarse[0]
+
+    app.count_pages(coarse, template_key)
+    refined = sum(page["refinadas"] for page in coarse)
+    assert app.C2F_QUESTIONS.value(template_key, "fine") == fine_before + refined
+    assert app.C2F_QUESTIONS.value(template_key, "coarse") == coarse_before + 2 * 90 - refined
+
+    # enem45: bolha pequena demais para o nível grosso
+    sheet = generate_sheet(app.AVAILABLE_TEMPLATES["enem45"], rng, SheetOptions(blank_rate=0.0))
+    small = app.process_omr_pages([(1, sheet.image)], "enem45", coarse=True)
+    assert "pipeline" not in small[0]
+    assert small == app.process_omr_pages([(1, sheet.image)], "enem45", coarse=False)
+
+
+if __name__ == "__main__":
+    for test in (test_marked_answers_match_fixed, test_process_omr_pages_coarse):
+        test()
+        print(f"✅ {test.__name__}")
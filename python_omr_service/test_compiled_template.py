@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Cache de templates compilados (compiled_template.py):
+
+- acerto devolve o mesmo objeto e vira o mais recente da LRU
+- acima de OMR_TEMPLATE_CACHE_SIZE sai o menos usado, não o mais antigo
+- mesmo nome com outro dict (template recarregado): recompila e substitui
+- clear_template_cache(nome) só invalida as entradas daquele template
+- template_cache_info reflete o estado para /health
+
+Uso:
+    python test_compiled_template.py
+    python -m pytest test_compiled_template.py
+"""
+from contextlib import contextmanager
+import copy
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import compiled_template  # noqa: E402
+from compiled_template import clear_template_cache, get_compiled_template, template_cache_info  # noqa: E402
+
+TEMPLATE = {
+    "name": "teste_lru",
+    "reference_size": {"width": 1000, "height": 1400},
+    "bubble_radius": 10,
+    "options": ["A", "B", "C"],
+    "total_questions": 2,
+    "questions": [
+        {"id": 1, "y": 500, "x_positions": [100, 200, 300]},
+        {"id": 2, "y": 600, "x_positions": [100, 200, 300]},
+    ],
+}
+
+
+@contextmanager
+def _cache_size(size):
+    """Cache vazio com TEMPLATE_CACHE_SIZE = size; restaura o tamanho no fim."""
+    previous = compiled_template.TEMPLATE_CACHE_SIZE
+    compiled_template.TEMPLATE_CACHE_SIZE = size
+    clear_template_cache()
+    try:
+        yield
+    finally:
+        compiled_template.TEMPLATE_CACHE_SIZE = previous
+        clear_template_cache()
+
+
+def _entries():
+    return template_cache_info()["entries"]
+
+
+def test_hit_returns_same_object():
+    with _cache_size(4):
+        compiled = get_compiled_template(TEMPLATE, 1000, 1400)
+        assert get_compiled_template(TEMPLATE, 1000, 1400) is compiled
+        # Tamanhos float do mesmo pixel caem na mesma chave
+        assert get_compiled_template(TEMPLATE, 1000.0, 1400.0) is compiled
+        assert get_compiled_template(TEMPLATE, 500, 700) is not compiled
+        assert template_cache_info() == {"size": 2, "max_size": 4,
+                                         "entries": ["teste_lru@1000x1400", "teste_lru@500x700"]}
+
+
+def test_lru_evicts_least_recently_used():
+    with _cache_size(3):
+        first = get_compiled_template(TEMPLATE, 100, 140)
+        get_compiled_template(TEMPLATE, 200, 280)
+        get_compiled_template(TEMPLATE, 300, 420)
+        # Acerto move 100x140 para o fim: quem sai é 200x280
+        assert get_compiled_template(TEMPLATE, 100, 140) is first
+        assert _entries() == ["teste_lru@200x280", "teste_lru@300x420", "teste_lru@100x140"]
+
+        get_compiled_template(TEMPLATE, 400, 560)
+        assert _entries() == ["teste_lru@300x420", "teste_lru@100x140", "teste_lru@400x560"]
+        assert template_cache_info()["size"] == 3
+        assert get_compiled_template(TEMPLATE, 100, 140) is first
+
+        # Entrada despejada é compilada de novo (e quem sai agora é 300x420)
+        second = get_compiled_template(TEMPLATE, 200, 280)
+        assert _entries() == ["teste_lru@400x560", "teste_lru@100x140", "teste_lru@200x280"]
+        assert second.width == 200 and second.height == 280
+
+
+def test_reloaded_template_recompiles():
+    with _cache_size(4):
+        compiled = get_compiled_template(TEMPLATE, 1000, 1400)
+        assert compiled.centers[0, 0, 1] == 500
+
+        # Mesmo nome, outro dict (registro recarregado): a geometria nova vale
+        reloaded = copy.deepcopy(TEMPLATE)
+        reloaded["questions"][0]["y"] = 700
+        recompiled = get_compiled_template(reloaded, 1000, 1400)
+        assert recompiled is not compiled and recompiled.template is reloaded
+        assert recompiled.centers[0, 0, 1] == 700
+        assert template_cache_info()["size"] == 1
+        assert get_compiled_template(reloaded, 1000, 1400) is recompiled
+
+        # Dict igual em conteúdo mas outro objeto também recompila
+        assert get_compiled_template(copy.deepcopy(reloaded), 1000, 1400) is not recompiled
+
+
+def test_clear_by_name():
+    other = dict(TEMPLATE, name="teste_lru_outro")
+    with _cache_size(8):
+        get_compiled_template(TEMPLATE, 1000, 1400)
+        get_compiled_template(TEMPLATE, 500, 700)
+        kept = get_compiled_template(other, 1000, 1400)
+
+        clear_template_cache("teste_lru")
+        assert _entries() == ["teste_lru_outro@1000x1400"]
+        assert get_compiled_template(other, 1000, 1400) is kept
+
+        clear_template_cache("nao_existe")
+        assert template_cache_info()["size"] == 1
+        clear_template_cache()
+        assert template_cache_info()["size"] == 0
+
+
+if __name__ == "__main__":
+    for test in (test_hit_returns_same_object, test_lru_evicts_least_recently_used,
+                 test_reloaded_template_recompiles, test_clear_by_name):
+        test()
+        print(f"✅ {test.__name__}")
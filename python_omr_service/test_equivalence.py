@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Teste de equivalência dos motores otimizados com a calibração original.
+
+- preprocess_array (NumPy/OpenCV) vs preprocess_pil_image: binarização bit a bit idêntica
+- detect_bubbles_integral vs detect_bubbles_fixed: respostas e imagem de debug idênticas;
+  o resultado compacto (SheetAnswers, também em .npy) reproduz as mesmas respostas
+- alinhamento em modo lote (RegistrationTracker): marcadores da verificação por
+  janelas iguais aos da busca completa; homografia só é reaproveitada dentro da tolerância
+- detecção de várias páginas empilhadas (process_omr_pages) vs página a página: mesmos resultados;
+  se a detecção empilhada falhar, o grupo é relido página a página, e a página
+  que falha (hash, detecção) vira {"status": "erro"} sem derrubar as demais
+- decodificação em cinza (OMR_DECODE_ENGINE=gray, JPEG grande reduzido) vs Pillow colorido:
+  mesmas respostas nas folhas de calibração e em JPEGs sintéticos de 300 e 600 DPI;
+  versão da leitura (chave do cache de resultados) diferente da do Pillow
+- pipeline restrito à ROI (OMR_ROI_PIPELINE) vs página inteira: mesmas respostas nas
+  folhas de calibração (o autocontraste usa o histograma da ROI, então a
+  binarização não é bit a bit a mesma; o que se valida são as respostas)
+
+Corpus (calibration_corpus.py): PNG/JPG de attached_assets (e PDFs, se
+pdf2image + poppler estiverem instalados), caminhos extras via
+OMR_CALIBRATION_CORPUS (separados por ':'), mais imagens sintéticas nos
+modos/tamanhos que o serviço recebe.
+
+Uso:
+    python test_equivalence.py          # relatório
+    python -m pytest test_equivalence.py
+"""
+import io
+import os
+import sys
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from calibration_corpus import (  # noqa: E402
+    CALIBRATION_SHEETS, calibration_files, corpus_images, extra_corpus_names, sheet_template,
+)
+from fast_preprocess import preprocess_array  # noqa: E402
+from integral_detection import detect_bubbles_integral, detect_sheet_integral  # noqa: E402
+from image_decode import decode_image  # noqa: E402
+from omr_result import NO_ANSWER  # noqa: E402
+from page_hash import DuplicateCheck  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet, template_page_size  # noqa: E402
+
+
+def load_corpus():
+    """Retorna [(nome, np.ndarray)] do corpus de calibração + casos sintéticos."""
+    corpus = corpus_images()
+    rng = np.random.default_rng(2025)
+    gray = rng.integers(0, 256, (3300, 2400), dtype=np.uint8)
+    corpus.extend([
+        ("sintetico_rgb_3509", rng.integers(0, 256, (3509, 2481, 3), dtype=np.uint8)),
+        ("sintetico_rgba_3100", rng.integers(0, 256, (3100, 2000, 4), dtype=np.uint8)),
+        ("sintetico_l_1756", rng.integers(0, 256, (1756, 1240), dtype=np.uint8)),
+        ("sintetico_rgb_cinza_3300", np.dstack([gray, gray, gray])),
+        ("sintetico_l_3300", gray),
+        ("sintetico_constante", np.full((800, 600, 3), 200, dtype=np.uint8)),
+    ])
+    return corpus
+
+
+def _working_images(image, template):
+    """Imagem crua e alinhada (quando o template tem marcadores)."""
+    yield "raw", image
+    if "registration_marks" in template:
+        aligned, info = app.align_with_registration_marks(image, template)
+        if info.get("aligned"):
+            yield "aligned", aligned
+
+
+def _cases():
+    for name, image in load_corpus():
+        for template_key, template in app.AVAILABLE_TEMPLATES.items():
+            for mode, working in _working_images(image, template):
+                yield f"{name} [{template_key}/{mode}]", working, template
+
+
+def test_preprocess_bitwise_identical():
+    failures = []
+    checked = []
+    for label, working, _template in _cases():
+        # A imagem crua se repete para cada template
+        if any(working is seen for seen in checked):
+            continue
+        checked.append(working)
+        reference = app.preprocess_pil_image(Image.fromarray(working))
+        fast = preprocess_array(working)
+        if fast.dtype != reference.dtype or fast.shape != reference.shape or not np.array_equal(fast, reference):
+            failures.append(label)
+    assert not failures, f"Binarização diverge em: {failures}"
+
+
+def test_detection_engines_identical():
+    failures = []
+    for label, working, template in _cases():
+        bw = app.preprocess_pil_image(Image.fromarray(working))
+        ref_answers, ref_debug = app.detect_bubbles_fixed(bw, template, debug=True)
+        answers, debug_image = detect_bubbles_integral(bw, template, debug=True)
+        if answers != ref_answers or list(answers) != list(ref_answers) or not np.array_equal(debug_image, ref_debug):
+            failures.append(label)
+            continue
+        sheet, _ = detect_sheet_integral(bw, template)
+        records = np.load(io.BytesIO(sheet.to_npy()))
+        labels = [NO_ANSWER] + sheet.options
+        decoded = {str(q): labels[c] for q, c in zip(records["question_id"].tolist(), records["code"].tolist())}
+        if sheet.to_dict() != ref_answers or any(decoded[q] != a for q, a in ref_answers.items() if q in decoded):
+            failures.append(f"{label} (compacto)")
+    assert not failures, f"Detecção diverge em: {failures}"
+
+
+def test_roi_pipeline_matches_full_pipeline():
+    extra = extra_corpus_names()
+    failures = []
+    for name, image in corpus_images():
+        base = name.split("#")[0]
+        if base not in CALIBRATION_SHEETS and base not in extra:
+            continue
+        template_key = sheet_template(base, app.DEFAULT_TEMPLATE_NAME)
+        if "roi_gabarito" not in app.AVAILABLE_TEMPLATES[template_key]:
+            continue
+        full = app.process_omr_page(image, template_name=template_key, roi_only=False)
+        roi = app.process_omr_page(image, template_name=template_key, roi_only=True)
+        if roi.get("pipeline") != "roi" or roi["resultado"]["questoes"] != full["resultado"]["questoes"]:
+            failures.append(f"{name} [{template_key}]")
+    assert not failures, f"Pipeline ROI diverge em: {failures}"
+
+
+def test_multi_page_detection_matches_single_page():
+    pages = [(n, image) for n, (_, image) in enumerate(load_corpus(), 1)]
+    for template_key in app.AVAILABLE_TEMPLATES:
+        for roi_only in (False, True):
+            batch = app.process_omr_pages(pages, template_key, roi_only=roi_only)
+            for (n, image), result in zip(pages, batch):
+                try:
+                    single = app.process_omr_page(image, n, template_name=template_key, roi_only=roi_only)
+                except Exception:
+                    assert result.get("status") == "erro", f"página {n} [{template_key}]"
+                    continue
+                assert result == single, f"página {n} [{template_key}, roi={roi_only}]: lote diverge"
+
+
+@contextmanager
+def _patched(name, replacement):
+    previous = getattr(app, name)
+    setattr(app, name, replacement)
+    try:
+        yield
+    finally:
+        setattr(app, name, previous)
+
+
+def _failing_on(function, bad):
+    """function que levanta exceção quando bad(número da chamada, *args) é verdadeiro."""
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if bad(len(calls), *args):
+            raise RuntimeError("falha simulada")
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def test_page_errors_stay_per_page():
+    template_key = "enem90_v5"
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    rng = np.random.default_rng(15)
+    pages = [(n, generate_sheet(template, rng, SheetOptions(noise=4)).image) for n in (1, 2, 3)]
+    expected = app.process_omr_pages(pages, template_key)
+    assert all("resultado" in page for page in expected)
+
+    # Detecção empilhada falha: o grupo é relido página a página
+    with _patched("detect_sheets_integral", _failing_on(app.detect_sheets_integral, lambda *_: True)):
+        assert app.process_omr_pages(pages, template_key) == expected
+        # ... e a página cuja detecção também falha sozinha (a 2ª) é a única com erro
+        with _patched("detect_sheet_integral", _failing_on(app.detect_sheet_integral, lambda call, *_: call == 2)):
+            fallback = app.process_omr_pages(pages, template_key)
+    assert fallback[1] == {"pagina": 2, "status": "erro", "mensagem": "falha simulada"}
+    assert [fallback[0], fallback[2]] == [expected[0], expected[2]]
+
+    # Hash da página 2 falha: só ela vira erro, as outras seguem com hash
+    bad = pages[1][1]
+    with _patched("page_hash", _failing_on(app.page_hash, lambda _call, image, *_: image is bad)):
+        hashed = app.process_omr_pages(pages, template_key, duplicates=DuplicateCheck())
+    assert hashed[1] == {"pagina": 2, "status": "erro", "mensagem": "falha simulada"}
+    for page, reference in ((hashed[0], expected[0]), (hashed[2], expected[2])):
+        assert page.pop("phash") and page == reference
+
+
+def _decode_cases():
+    """(nome, bytes, template) das folhas de calibração/corpus extra + JPEGs sintéticos grandes (300-600 DPI)."""
+    for name, path, template_key in calibration_files(app.DEFAULT_TEMPLATE_NAME):
+        with open(path, "rb") as f:
+            yield name, f.read(), template_key
+    rng = np.random.default_rng(2026)
+    for key, template in app.AVAILABLE_TEMPLATES.items():
+        if "registration_marks" not in template:
+            continue
+        for scale in (1.0, 2.0):
+            # Sem questões em branco: o detector responde a mais escura mesmo sem marcação,
+            # e entre bolhas vazias a escolha é ruído (muda com qualquer decodificador)
+            options = SheetOptions(blank_rate=0.0, scale=scale, rotation=0.5, blur=0.8, noise=5, jpeg_quality=85)
+            yield f"sintetico_{key}_x{scale}", generate_sheet(template, rng, options).encode(), key
+
+
+def test_gray_decode_answers_match():
+    failures = []
+    for name, data, template_key in _decode_cases():
+        template = app.AVAILABLE_TEMPLATES[template_key]
+        full = app.process_omr_page(decode_image(data), template_name=template_key)
+        gray = app.process_omr_page(decode_image(data, "gray", template_page_size(template)),
+                                    template_name=template_key)
+        if gray["resultado"]["questoes"] != full["resultado"]["questoes"]:
+            failures.append(f"{name} [{template_key}]")
+    assert not failures, f"Decodificação em cinza diverge em: {failures}"
+
+    # Respostas iguais, pixels não: os resultados em cinza têm outra chave no cache
+    engine = app.DECODE_ENGINE
+    versions = {}
+    try:
+        for mode in ("pil", "gray"):
+            app.DECODE_ENGINE = mode
+            versions[mode] = app.detector_version()
+    finally:
+        app.DECODE_ENGINE = engine
+    assert versions["gray"] != versions["pil"] and "gray" in versions["gray"], versions
+
+
+def _marked_sheet(template, dx=0, dy=0):
+    """Folha branca no tamanho de referência com os marcadores P1-P4 deslocados."""
+    width, height = template["reference_size"]["width"], template["reference_size"]["height"]
+    sheet = np.full((height, width, 3), 245, dtype=np.uint8)
+    for x, y in template["registration_marks"].values():
+        sheet[y + dy - 12:y + dy + 13, x + dx - 12:x + dx + 13] = 0
+    return sheet
+
+
+def test_batch_alignment_reuse():
+    template = app.AVAILABLE_TEMPLATES[app.DEFAULT_TEMPLATE_NAME]
+    tracker = app.RegistrationTracker(tolerance=2)
+    first_M, _ = app.registration_transform(_marked_sheet(template), template, tracker)
+    for shift, reused in ((1, True), (2, True), (3, False)):
+        sheet = _marked_sheet(template, shift, -shift)
+        M, info = app.registration_transform(sheet, template, tracker)
+        full_M, full_info = app.registration_transform(sheet, template)
+        assert info["marks"] == full_info["marks"], f"deslocamento {shift}: marcadores divergem"
+        assert bool(info.get("reused")) == reused, f"deslocamento {shift}: reuso inesperado"
+        assert np.array_equal(M, first_M if reused else full_M)
+
+
+if __name__ == "__main__":
+    print("=" * 80)
+    print("EQUIVALÊNCIA: motores otimizados vs calibração original")
+    print("=" * 80)
+    ok = True
+    for test in (test_preprocess_bitwise_identical, test_detection_engines_identical,
+                 test_batch_alignment_reuse, test_roi_pipeline_matches_full_pipeline,
+                 test_multi_page_detection_matches_single_page, test_page_errors_stay_per_page,
+                 test_gray_decode_answers_match):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            ok = False
+            print(f"❌ {test.__name__}: {e}")
+    sys.exit(0 if ok else 1)
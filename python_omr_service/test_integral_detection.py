@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Motor de detecção por imagem integral (integral_detection.py) contra a
+calibração (detect_bubbles_fixed):
+
+- folhas sintéticas de todos os templates (marcações simples, em branco e
+  duplas; rotação, escala, desfoque, ruído, JPEG) e a folha de calibração:
+  mesmas respostas, na mesma ordem, e a mesma imagem de debug
+- escuridão de cada bolha bit a bit igual a np.mean(255 - região) / 255 com o
+  mesmo recorte de read_region (inclusive bolhas cortadas na borda)
+- escada de thresholds nas bordas: páginas montadas pixel a pixel em que a
+  escuridão cai exatamente num threshold (0,2 / 0,3 / 0,4 / 0,6) ou a margem
+  1ª-2ª exatamente em 0,1 / 0,2
+
+Uso:
+    python test_integral_detection.py
+    python -m pytest test_integral_detection.py
+"""
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from compiled_template import get_compiled_template  # noqa: E402
+from integral_detection import bubble_darkness, detect_bubbles_integral  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+CALIBRATION_SHEET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "attached_assets",
+                                 "gabarito_pintado.png")
+
+SCANS = (
+    SheetOptions(blank_rate=0.1, double_rate=0.05),
+    SheetOptions(rotation=0.8, blur=0.8, noise=6, jpeg_quality=75, double_rate=0.05),
+    SheetOptions(scale=0.6, noise=4),
+    SheetOptions(scale=1.4, rotation=-0.5, jpeg_quality=85),
+)
+
+
+def _binarized(image, template):
+    working = image
+    if "registration_marks" in template:
+        working, _info = app.align_with_registration_marks(image, template)
+    return app.preprocess_pil_image(Image.fromarray(working))
+
+
+def _assert_identical(bw, template, label):
+    reference, reference_debug = app.detect_bubbles_fixed(bw, template, debug=True)
+    answers, debug_image = detect_bubbles_integral(bw, template, debug=True)
+    assert answers == reference, label
+    assert list(answers) == list(reference), f"{label}: ordem das questões"
+    assert np.array_equal(debug_image, reference_debug), f"{label}: imagem de debug"
+
+
+def _reference_darkness(bw, compiled):
+    """np.mean(255 - região) / 255 com o recorte de read_region, bolha a bolha."""
+    darkness = np.zeros(compiled.areas.shape)
+    for q, o in np.ndindex(compiled.areas.shape):
+        y1, y2, x1, x2 = compiled.bounds[q, o]
+        region = bw[y1:y2, x1:x2]
+        if region.size:
+            darkness[q, o] = np.mean(255 - region.astype(np.int64)) / 255.0
+    return darkness
+
+
+def test_synthetic_sheets_identical():
+    rng = np.random.default_rng(1)
+    for key, template in app.AVAILABLE_TEMPLATES.items():
+        for options in SCANS:
+            sheet = generate_sheet(template, rng, options)
+            image = app.decode_image_bytes(sheet.encode(), key)
+            _assert_identical(_binarized(image, template), template, f"{key} {options}")
+
+    if os.path.exists(CALIBRATION_SHEET):
+        template = app.AVAILABLE_TEMPLATES["enem90_v5"]
+        image = np.array(Image.open(CALIBRATION_SHEET))
+        _assert_identical(_binarized(image, template), template, "gabarito_pintado.png")
+
+
+def test_darkness_bit_identical():
+    rng = np.random.default_rng(2)
+    for key, template in app.AVAILABLE_TEMPLATES.items():
+        bw = _binarized(generate_sheet(template, rng, SheetOptions(noise=6)).image, template)
+        # Página inteira e um recorte que corta as bolhas da direita e de baixo
+        for page in (bw, bw[:int(bw.shape[0] * 0.8), :int(bw.shape[1] * 0.7)]):
+            page = np.ascontiguousarray(page)
+            compiled = get_compiled_template(template, page.shape[1], page.shape[0])
+            darkness = bubble_darkness(page, compiled)
+            reference = _reference_darkness(page, compiled)
+            assert np.array_equal(darkness, reference), key
+
+
+# Tamanhos em que o raio é múltiplo de 5: área (2r)² divisível por 10, então
+# k = área × fração pixels pretos dão escuridão exatamente 0,1, 0,2, ... 0,7
+LADDER_PAGE_SIZES = {"enem45": (1667, 2358), "enem90": (954, 1351), "enem90_v5": (1306, 1847)}
+
+
+def _ladder_page(compiled, fractions):
+    """Página branca com round(área × fração) pixels pretos em cada bolha (fractions [Q, O])."""
+    page = np.full((compiled.height, compiled.width), 255, dtype=np.uint8)
+    for q, o in np.ndindex(compiled.areas.shape):
+        y1, y2, x1, x2 = compiled.bounds[q, o]
+        flat = page[y1:y2, x1:x2].copy().reshape(-1)
+        flat[:int(round(flat.size * fractions[q, o]))] = 0
+        page[y1:y2, x1:x2] = flat.reshape((y2 - y1, x2 - x1))
+    return page
+
+
+# (mais escura, segunda) por questão: escuridão exatamente num threshold
+# (0,2 / 0,3 / 0,4 / 0,6) ou margem exatamente 0,2 / 0,1 onde ela muda o threshold
+LADDER_PAIRS = ((0.2, 0.0), (0.2, 0.2), (0.3, 0.1), (0.3, 0.2), (0.4, 0.2), (0.4, 0.3), (0.25, 0.05),
+                (0.325, 0.225), (0.5, 0.3), (0.6, 0.4), (0.6, 0.6), (0.7, 0.5))
+
+
+def test_threshold_ladder_boundaries():
+    rng = np.random.default_rng(3)
+    for key, template in app.AVAILABLE_TEMPLATES.items():
+        compiled = get_compiled_template(template, *LADDER_PAGE_SIZES[key])
+        questions, n_options = compiled.areas.shape
+        rows = np.arange(questions)
+        for _ in range(4):
+            first, second = np.array(LADDER_PAIRS)[rng.integers(0, len(LADDER_PAIRS), questions)].T
+            # As demais alternativas abaixo da segunda
+            fractions = np.minimum(rng.choice([0.0, 0.05, 0.1], (questions, n_options)), second[:, None])
+            column = rng.integers(0, n_options, questions)
+            fractions[rows, (column + 1) % n_options] = second
+            fractions[rows, column] = first
+            page = _ladder_page(compiled, fractions)
+
+            darkness = np.sort(bubble_darkness(page, compiled), axis=1)
+            assert np.isin(darkness[:, -1], compiled.ladder_thresholds).any(), f"{key}: sem empate no threshold"
+            if compiled.ladder_margins.size:
+                margins = darkness[:, -1] - darkness[:, -2]
+                assert np.isin(margins, compiled.ladder_margins).any(), f"{key}: sem empate na margem"
+            _assert_identical(page, template, f"{key} escada")
+
+
+if __name__ == "__main__":
+    for test in (test_synthetic_sheets_identical, test_darkness_bit_identical, test_threshold_ladder_boundaries):
+        test()
+        print(f"✅ {test.__name__}")
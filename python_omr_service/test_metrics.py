@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tempos por etapa e /metrics:
+
+- ?timings=true devolve o bloco "timings" e o header Server-Timing; sem o
+  parâmetro a resposta não muda
+- /metrics conta páginas, requisições e falhas de alinhamento e expõe os
+  histogramas por etapa (buckets cumulativos); cache de resultados num
+  diretório temporário (a segunda requisição da mesma folha acerta)
+
+Uso:
+    python test_metrics.py
+    python -m pytest test_metrics.py
+"""
+import io
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from metrics import Histogram  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+TEMPLATE = "enem90"
+
+
+def _post(client, data, query=""):
+    response = client.post(f"/api/process-image{query}", data={"image": (io.BytesIO(data), "folha.png"),
+                                                                "template": TEMPLATE})
+    body = response.get_json()
+    response.close()
+    return response, body
+
+
+def _metric(text, prefix):
+    for line in text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def _get(client, path):
+    response = client.get(path)
+    text = response.get_data(as_text=True)
+    response.close()
+    return text
+
+
+def test_timings_block_and_metrics():
+    with temporary_result_cache() as cache:
+        _timings_block_and_metrics(cache is not None)
+
+
+def _timings_block_and_metrics(cached):
+    client = app.app.test_client()
+    rng = np.random.default_rng(19)
+    sheet = generate_sheet(app.AVAILABLE_TEMPLATES[TEMPLATE], rng, SheetOptions(noise=4))
+    before = _get(client, "/metrics")
+
+    response, body = _post(client, sheet.encode(), "?timings=true")
+    assert {"decode", "align", "preprocess", "detect", "total"} <= set(body["timings"])
+    assert "detect;dur=" in response.headers["Server-Timing"]
+    response, body = _post(client, sheet.encode())
+    assert "timings" not in body and "Server-Timing" not in response.headers
+
+    # Folha sem marcadores: falha de alinhamento
+    blank = np.full((1756, 1240, 3), 245, dtype=np.uint8)
+    blank[0, :16] = rng.integers(0, 256, (16, 3))
+    _post(client, cv2.imencode(".png", blank)[1].tobytes())
+
+    after = _get(client, "/metrics")
+    pages = f'omr_pages_processed_total{{template="{TEMPLATE}"}}'
+    failures = f'omr_alignment_failures_total{{template="{TEMPLATE}"}}'
+    requests = 'omr_requests_total{endpoint="/api/process-image",status="200"}'
+    assert _metric(after, pages) - _metric(before, pages) == (2 if cached else 3)
+    assert _metric(after, failures) - _metric(before, failures) == 1
+    assert _metric(after, requests) - _metric(before, requests) == 3
+    assert _metric(after, 'omr_stage_duration_seconds_count{stage="detect"}') > \
+        _metric(before, 'omr_stage_duration_seconds_count{stage="detect"}')
+
+
+def test_histogram_exposition():
+    histogram = Histogram("h_seconds", "teste", ("stage",), buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 3.0):
+        histogram.observe(seconds, "x")
+    lines = histogram.samples()
+    assert 'h_seconds_bucket{stage="x",le="0.01"} 1' in lines
+    assert 'h_seconds_bucket{stage="x",le="0.1"} 3' in lines
+    assert 'h_seconds_bucket{stage="x",le="+Inf"} 4' in lines
+    assert 'h_seconds_count{stage="x"} 4' in lines
+
+
+if __name__ == "__main__":
+    for test in (test_timings_block_and_metrics, test_histogram_exposition):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Resposta binária de /api/process-image (?format=npy):
+
+- um registro por questão com as mesmas respostas da resposta JSON e os
+  metadados nos headers X-OMR-*
+- sai sempre de uma leitura nova: o cache de resultados não é consultado
+  nem gravado (cache num diretório temporário)
+- combinações que o .npy não atende (validate_with_chatgpt, debug, tenant
+  com hash de páginas) são recusadas com 400, sem ler a folha
+
+Uso:
+    python test_npy_response.py
+    python -m pytest test_npy_response.py
+"""
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import page_hash  # noqa: E402
+from omr_result import NO_ANSWER, NPY_MIMETYPE  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+TEMPLATE = "enem90_v5"
+
+
+def _post(client, data, query="", **kwargs):
+    response = client.post(f"/api/process-image?{query}", data={"image": (io.BytesIO(data), "folha.png"),
+                                                                "template": TEMPLATE, "page": "3"}, **kwargs)
+    response.get_data()
+    response.close()
+    return response
+
+
+def test_npy_matches_json():
+    rng = np.random.default_rng(14)
+    data = generate_sheet(app.AVAILABLE_TEMPLATES[TEMPLATE], rng, SheetOptions(noise=4)).encode()
+    client = app.app.test_client()
+    with temporary_result_cache() as cache:
+        response = _post(client, data, "format=npy")
+        assert response.status_code == 200 and response.mimetype == NPY_MIMETYPE
+        assert (response.headers["X-OMR-Pagina"], response.headers["X-OMR-Template"]) == ("3", TEMPLATE)
+        assert response.headers["X-OMR-Aligned"] == "true"
+        records = np.load(io.BytesIO(response.data))
+        options = [NO_ANSWER] + response.headers["X-OMR-Options"].split(",")
+        answers = {str(q): options[c] for q, c in zip(records["question_id"].tolist(), records["code"].tolist())}
+        if cache is not None:
+            assert cache.info()["stores"] == 0
+
+        body = _post(client, data).get_json()
+        assert body["status"] == "sucesso" and answers == body["pagina"]["resultado"]["questoes"]
+        if cache is not None:
+            # O .npy seguinte não sai do cache que o JSON acabou de gravar
+            hits = cache.memory_hits + cache.disk_hits
+            assert _post(client, data, "format=npy").data == response.data
+            assert cache.memory_hits + cache.disk_hits == hits
+
+
+def test_npy_rejects_unsupported_options():
+    data = generate_sheet(app.AVAILABLE_TEMPLATES[TEMPLATE], np.random.default_rng(15), SheetOptions()).encode()
+    client = app.app.test_client()
+    pages = app.PAGES.value(TEMPLATE)
+    cases = [("format=npy&validate_with_chatgpt=true", {}), ("format=npy&debug=true", {})]
+    if page_hash.PAGE_HASH_ENABLED:
+        cases.append(("format=npy", {"headers": {"X-OMR-Tenant": "teste_npy"}}))
+        cases.append(("format=npy&tenant=teste_npy", {}))
+    for query, kwargs in cases:
+        response = _post(client, data, query, **kwargs)
+        body = response.get_json()
+        assert response.status_code == 400 and body["status"] == "erro", (query, body)
+        assert "format=npy" in body["mensagem"]
+    # Nenhuma leitura feita
+    assert app.PAGES.value(TEMPLATE) == pages
+
+
+if __name__ == "__main__":
+    for test in (test_npy_matches_json, test_npy_rejects_unsupported_options):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Hash das páginas e duplicatas (page_hash.py):
+
+- a mesma folha digitalizada de novo (ruído, rotação, escala, JPEG) fica a até
+  OMR_DUPLICATE_DISTANCE bits; folhas com marcações aleatórias, bem acima
+- folhas que diferem em 1 a 5 respostas: hash dentro do limite, mas não são
+  sinalizadas (as respostas lidas não batem)
+- páginas sem nenhuma questão marcada nunca são possível duplicata
+- process_omr_pages: double-feed no mesmo job é sinalizado como
+  possivel_duplicata, e toda página é lida (nada vem de outra página)
+- /api/process-image com tenant: o reenvio de outra digitalização da mesma
+  folha é sinalizado; o resultado é o da leitura dela (cache de resultados
+  num diretório temporário)
+
+Uso:
+    python test_page_hash.py
+    python -m pytest test_page_hash.py
+"""
+import io
+import itertools
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from omr_result import NO_ANSWER  # noqa: E402
+from page_hash import DUPLICATE_DISTANCE, DuplicateCheck, hash_distance, page_hash  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet, random_marks  # noqa: E402
+
+
+def _rescan(template, rng, marks):
+    options = SheetOptions(noise=8, rotation=float(rng.uniform(-1.5, 1.5)), scale=float(rng.uniform(0.98, 1.02)),
+                           blur=0.8, jpeg_quality=60)
+    return generate_sheet(template, rng, options, marks=marks)
+
+
+def test_hash_separates_students():
+    for name in ("enem90", "enem90_v5"):
+        template = app.AVAILABLE_TEMPLATES[name]
+        rng = np.random.default_rng(31)
+        students = [random_marks(template, rng, SheetOptions()) for _ in range(5)]
+        hashes = []
+        for marks in students:
+            first = page_hash(generate_sheet(template, rng, SheetOptions(noise=4), marks=marks).image, template)
+            again = page_hash(_rescan(template, rng, marks).image, template)
+            assert hash_distance(first, again) <= DUPLICATE_DISTANCE // 2 + 5, (name, hash_distance(first, again))
+            hashes.append(first)
+        for a, b in itertools.combinations(hashes, 2):
+            assert hash_distance(a, b) > 2 * DUPLICATE_DISTANCE, (name, hash_distance(a, b))
+
+
+def _change_answers(template, marks, rng, count):
+    """Cópia de `marks` com `count` questões respondidas com outra alternativa."""
+    letters = app.get_compiled_template(template, *app.template_page_size(template)).options
+    changed = dict(marks)
+    for question in rng.choice(sorted(marks), size=count, replace=False).tolist():
+        changed[question] = [rng.choice([x for x in letters if x not in marks[question]]).item()]
+    return changed
+
+
+def test_few_answer_changes_are_not_duplicates():
+    for name in ("enem90", "enem90_v5"):
+        template = app.AVAILABLE_TEMPLATES[name]
+        rng = np.random.default_rng(33)
+        marks = random_marks(template, rng, SheetOptions(blank_rate=0.0))
+        first = generate_sheet(template, rng, SheetOptions(noise=4), marks=marks)
+        close = 0
+        for count in (1, 2, 3, 5):
+            changed = _change_answers(template, marks, rng, count)
+            other = generate_sheet(template, rng, SheetOptions(noise=6, rotation=float(rng.uniform(-1, 1)),
+                                                               jpeg_quality=75), marks=changed)
+            close += hash_distance(page_hash(first.image, template), page_hash(other.image, template)) \
+                <= DUPLICATE_DISTANCE
+            pages = [(1, first.image), (2, other.image)]
+            check = DuplicateCheck()
+            read = app.process_omr_pages(pages[:1], name, duplicates=check)
+            read += app.process_omr_pages(pages[1:], name, duplicates=check)
+            assert "possivel_duplicata" not in read[1], (name, count, read[1]["possivel_duplicata"])
+            answers = read[1]["resultado"]["questoes"]
+            assert all(answers[q] == changed[q][0] for q in changed if changed[q] != marks[q]), (name, count)
+        # O hash sozinho não separa essas folhas: a confirmação pelas respostas é que separa
+        assert close >= 2, (name, close)
+
+
+def test_blank_answers_are_not_duplicates():
+    template = app.AVAILABLE_TEMPLATES["enem90"]
+    rng = np.random.default_rng(35)
+    blank = {key: [] for key in random_marks(template, rng, SheetOptions())}
+    phash = page_hash(generate_sheet(template, rng, SheetOptions(noise=4), marks=blank).image, template)
+    check = DuplicateCheck()
+    # Mesmo hash e as mesmas respostas, todas em branco: nada identifica a folha
+    for page_number in (1, 2):
+        result = {"pagina": page_number, "phash": phash,
+                  "resultado": {"questoes": {str(q): NO_ANSWER for q in range(1, 91)}}}
+        assert check.register(result, page_number) is None and "possivel_duplicata" not in result
+    # Uma questão marcada já basta para comparar
+    for page_number in (3, 4):
+        answers = {str(q): NO_ANSWER for q in range(1, 91)}
+        answers["7"] = "C"
+        result = {"pagina": page_number, "phash": phash, "resultado": {"questoes": answers}}
+        check.register(result, page_number)
+    assert result["possivel_duplicata"] == {"pagina": 3, "distancia": 0, "escopo": "job"}
+
+
+def test_double_feed_flagged_within_job():
+    template_key = "enem90"
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    rng = np.random.default_rng(32)
+    # Sem questões em branco: nelas a leitura de duas digitalizações pode divergir
+    marks = random_marks(template, rng, SheetOptions(blank_rate=0.0))
+    first = generate_sheet(template, rng, SheetOptions(noise=4), marks=marks).image
+    other = generate_sheet(template, rng, SheetOptions(noise=4)).image
+    pages = [(1, first), (2, _rescan(template, rng, marks).image), (3, other), (4, _rescan(template, rng, marks).image)]
+
+    flagged = app.process_omr_pages(pages, template_key, duplicates=DuplicateCheck())
+    assert all(page["phash"] for page in flagged)
+    # A página 4 é possível duplicata da 1 ou da 2 (a mais parecida)
+    assert [page.get("possivel_duplicata", {}).get("pagina") for page in flagged][:3] == [None, 1, None]
+    assert flagged[3]["possivel_duplicata"]["pagina"] in (1, 2)
+    assert flagged[3]["possivel_duplicata"]["escopo"] == "job"
+
+    # Em chamadas separadas (janelas do PDF) o índice do job continua valendo; cada página é lida
+    check = DuplicateCheck()
+    split = app.process_omr_pages(pages[:2], template_key, duplicates=check)
+    split += app.process_omr_pages(pages[2:], template_key, duplicates=check)
+    assert [page.get("possivel_duplicata", {}).get("pagina") for page in split] == \
+        [page.get("possivel_duplicata", {}).get("pagina") for page in flagged]
+    plain = app.process_omr_pages(pages, template_key)
+    for page, reference in zip(split, plain):
+        page.pop("possivel_duplicata", None)
+        assert page.pop("phash") and page == reference
+
+
+def test_tenant_duplicate_across_uploads():
+    with temporary_result_cache() as cache:
+        _tenant_duplicate_across_uploads(cache)
+
+
+def _tenant_duplicate_across_uploads(cache):
+    client = app.app.test_client()
+    template_key = "enem90"
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    rng = np.random.default_rng(34)
+    marks = random_marks(template, rng, SheetOptions(blank_rate=0.0))
+    tenant = "teste_page_hash"
+
+    def post(sheet, query=""):
+        response = client.post(f"/api/process-image{query}", headers={"X-OMR-Tenant": tenant},
+                               data={"image": (io.BytesIO(sheet.encode()), "folha.png"), "template": template_key})
+        body = response.get_json()
+        response.close()
+        assert body["status"] == "sucesso", body
+        return body["pagina"]
+
+    first = post(generate_sheet(template, rng, SheetOptions(noise=4), marks=marks))
+    assert "possivel_duplicata" not in first
+    rescan = _rescan(template, rng, marks)
+    second = post(rescan)
+    assert second["possivel_duplicata"] == {"pagina": 1, "distancia": second["possivel_duplicata"]["distancia"],
+                                            "escopo": "tenant"}
+    assert second["resultado"] == first["resultado"]
+    # Reenvio dos mesmos bytes: acerto do cache, também sinalizado
+    again = post(rescan)
+    assert again["possivel_duplicata"]["escopo"] == "tenant" and again["resultado"] == second["resultado"]
+    if cache is not None:
+        assert cache.memory_hits + cache.disk_hits >= 1
+    assert "possivel_duplicata" not in post(generate_sheet(template, rng, SheetOptions(noise=4)))
+
+
+if __name__ == "__main__":
+    for test in (test_hash_separates_students, test_few_answer_changes_are_not_duplicates,
+                 test_blank_answers_are_not_duplicates, test_double_feed_flagged_within_job,
+                 test_tenant_duplicate_across_uploads):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Triagem das páginas de PDF (page_screening.py), decidida só na miniatura:
+
+- folhas sintéticas (com rotação, ruído, desfoque, JPEG, sem nenhuma marcação)
+  nunca são ignoradas
+- versos digitalizados (ruído, sujeira, decalque do texto da outra face) são
+  "pagina_em_branco"; capas e páginas de instruções, "sem_gabarito"
+- folhas reais de attached_assets (inclusive as que não alinham) nunca são
+  ignoradas: process_omr_pages(screen=True) == screen=False em todos os templates
+- process_omr_pages(screen=True) ignora versos e instruções, lê o resto igual
+  a screen=False, e as ignoradas são contadas em /metrics por motivo
+
+Uso:
+    python test_page_screening.py
+    python -m pytest test_page_screening.py
+"""
+import os
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from page_screening import REASON_BLANK, REASON_NOT_SHEET, screen_page  # noqa: E402
+from synthetic_sheets import PAPER, SheetOptions, generate_sheet, template_page_size  # noqa: E402
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "attached_assets")
+REAL_SHEETS = ("gabarito_pintado.png", "modelo_gabarito.png", "visualization_new.png")
+
+SHEET_OPTIONS = (
+    SheetOptions(),
+    SheetOptions(blank_rate=1.0, noise=6),
+    SheetOptions(rotation=1.5, blur=1.0, noise=8, jpeg_quality=50),
+    SheetOptions(rotation=-1.0, scale=1.02, noise=4),
+)
+
+
+def blank_page(template, rng, noise=6):
+    width, height = template_page_size(template)
+    noise = rng.normal(0, noise, (height, width, 1)).astype(np.int16)
+    page = np.clip(PAPER + noise, 0, 255).astype(np.uint8).repeat(3, axis=2)
+    # Decalque do verso: texto claro
+    cv2.putText(page, "verso", (width // 4, height // 2), cv2.FONT_HERSHEY_SIMPLEX, width / 300, (215,) * 3,
+                max(1, width // 200))
+    return page
+
+
+def _text_lines(page, lines, scale, color, rng=None):
+    height, width = page.shape[:2]
+    for line in range(lines):
+        text = f"{line + 1}. Leia com atencao as instrucoes da prova"
+        if rng is not None:
+            text = "".join(rng.choice(list("abcdefghij klmnopqrstuvwxyz"), 60))
+        cv2.putText(page, text, (width // 12, height // 10 + line * height * 8 // (10 * lines)),
+                    cv2.FONT_HERSHEY_SIMPLEX, width * scale, color, max(1, width // 600))
+
+
+def instructions_page(template):
+    width, height = template_page_size(template)
+    page = np.full((height, width, 3), PAPER, dtype=np.uint8)
+    _text_lines(page, 40, 1 / 1400, (20,) * 3)
+    cv2.rectangle(page, (width // 10, height * 7 // 10), (width * 9 // 10, height * 9 // 10), (60,) * 3, -1)
+    return page
+
+
+def cover_page(template, rng):
+    """Capa do caderno: título grande, texto corrido e ruído de digitalização."""
+    width, height = template_page_size(template)
+    page = np.full((height, width, 3), PAPER, dtype=np.uint8)
+    cv2.putText(page, "CADERNO DE QUESTOES", (width // 12, height // 12), cv2.FONT_HERSHEY_DUPLEX, width / 500,
+                (20,) * 3, max(2, width // 200))
+    _text_lines(page, 60, 1 / 1650, (30,) * 3, rng)
+    noise = rng.normal(0, 6, page.shape[:2] + (1,)).astype(np.int16)
+    return np.clip(page + noise, 0, 255).astype(np.uint8)
+
+
+def scanned_backside(template, rng, noise=12, speckles=300):
+    """
+    Verso digitalizado: texto da outra face espelhado e claro (decalque),
+    ruído do scanner e pontos de sujeira (que caem também nas janelas dos marcadores).
+    """
+    width, height = template_page_size(template)
+    front = np.full((height, width), PAPER, dtype=np.uint8)
+    _text_lines(front, 60, 1 / 1650, 30, rng)
+    page = PAPER - (PAPER - front[:, ::-1].astype(np.float32)) * 0.15
+    page += rng.normal(0, noise, page.shape)
+    for _ in range(speckles):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(page, center, int(rng.integers(1, 4)), 60, -1)
+    page = np.clip(page, 0, 255).astype(np.uint8)
+    return np.repeat(page[:, :, None], 3, axis=2)
+
+
+def marked_blank_page(template, rng):
+    """Página em branco só com os marcadores P1-P4 (assinatura de folha: é lida)."""
+    page = blank_page(template, rng)
+    for x, y in template["registration_marks"].values():
+        page[y - 12:y + 13, x - 12:x + 13] = 0
+    return page
+
+
+def test_sheets_are_never_skipped():
+    rng = np.random.default_rng(23)
+    for name in ("enem90", "enem90_v5", "enem45"):
+        template = app.AVAILABLE_TEMPLATES[name]
+        for options in SHEET_OPTIONS:
+            screening = screen_page(generate_sheet(template, rng, options).image, template)
+            assert screening is None, (name, options, screening)
+    # Página em cinza (PDF renderizado no modo "template")
+    template = app.AVAILABLE_TEMPLATES["enem90_v5"]
+    gray = cv2.cvtColor(generate_sheet(template, rng).image, cv2.COLOR_RGB2GRAY)
+    assert screen_page(gray, template) is None
+
+
+def test_backsides_and_instructions_are_skipped():
+    rng = np.random.default_rng(25)
+    for name in ("enem90", "enem90_v5", "enem45"):
+        template = app.AVAILABLE_TEMPLATES[name]
+        backsides = (blank_page(template, rng), blank_page(template, rng, noise=0), scanned_backside(template, rng),
+                     scanned_backside(template, rng, noise=25), scanned_backside(template, rng, speckles=1000))
+        for number, page in enumerate(backsides):
+            screening = screen_page(page, template)
+            assert screening is not None and screening["motivo"] == REASON_BLANK, (name, number, screening)
+            assert screening["marcadores"] < screening["marcadores_esperados"] or name == "enem45"
+        for page in (instructions_page(template), cover_page(template, rng)):
+            screening = screen_page(page, template)
+            assert screening is not None and screening["motivo"] == REASON_NOT_SHEET, (name, screening)
+
+
+def test_real_sheets_are_never_skipped():
+    pages = [(n, np.array(Image.open(os.path.join(ASSETS_DIR, name)).convert("RGB")))
+             for n, name in enumerate(REAL_SHEETS, start=1) if os.path.exists(os.path.join(ASSETS_DIR, name))]
+    assert pages, "attached_assets sem folhas reais"
+    for template_key in app.AVAILABLE_TEMPLATES:
+        screened = app.process_omr_pages(pages, template_key, screen=True)
+        assert not [page for page in screened if page.get("status") == "ignorada"], template_key
+        assert screened == app.process_omr_pages(pages, template_key), template_key
+
+
+def test_process_omr_pages_screening():
+    template_key = "enem90"
+    template = app.AVAILABLE_TEMPLATES[template_key]
+    rng = np.random.default_rng(24)
+    pages = [(1, instructions_page(template)), (2, generate_sheet(template, rng, SheetOptions(noise=4)).image),
+             (3, blank_page(template, rng, noise=0)), (4, generate_sheet(template, rng, SheetOptions(rotation=1.0)).image),
+             (5, marked_blank_page(template, rng)), (6, scanned_backside(template, rng))]
+    skipped_before = {reason: app.PAGES_SKIPPED.value(template_key, reason)
+                      for reason in (REASON_BLANK, REASON_NOT_SHEET)}
+
+    screened = app.process_omr_pages(pages, template_key, screen=True)
+    full = app.process_omr_pages(pages, template_key)
+    assert [page["pagina"] for page in screened] == [1, 2, 3, 4, 5, 6]
+    assert [page.get("motivo") for page in screened] == [REASON_NOT_SHEET, None, REASON_BLANK, None, None,
+                                                         REASON_BLANK]
+    assert all(screened[i]["status"] == "ignorada" for i in (0, 2, 5))
+    assert [screened[i] for i in (1, 3, 4)] == [full[i] for i in (1, 3, 4)]
+    assert screened[4]["alinhamento"]["aligned"]
+
+    app.count_pages(screened, template_key)
+    assert app.PAGES_SKIPPED.value(template_key, REASON_BLANK) == skipped_before[REASON_BLANK] + 2
+    assert app.PAGES_SKIPPED.value(template_key, REASON_NOT_SHEET) == skipped_before[REASON_NOT_SHEET] + 1
+
+
+if __name__ == "__main__":
+    for test in (test_sheets_are_never_skipped, test_backsides_and_instructions_are_skipped,
+                 test_real_sheets_are_never_skipped, test_process_omr_pages_screening):
+        test()
+        print(f"✅ {test.__name__}")
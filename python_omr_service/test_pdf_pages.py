@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+PDF em janelas (iter_pdf_pages, pdf_render_options, /api/process-pdf), sem
+poppler: convert_from_path e pdfinfo_from_path são trocados por um PDF falso
+que devolve imagens prontas e registra cada chamada.
+
+- páginas em ordem, janelas de `window` páginas ([1-3], [4-6], [7-7]) com as
+  opções de renderização do modo (dpi ou reference_size em cinza)
+- consumidor que para no meio: a janela seguinte à pendente nunca é pedida;
+  a pendente é cancelada se ainda não começou e aguardada se já está no
+  pdftoppm (o PDF temporário só é removido depois dela)
+- POST /api/process-pdf (multipart e application/pdf): uma linha NDJSON por
+  página com as respostas da leitura direta, linha final com os totais,
+  PDF temporário removido; reenvio sai do cache sem renderizar
+
+Uso:
+    python test_pdf_pages.py
+    python -m pytest test_pdf_pages.py
+"""
+import io
+import json
+import os
+import sys
+import threading
+import types
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+TEMPLATE = "enem90_v5"
+
+
+class FakePdf:
+    """pdf2image falso: páginas prontas (arrays) e o registro das renderizações."""
+
+    def __init__(self, pages, delay=None):
+        self.pages = pages
+        self.calls = []
+        self.paths = set()
+        # Evento que a renderização espera (segura a janela pendente)
+        self.delay = delay
+        self.held = threading.Event()
+
+    def pdfinfo_from_path(self, pdf_path, **_kwargs):
+        self.paths.add(pdf_path)
+        return {"Pages": len(self.pages)}
+
+    def convert_from_path(self, pdf_path, first_page=None, last_page=None, thread_count=1, **options):
+        self.paths.add(pdf_path)
+        self.calls.append((first_page, last_page, options))
+        if self.delay is not None and first_page > 1:
+            self.held.set()
+            self.delay.wait(5)
+        return [Image.fromarray(self.pages[n - 1]) for n in range(first_page, last_page + 1)]
+
+
+@contextmanager
+def fake_pdf2image(pdf):
+    module = types.ModuleType("pdf2image")
+    module.convert_from_path = pdf.convert_from_path
+    module.pdfinfo_from_path = pdf.pdfinfo_from_path
+    previous = sys.modules.get("pdf2image")
+    sys.modules["pdf2image"] = module
+    try:
+        yield pdf
+    finally:
+        if previous is not None:
+            sys.modules["pdf2image"] = previous
+        else:
+            del sys.modules["pdf2image"]
+
+
+@contextmanager
+def _setting(name, value):
+    previous = getattr(app, name)
+    setattr(app, name, value)
+    try:
+        yield
+    finally:
+        setattr(app, name, previous)
+
+
+def _numbered_pages(count):
+    """Páginas pequenas com o número no primeiro pixel."""
+    return [np.full((8, 6, 3), n, dtype=np.uint8) for n in range(1, count + 1)]
+
+
+def test_windows_in_order():
+    template = app.AVAILABLE_TEMPLATES[TEMPLATE]
+    with fake_pdf2image(FakePdf(_numbered_pages(7))) as pdf:
+        pages = list(app.iter_pdf_pages("prova.pdf", window=3, template=template))
+    assert [n for n, _ in pages] == list(range(1, 8))
+    assert all(int(image[0, 0, 0]) == n for n, image in pages)
+    assert [(first, last) for first, last, _ in pdf.calls] == [(1, 3), (4, 6), (7, 7)]
+
+    with fake_pdf2image(FakePdf(_numbered_pages(6))) as pdf:
+        assert [n for n, _ in app.iter_pdf_pages("prova.pdf", window=3, total_pages=6)] == list(range(1, 7))
+    assert [(first, last) for first, last, _ in pdf.calls] == [(1, 3), (4, 6)]
+
+    with fake_pdf2image(FakePdf([])) as pdf:
+        assert list(app.iter_pdf_pages("vazio.pdf", window=3)) == [] and pdf.calls == []
+
+
+def test_render_options():
+    v5 = app.AVAILABLE_TEMPLATES[TEMPLATE]
+    size = (v5["reference_size"]["width"], v5["reference_size"]["height"])
+    normalized = next(t for t in app.AVAILABLE_TEMPLATES.values() if "reference_size" not in t)
+    with _setting("PDF_RENDER_MODE", "dpi"):
+        assert app.pdf_render_options(v5) == {"dpi": app.PDF_RENDER_DPI}
+    with _setting("PDF_RENDER_MODE", "template"):
+        assert app.pdf_render_options(v5) == {"size": size, "grayscale": True}
+        assert app.pdf_render_options(normalized) == {"dpi": app.PDF_RENDER_DPI}
+        assert app.pdf_render_options(None) == {"dpi": app.PDF_RENDER_DPI}
+        with fake_pdf2image(FakePdf(_numbered_pages(2))) as pdf:
+            list(app.iter_pdf_pages("prova.pdf", window=4, template=v5))
+        assert pdf.calls == [(1, 2, {"size": size, "grayscale": True})]
+
+
+def test_stop_cancels_pending_renders():
+    release = threading.Event()
+    with fake_pdf2image(FakePdf(_numbered_pages(9), delay=release)) as pdf:
+        pages = app.iter_pdf_pages("prova.pdf", window=3)
+        assert next(pages)[0] == 1
+        # A janela [4-6] já foi pedida e está segura no renderizador
+        assert pdf.held.wait(5)
+        closer = threading.Thread(target=pages.close)
+        closer.start()
+        closer.join(0.2)
+        # close espera a renderização em andamento (o PDF temporário só é removido depois)
+        assert closer.is_alive()
+        release.set()
+        closer.join(5)
+        assert not closer.is_alive()
+    # Nenhuma janela pedida depois do close
+    assert [(first, last) for first, last, _ in pdf.calls] == [(1, 3), (4, 6)]
+
+
+def _post_pdf(client, pages, **kwargs):
+    response = client.post("/api/process-pdf", **kwargs)
+    body = response.get_data(as_text=True)
+    response.close()
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson", body
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_post_pdf():
+    template = app.AVAILABLE_TEMPLATES[TEMPLATE]
+    rng = np.random.default_rng(51)
+    sheets = [generate_sheet(template, rng, SheetOptions(noise=4)).image for _ in range(5)]
+    expected = [app.process_omr_page(image, n, template_name=TEMPLATE)["resultado"]
+                for n, image in enumerate(sheets, start=1)]
+    client = app.app.test_client()
+    window = app.PDF_RENDER_WINDOW
+    with temporary_result_cache() as cache, fake_pdf2image(FakePdf(sheets)) as pdf:
+        lines = _post_pdf(client, sheets, data={"pdf": (io.BytesIO(b"%PDF-1.4 falso"), "turma.pdf"),
+                                                "template": TEMPLATE})
+        assert [line["pagina"] for line in lines[:-1]] == [1, 2, 3, 4, 5]
+        assert [line["resultado"] for line in lines[:-1]] == expected
+        summary = lines[-1]
+        assert summary["status"] == "concluido" and summary["total_paginas"] == 5 and summary["erros"] == 0
+        assert [(first, last) for first, last, _ in pdf.calls] == \
+            [(first, min(first + window - 1, 5)) for first in range(1, 6, window)]
+        assert pdf.paths and not any(os.path.exists(path) for path in pdf.paths)
+
+        # Mesmo PDF no corpo (application/pdf): tudo no cache, nada renderizado
+        calls = len(pdf.calls)
+        again = _post_pdf(client, sheets, data=b"%PDF-1.4 falso", content_type="application/pdf",
+                          query_string={"template": TEMPLATE})
+        assert [line["resultado"] for line in again[:-1]] == expected
+        assert len(pdf.calls) == (calls if cache is not None else 2 * calls)
+
+    response = client.post("/api/process-pdf", data={"template": TEMPLATE})
+    assert response.status_code == 400 and response.get_json()["status"] == "erro"
+    response.close()
+
+
+if __name__ == "__main__":
+    for test in (test_windows_in_order, test_render_options, test_stop_cancels_pending_renders, test_post_pdf):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+POST /api/process-batch (cache de resultados num diretório temporário):
+
+- multipart com várias imagens: uma linha NDJSON por folha (com as respostas
+  da leitura de uma folha só), linha de erro para o arquivo que não é imagem
+  e a linha final com os totais
+- zip: só as imagens, em ordem alfabética, lidas uma a uma (uma folha em
+  voo por vez); reenvio do mesmo lote sai do cache
+- OMR_BATCH_WORKERS=1: sem pool de processos, folhas lidas no próprio worker
+  com as mesmas linhas (e tempos por folha) do pool
+- limites do lote expandido (OMR_BATCH_MAX_FILES, OMR_BATCH_MAX_FILE_MB,
+  OMR_BATCH_MAX_UNCOMPRESSED_MB) pelo tamanho declarado: zip bomb é recusado
+  com 413 sem descomprimir; .zip inválido é 400
+
+Uso:
+    python test_process_batch.py
+    python -m pytest test_process_batch.py
+"""
+import io
+import json
+import os
+import sys
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+
+TEMPLATE = "enem90_v5"
+
+
+def _sheets(count, seed):
+    rng = np.random.default_rng(seed)
+    template = app.AVAILABLE_TEMPLATES[TEMPLATE]
+    return [generate_sheet(template, rng, SheetOptions(noise=4)).encode() for _ in range(count)]
+
+
+def _expected(data):
+    page = app.process_omr_page(app.decode_image_bytes(data, TEMPLATE), template_name=TEMPLATE)
+    return page["resultado"]
+
+
+def _post(files, query=""):
+    client = app.app.test_client()
+    response = client.post(f"/api/process-batch{query}", data={"images": files, "template": TEMPLATE})
+    body = response.get_data(as_text=True)
+    status, mimetype = response.status_code, response.mimetype
+    response.close()
+    if mimetype != "application/x-ndjson":
+        return status, json.loads(body)
+    return status, [json.loads(line) for line in body.splitlines()]
+
+
+def _zip(entries, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+@contextmanager
+def _setting(name, value):
+    previous = getattr(app, name)
+    setattr(app, name, value)
+    try:
+        yield
+    finally:
+        setattr(app, name, previous)
+
+
+def test_multipart_batch():
+    sheets = _sheets(2, 41)
+    with temporary_result_cache():
+        status, lines = _post([(io.BytesIO(sheets[0]), "aluno1.png"), (io.BytesIO(sheets[1]), "aluno2.png"),
+                               (io.BytesIO(b"nao e imagem"), "capa.png")])
+    assert status == 200
+    assert lines[-1] == {"status": "concluido", "total_paginas": 3, "erros": 1}
+    pages = {line["indice"]: line for line in lines[:-1]}
+    assert sorted(pages) == [1, 2, 3]
+    for idx, name in ((1, "aluno1.png"), (2, "aluno2.png")):
+        line = pages[idx]
+        assert (line["status"], line["arquivo"], line["template"]) == ("sucesso", name, TEMPLATE)
+        assert line["pagina"]["pagina"] == idx
+        assert line["pagina"]["resultado"] == _expected(sheets[idx - 1])
+    assert pages[3]["status"] == "erro" and pages[3]["arquivo"] == "capa.png" and pages[3]["mensagem"]
+
+
+def test_zip_batch():
+    sheets = _sheets(3, 42)
+    archive = _zip([("turma/c.png", sheets[2]), ("turma/a.png", sheets[0]), ("turma/", b""),
+                    ("__MACOSX/turma/._a.png", b"x"), ("leia-me.txt", b"texto"), ("turma/b.png", sheets[1])])
+    with temporary_result_cache() as cache, _setting("BATCH_IN_FLIGHT", 1):
+        status, lines = _post([(io.BytesIO(archive), "turma.zip")])
+        assert status == 200 and lines[-1] == {"status": "concluido", "total_paginas": 3, "erros": 0}
+        # Uma folha em voo por vez: as linhas saem na ordem do zip
+        assert [(line["indice"], line["arquivo"]) for line in lines[:-1]] == \
+            [(1, "turma/a.png"), (2, "turma/b.png"), (3, "turma/c.png")]
+        for line, data in zip(lines[:-1], sheets):
+            assert line["status"] == "sucesso" and line["pagina"]["resultado"] == _expected(data)
+
+        if cache is not None:
+            hits = cache.memory_hits
+            _status, again = _post([(io.BytesIO(archive), "sem_extensao")])
+            assert cache.memory_hits == hits + 3
+            assert [line["pagina"] for line in again[:-1]] == [line["pagina"] for line in lines[:-1]]
+
+
+def test_single_worker_reads_in_process():
+    sheets = _sheets(2, 44)
+    files = lambda: [(io.BytesIO(sheets[0]), "aluno1.png"), (io.BytesIO(sheets[1]), "aluno2.png")]
+    with temporary_result_cache(), _setting("BATCH_WORKERS", 2):
+        _status, pooled = _post(files(), "?timings=true")
+
+    def no_pool():
+        raise AssertionError("pool de processos criado com OMR_BATCH_WORKERS=1")
+
+    with temporary_result_cache(), _setting("BATCH_WORKERS", 1), _setting("get_batch_pool", no_pool):
+        status, lines = _post(files(), "?timings=true")
+    assert status == 200 and lines[-1] == pooled[-1] == {"status": "concluido", "total_paginas": 2, "erros": 0}
+    # Uma folha por vez, na ordem do upload
+    assert [line["indice"] for line in lines[:-1]] == [1, 2]
+    by_index = {line["indice"]: line for line in pooled[:-1]}
+    for line in lines[:-1]:
+        timings = line.pop("timings")
+        assert timings["total"] >= timings["detect"] > 0 and ("hash" in timings) == app.PAGE_HASH_ENABLED
+        by_index[line["indice"]].pop("timings")
+        assert line == by_index[line["indice"]]
+
+
+def test_batch_limits():
+    sheet = _sheets(1, 43)[0]
+    # 64 MB de zeros viram ~64 KB no zip: o corpo passa em OMR_BATCH_MAX_MB
+    bomb = _zip([("bomba.png", bytes(64 * 1024 * 1024))])
+    assert len(bomb) < 1024 * 1024
+    original_read = zipfile.ZipFile.read
+
+    def no_read(self, name, pwd=None):
+        raise AssertionError(f"{name} lido antes de conferir os limites")
+
+    zipfile.ZipFile.read = no_read
+    try:
+        status, body = _post([(io.BytesIO(bomb), "lote.zip")])
+        assert status == 413 and body["status"] == "erro" and "bomba.png" in body["mensagem"]
+
+        many = _zip([(f"{i:03d}.png", sheet) for i in range(5)])
+        with _setting("BATCH_MAX_FILES", 4):
+            status, body = _post([(io.BytesIO(many), "lote.zip")])
+        assert status == 413 and body["status"] == "erro"
+
+        with _setting("BATCH_MAX_UNCOMPRESSED_BYTES", 3 * len(sheet)):
+            status, body = _post([(io.BytesIO(sheet), "avulsa.png"), (io.BytesIO(many), "lote.zip")])
+        assert status == 413 and body["status"] == "erro"
+    finally:
+        zipfile.ZipFile.read = original_read
+
+    status, body = _post([(io.BytesIO(b"nao e zip"), "lote.zip")])
+    assert status == 400 and body["status"] == "erro"
+    status, body = _post([])
+    assert status == 400 and body["status"] == "erro"
+
+
+if __name__ == "__main__":
+    for test in (test_multipart_batch, test_zip_batch, test_single_worker_reads_in_process, test_batch_limits):
+        test()
+        print(f"✅ {test.__name__}")
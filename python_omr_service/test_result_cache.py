@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Cache de resultados (result_cache.py), num diretório temporário:
+
+- memória: cópias (alterar o resultado devolvido não muda o guardado) e LRU
+  de memory_items resultados
+- disco: outro processo (outro ResultCache no mesmo diretório) acerta pelo
+  disco; arquivo corrompido é erro de cache, não exceção
+- regravar a mesma chave não conta os bytes duas vezes; ao passar do limite,
+  saem os menos usados (mtime) até 90% dele
+- temporary_result_cache troca o cache do processo e devolve o anterior
+
+Uso:
+    python test_result_cache.py
+    python -m pytest test_result_cache.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import result_cache  # noqa: E402
+from result_cache import ResultCache, temporary_result_cache  # noqa: E402
+
+
+def _result(answer: str, filler: int = 0):
+    return {"template": "enem90_v5", "resultado": {"questoes": {"1": answer}}, "extra": "x" * filler}
+
+
+def test_memory_tier():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory, 0, 2)      # max_bytes 0: só memória
+        cache.put("a" * 64, _result("A"))
+        value = cache.get("a" * 64)
+        value["resultado"]["questoes"]["1"] = "B"
+        assert cache.get("a" * 64) == _result("A")
+
+        cache.put("b" * 64, _result("B"))
+        cache.get("a" * 64)                       # "a" passa a ser a mais recente
+        cache.put("c" * 64, _result("C"))
+        assert cache.get("b" * 64) is None and cache.get("a" * 64) == _result("A")
+        assert not os.listdir(directory)
+        info = cache.info()
+        assert (info["memory_hits"], info["misses"], info["stores"], info["memory_items"]) == (4, 1, 3, 2)
+
+
+def test_disk_tier():
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ResultCache(directory, 1 << 20, 4)
+        writer.put("d" * 64, _result("D"))
+        reader = ResultCache(directory, 1 << 20, 4)
+        assert reader.get("d" * 64) == _result("D")
+        assert reader.get("d" * 64) == _result("D")
+        assert (reader.disk_hits, reader.memory_hits) == (1, 1)
+
+        writer.put("e" * 64, _result("E"))
+        with open(writer._path("e" * 64), "w", encoding="utf-8") as f:
+            f.write("{corrompido")
+        assert reader.get("e" * 64) is None and reader.misses == 1
+
+        writer.clear()
+        assert ResultCache(directory, 1 << 20, 4).get("d" * 64) is None
+
+
+def test_overwrite_and_eviction():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResultCache(directory, 10_000, 4)
+        cache.put("f" * 64, _result("F", 100))    # primeira gravação: varre o diretório
+        for _ in range(20):
+            cache.put("f" * 64, _result("F", 100))
+        assert cache.info()["disk_bytes"] == cache._scan_bytes() and cache.evictions == 0
+        cache.put("f" * 64, _result("F", 10))     # menor: a conta também diminui
+        assert cache.info()["disk_bytes"] == cache._scan_bytes()
+
+        keys = [f"{i:02d}" * 32 for i in range(12)]
+        for age, key in enumerate(keys):
+            cache.put(key, _result(key[:2], 900))
+            # mtimes distintos e crescentes: a ordem de despejo é a de gravação
+            os.utime(cache._path(key), (1_000_000 + age, 1_000_000 + age))
+        assert cache.evictions > 0
+        assert cache.info()["disk_bytes"] == cache._scan_bytes() <= 10_000
+        disk = ResultCache(directory, 10_000, 1)
+        kept = [key for key in keys if disk.get(key) is not None]
+        assert kept == keys[len(keys) - len(kept):], kept     # saíram as mais antigas
+        assert keys[-1] in kept
+
+
+def test_temporary_result_cache():
+    previous = result_cache._result_cache
+    with temporary_result_cache() as cache:
+        if cache is not None:
+            assert result_cache.get_result_cache() is cache
+            cache.put("g" * 64, _result("G"))
+            directory = cache.directory
+            assert os.path.exists(cache._path("g" * 64))
+    assert result_cache._result_cache is previous
+    if result_cache.RESULT_CACHE_ENABLED:
+        assert not os.path.exists(directory)
+
+
+if __name__ == "__main__":
+    for test in (test_memory_tier, test_disk_tier, test_overwrite_and_eviction, test_temporary_result_cache):
+        test()
+        print(f"✅ {test.__name__}")
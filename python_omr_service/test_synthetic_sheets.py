@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Gerador de folhas sintéticas e comparação do benchmark:
+
+- folhas limpas e digitalizadas (rotação, desfoque, ruído, JPEG) dos templates
+  com marcadores são lidas sem erro nas questões marcadas
+- o gabarito (truth) é JSON e marcações duplas ficam fora da contagem
+- benchmark_omr.compare aponta etapas e acurácia piores que o baseline
+
+Uso:
+    python test_synthetic_sheets.py
+    python -m pytest test_synthetic_sheets.py
+"""
+import copy
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from benchmark_omr import compare  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet, score  # noqa: E402
+
+SCANNED = SheetOptions(blank_rate=0.0, double_rate=0.05, rotation=0.8, scale=0.9, blur=1.0, noise=8, jpeg_quality=60)
+
+
+def _read(sheet, template_key):
+    page = app.process_omr_page(app.decode_image_bytes(sheet.encode()), template_name=template_key)
+    return page["resultado"]["questoes"], page["alinhamento"]
+
+
+def test_generated_sheets_read_back():
+    rng = np.random.default_rng(11)
+    for key, template in app.AVAILABLE_TEMPLATES.items():
+        if "registration_marks" not in template:
+            continue
+        for options in (SheetOptions(blank_rate=0.0), SCANNED):
+            sheet = generate_sheet(template, rng, options)
+            answers, alignment = _read(sheet, key)
+            result = score(answers, sheet.truth)
+            assert alignment.get("aligned"), f"{key}: marcadores não encontrados"
+            assert result["errors"] == 0, f"{key} {options}: questões erradas {result['wrong']}"
+
+
+def test_truth_is_json():
+    template = app.AVAILABLE_TEMPLATES[app.DEFAULT_TEMPLATE_NAME]
+    sheet = generate_sheet(template, np.random.default_rng(3), SheetOptions(blank_rate=0.1, double_rate=0.1))
+    truth = json.loads(sheet.truth_json())
+    assert len(truth["questoes"]) == template["total_questions"]
+    doubles = [q for q, marked in truth["marks"].items() if len(marked) == 2]
+    assert doubles and all(truth["questoes"][q] is None for q in doubles)
+    assert score(truth["questoes"], truth)["errors"] == 0
+
+
+def test_benchmark_compare():
+    baseline = {
+        "resolutions": [{"template": "t", "scale": 1.0, "accuracy": 1.0,
+                         "stages": {"detect": {"median_ms": 1.0}, "decode": {"median_ms": 10.0}}}],
+        "batches": [{"template": "t", "batch_size": 8, "pages_per_second": 20.0}],
+    }
+    current = copy.deepcopy(baseline)
+    assert compare(current, baseline, 0.1) == []
+    current["resolutions"][0]["stages"]["decode"]["median_ms"] = 12.0
+    current["resolutions"][0]["accuracy"] = 0.99
+    current["batches"][0]["pages_per_second"] = 15.0
+    assert len(compare(current, baseline, 0.1)) == 3
+
+
+if __name__ == "__main__":
+    for test in (test_generated_sheets_read_back, test_truth_is_json, test_benchmark_compare):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Registro de templates (templates/*.json):
+
+- os JSONs do repositório passam na validação e o .npz compilado devolve a mesma definição
+- recarga a quente: JSON alterado entra no lugar, JSON inválido mantém a versão anterior,
+  JSON removido sai do registro; o template compilado (geometria) acompanha
+
+Uso:
+    python test_template_registry.py
+    python -m pytest test_template_registry.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compiled_template import get_compiled_template  # noqa: E402
+from template_registry import (  # noqa: E402
+    TEMPLATES_DIR, TemplateError, TemplateRegistry, compile_definition, load_compiled, validate_definition,
+)
+
+
+def _definition(name="cliente_x", y=500):
+    return {
+        "name": name,
+        "total_questions": 2,
+        "options": ["A", "B", "C"],
+        "bubble_radius": 10,
+        "reference_size": {"width": 1000, "height": 1400},
+        "registration_marks": {"p1": [20, 20], "p2": [980, 20], "p3": [20, 1380], "p4": [980, 1380]},
+        "questions": [
+            {"id": 1, "y": y, "x_positions": [100, 150, 200]},
+            {"id": 2, "y": y + 40, "x_positions": [100, 150, 200]},
+        ],
+    }
+
+
+def _write(directory, definition, name=None):
+    with open(os.path.join(directory, f"{name or definition['name']}.json"), "w", encoding="utf-8") as f:
+        json.dump(definition, f)
+
+
+def test_repository_templates_compile():
+    for entry in sorted(os.listdir(TEMPLATES_DIR)):
+        if entry.endswith(".json"):
+            with open(os.path.join(TEMPLATES_DIR, entry), encoding="utf-8") as f:
+                definition = json.load(f)
+            validate_definition(definition)
+            assert load_compiled(compile_definition(definition)) == definition, entry
+
+
+def test_schema_rejects_broken_definitions():
+    broken = [
+        dict(_definition(), options=[]),
+        dict(_definition(), reference_size={"width": 1000}),
+        dict(_definition(), questions=[{"id": 1, "y": 500, "x_positions": [100, 150]}]),
+        dict(_definition(), questions=[{"id": 1, "y": 5000, "x_positions": [100, 150, 200]}]),
+        dict(_definition(), registration_marks={"p1": [20, 20]}),
+    ]
+    for definition in broken:
+        try:
+            validate_definition(definition)
+        except TemplateError:
+            continue
+        raise AssertionError(f"definição inválida aceita: {definition}")
+
+
+def test_hot_reload():
+    directory = tempfile.mkdtemp(prefix="omr_templates_")
+    try:
+        registry = TemplateRegistry(directory, os.path.join(directory, ".compiled"), reload_seconds=0)
+        _write(directory, _definition())
+        assert registry.refresh() == ["cliente_x"]
+        template = registry.templates["cliente_x"]
+        assert get_compiled_template(template, 1000, 1400).centers[0, 0, 1] == 500
+        assert registry.refresh() == []
+
+        # Alterado: entra no lugar, e a geometria compilada é refeita
+        _write(directory, _definition(y=600))
+        os.utime(os.path.join(directory, "cliente_x.json"), ns=(1, 1))
+        assert registry.refresh() == ["cliente_x"]
+        template = registry.templates["cliente_x"]
+        assert get_compiled_template(template, 1000, 1400).centers[0, 0, 1] == 600
+
+        # Inválido: erro registrado, versão anterior mantida
+        with open(os.path.join(directory, "cliente_x.json"), "w") as f:
+            f.write("{ quebrado")
+        assert registry.refresh() == []
+        assert registry.templates["cliente_x"] is template and "cliente_x" in registry.errors
+
+        # Segunda carga do mesmo conteúdo vem do .npz
+        _write(directory, _definition(y=600))
+        reloaded = TemplateRegistry(directory, os.path.join(directory, ".compiled"), reload_seconds=0)
+        reloaded.refresh()
+        assert reloaded.templates["cliente_x"] == registry.templates["cliente_x"]
+
+        os.remove(os.path.join(directory, "cliente_x.json"))
+        assert registry.refresh() == ["cliente_x"] and "cliente_x" not in registry.templates
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    for test in (test_repository_templates_compile, test_schema_rejects_broken_definitions, test_hot_reload):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Ingestão dos uploads (upload_ingest.py) e memória por requisição:
+
+- upload grande vai para arquivo temporário e é lido por mmap; pequeno fica
+  em BytesIO; os dois decodificam igual aos bytes originais
+- decode_pil (faixas direto no array) é igual a np.array(Image.open(...))
+- ?timings=true traz o bloco "memory" e /metrics o histograma do pico (a
+  requisição precisa estar sozinha no processo: os testes fecham as respostas)
+
+Uso:
+    python test_upload_ingest.py
+    python -m pytest test_upload_ingest.py
+"""
+import io
+import os
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from image_decode import decode_image  # noqa: E402
+from metrics import memory_status  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+from synthetic_sheets import SheetOptions, generate_sheet  # noqa: E402
+from upload_ingest import UPLOAD_SPOOL_BYTES, UploadBuffer, spool_stream  # noqa: E402
+
+TEMPLATE = "enem90"
+
+
+def _upload(data, total_length):
+    stream = spool_stream(total_length)
+    stream.write(data)
+    stream.seek(0)
+    return UploadBuffer(stream)
+
+
+def test_spooled_upload_decodes_like_bytes():
+    rng = np.random.default_rng(21)
+    image = rng.integers(0, 256, (900, 700, 3), dtype=np.uint8)
+    data = cv2.imencode(".png", image)[1].tobytes()
+    assert len(data) > UPLOAD_SPOOL_BYTES
+    expected = np.array(Image.open(io.BytesIO(data)))
+    expected_gray = decode_image(data, "gray")
+    for total_length in (None, len(data) + 512, 1024):
+        with _upload(data, total_length) as upload:
+            assert upload.mapped == (total_length != 1024)
+            assert len(upload) == len(data) and upload.to_bytes() == data
+            assert np.array_equal(decode_image(upload.data), expected)
+            assert np.array_equal(decode_image(upload.data, "gray"), expected_gray)
+    for mode in ("L", "RGB", "RGBA", "P"):
+        img = Image.fromarray(image).convert(mode)
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        assert np.array_equal(decode_image(buffer.getvalue()), np.array(img)), mode
+
+
+def test_memory_block_and_metric():
+    if memory_status() is None:
+        return
+    client = app.app.test_client()
+    sheet = generate_sheet(app.AVAILABLE_TEMPLATES[TEMPLATE], np.random.default_rng(22), SheetOptions(noise=4))
+    data = sheet.encode()
+    before = app.REQUEST_PEAK_MEMORY.count("/api/process-image")
+    # Resposta não fechada (close) continua "em andamento" e o pico deixa de ser exclusivo
+    assert app.IN_FLIGHT.value() == 0, "requisição anterior sem response.close()"
+    with temporary_result_cache():
+        response = client.post("/api/process-image?timings=true",
+                               data={"image": (io.BytesIO(data), "folha.png"), "template": TEMPLATE})
+        body = response.get_json()
+        response.close()
+    assert body["status"] == "sucesso", body
+    memory = body["memory"]
+    assert memory["exclusive"] and memory["peak_mb"] >= memory["rss_start_mb"]
+    assert app.REQUEST_PEAK_MEMORY.count("/api/process-image") == before + 1
+
+
+if __name__ == "__main__":
+    for test in (test_spooled_upload_decodes_like_bytes, test_memory_block_and_metric):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Fluxo assíncrono de validação ChatGPT contra o stand-in local (sem rede).
+
+- /api/process-image?validate_with_chatgpt=true responde antes da validação
+  terminar, com job_id; o job é concluído pelo pool e lido por polling
+- o callback_url recebe o job concluído; fora de OMR_CALLBACK_ALLOWLIST é
+  recusado com 400 antes da leitura (nenhum job, nenhum POST), e um
+  redirecionamento do host permitido não é seguido
+- validation_mode=crops envia só o mosaico das questões ambíguas;
+  validation_mode=page sempre envia a página inteira (com ou sem acerto no cache)
+- respostas do modelo conferidas: só alternativas do template ou "Não
+  respondeu"; as correções são as questões que de fato mudaram
+- validation_mode=batch dispensa folhas confiantes e junta as ambíguas de
+  várias folhas numa chamada só
+- carga: N folhas com validação em paralelo (python test_validation_jobs.py 40)
+
+Uso:
+    python test_validation_jobs.py [N]
+    python -m pytest test_validation_jobs.py
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub_server import start_stub_server  # noqa: E402
+
+LATENCY_MS = 400
+_server, _state = start_stub_server(latency_ms=LATENCY_MS)
+STUB_URL = f"http://127.0.0.1:{_server.server_address[1]}"
+os.environ["OMR_OPENAI_API_URL"] = f"{STUB_URL}/v1/chat/completions"
+os.environ["OMR_CALLBACK_ALLOWLIST"] = f"{STUB_URL}/callback,{STUB_URL}/redirect/"
+os.environ.setdefault("OMR_VALIDATION_JOBS_DIR", tempfile.mkdtemp(prefix="omr_jobs_"))
+
+import app  # noqa: E402
+import validation_crops  # noqa: E402
+import validation_jobs  # noqa: E402
+from result_cache import temporary_result_cache  # noqa: E402
+
+# Se o app já tinha sido importado (pytest com outros testes), aponta para o stub mesmo assim
+app.OPENAI_API_URL = os.environ["OMR_OPENAI_API_URL"]
+validation_jobs.CALLBACK_ALLOWLIST = os.environ["OMR_CALLBACK_ALLOWLIST"].split(",")
+
+IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "attached_assets", "gabarito_pintado.png")
+
+
+def _submit(client, image_bytes, page=1, callback_url=None, query=""):
+    data = {"image": (io.BytesIO(image_bytes), "folha.png"), "page": str(page), "openai_api_key": "stub"}
+    if callback_url:
+        data["callback_url"] = callback_url
+    return _closed(client.post(f"/api/process-image?validate_with_chatgpt=true{query}", data=data))
+
+
+def _closed(response):
+    """Resposta lida e fechada: sem close() a requisição segue contando como em andamento."""
+    response.get_data()
+    response.close()
+    return response
+
+
+def _wait(client, job_id, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = _closed(client.get(f"/api/validation-jobs/{job_id}")).get_json()
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} não terminou em {timeout}s")
+
+
+def test_async_validation_job():
+    client = app.app.test_client()
+    with open(IMAGE_PATH, "rb") as f:
+        image_bytes = f.read()
+
+    start = time.perf_counter()
+    response = _submit(client, image_bytes, callback_url=f"{STUB_URL}/callback")
+    elapsed = time.perf_counter() - start
+    body = response.get_json()
+    validation = body["chatgpt_validation"]
+    assert response.status_code == 200 and validation["status"] == "queued"
+    # A resposta do OMR não espera a latência do LLM (o OMR da folha leva bem menos)
+    assert elapsed < LATENCY_MS / 1000.0 + 1.0
+
+    job = _wait(client, validation["job_id"])
+    assert job["status"] == "done", job
+    assert job["result"]["chatgpt_validated"] == body["pagina"]["resultado"]["questoes"]
+    assert job["result"]["agreement_rate"] == 100.0
+
+    deadline = time.time() + 5
+    while time.time() < deadline and not any(c.get("job_id") == job["job_id"] for c in _state.callbacks):
+        time.sleep(0.05)
+    assert any(c.get("job_id") == job["job_id"] and c["status"] == "done" for c in _state.callbacks)
+
+    assert _closed(client.get("/api/validation-jobs/naoexiste")).status_code == 404
+
+
+def _job_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def test_callback_allowlist():
+    allowlist = ["hooks.escola.br", "interno:8443", "https://api.escola.br/omr"]
+    for url in ("https://hooks.escola.br/qualquer", "http://HOOKS.escola.br:9000/x", "https://interno:8443/cb",
+                "https://api.escola.br/omr", "https://api.escola.br/omr/job?id=1"):
+        assert validation_jobs.callback_allowed(url, allowlist), url
+    for url in ("https://evil.br/cb", "https://hooks.escola.br.evil.br/", "https://interno/cb",
+                "https://api.escola.br/omr-evil", "https://api.escola.br/omr@evil.br/", "https://api.escola.br/",
+                "file:///etc/passwd", "gopher://hooks.escola.br/", "http://[::1/", "nao e url"):
+        assert not validation_jobs.callback_allowed(url, allowlist), url
+    assert not validation_jobs.callback_allowed("https://hooks.escola.br/", [])
+
+    client = app.app.test_client()
+    with open(IMAGE_PATH, "rb") as f:
+        image_bytes = f.read()
+    jobs_dir = app.validation_jobs().directory
+    received, jobs = len(_state.callbacks), _job_files(jobs_dir)
+    for query in ("", "&validation_mode=batch"):
+        response = _submit(client, image_bytes, callback_url="http://169.254.169.254/latest/meta-data", query=query)
+        body = response.get_json()
+        assert response.status_code == 400 and body["status"] == "erro" and "callback_url" in body["mensagem"]
+    # Direto no pool: recusado antes de criar o job
+    try:
+        app.validation_jobs().submit(lambda: {}, callback_url=f"{STUB_URL}.evil/callback")
+        raise AssertionError("callback fora da allowlist aceito")
+    except validation_jobs.CallbackNotAllowed:
+        pass
+    assert _job_files(jobs_dir) == jobs and len(_state.callbacks) == received
+
+    # Host permitido redireciona (307) para uma URL fora da allowlist: o POST não segue
+    redirects = _state.redirects
+    job = app.validation_jobs().submit(lambda: {"ok": True},
+                                       callback_url=f"{STUB_URL}/redirect/?to={STUB_URL}/callbacks-interno")
+    deadline = time.time() + 10
+    while time.time() < deadline and "callback_status" not in (app.validation_jobs().get(job["job_id"]) or {}):
+        time.sleep(0.05)
+    assert app.validation_jobs().get(job["job_id"])["callback_status"] == 307
+    assert _state.redirects == redirects + 1 and len(_state.callbacks) == received
+
+
+def test_crops_validation():
+    client = app.app.test_client()
+    with open(IMAGE_PATH, "rb") as f:
+        image_bytes = f.read()
+
+    # Folha bem marcada: nenhuma questão ambígua, nenhuma chamada ao modelo
+    before = _state.completions
+    body = _submit(client, image_bytes, query="&validation_mode=crops&validation_async=false").get_json()
+    validation = body["chatgpt_validation"]
+    assert validation["mode"] == "crops" and validation["questions_sent"] == []
+    assert validation["chatgpt_validated"] == body["pagina"]["resultado"]["questoes"]
+    assert _state.completions == before
+
+    # Margem alta: algumas questões viram ambíguas e só elas vão no mosaico
+    saved = validation_crops.VALIDATION_MARGIN
+    validation_crops.VALIDATION_MARGIN = 0.63
+    try:
+        body = _submit(client, image_bytes, query="&validation_mode=crops").get_json()
+    finally:
+        validation_crops.VALIDATION_MARGIN = saved
+    job = _wait(client, body["chatgpt_validation"]["job_id"])
+    assert job["status"] == "done", job
+    result = job["result"]
+    sent = result["questions_sent"]
+    assert 0 < len(sent) < len(body["pagina"]["resultado"]["questoes"])
+    assert result["chatgpt_validated"] == body["pagina"]["resultado"]["questoes"]
+    # Mosaico JPEG de poucas linhas: ordem de grandeza abaixo da página inteira
+    assert result["payload_bytes"] * 10 < len(image_bytes)
+    assert _state.image_chars[-1] < len(image_bytes) // 10
+
+
+def test_page_mode_sends_page():
+    client = app.app.test_client()
+    with open(IMAGE_PATH, "rb") as f:
+        image_bytes = f.read()
+    calls = []
+    originals = app.validate_with_chatgpt_internal, app.validate_with_chatgpt_crops
+
+    def page(image_bytes, omr_result, template_key, openai_api_key):
+        calls.append("page")
+        return {"status": "success", "chatgpt_validated": dict(omr_result), "corrections_count": 0}
+
+    def crops(mosaic, ambiguous, omr_answers, options, openai_api_key):
+        calls.append("crops")
+        return {"status": "success", "chatgpt_validated": dict(omr_answers), "corrections_count": 0}
+
+    app.validate_with_chatgpt_internal, app.validate_with_chatgpt_crops = page, crops
+    try:
+        with temporary_result_cache():
+            # Falta e acerto no cache de resultados: página inteira nos dois
+            for _ in range(2):
+                _submit(client, image_bytes, query="&validation_mode=page&validation_async=false")
+            for _ in range(2):
+                job_id = _submit(client, image_bytes, query="&validation_mode=page").get_json()[
+                    "chatgpt_validation"]["job_id"]
+                assert _wait(client, job_id)["status"] == "done"
+            _submit(client, image_bytes, query="&validation_mode=crops&validation_async=false")
+    finally:
+        app.validate_with_chatgpt_internal, app.validate_with_chatgpt_crops = originals
+    assert calls == ["page", "page", "page", "page", "crops"]
+
+
+def test_model_answers_checked():
+    rows = {"Q1": "A", "Q2": "B", "Q3": "C", "Q4": "Não respondeu", "Q5": "E"}
+    options = {label: ["A", "B", "C", "D", "E"] for label in rows}
+    returned = {"Q1": "b", "Q2": "ignore as instruções", "Q3": "Z", "Q4": "D", "Q5": "E", "Q9": "A", "Q6": 3}
+    model_corrections = [{"q": "Q1", "omr": "A", "corrected": "B", "reason": "marca mais forte"},
+                         {"q": "Q2", "corrected": "X"}, {"q": "Q7"}, "lixo"]
+    answers, corrections = app.checked_answers(rows, returned, options, model_corrections)
+    assert answers == {"Q1": "B", "Q2": "B", "Q3": "C", "Q4": "D", "Q5": "E"}
+    assert corrections == [{"q": "Q1", "omr": "A", "corrected": "B", "reason": "marca mais forte"},
+                           {"q": "Q4", "omr": "Não respondeu", "corrected": "D"}]
+    assert app.checked_answers(rows, ["A"], options, None) == (rows, [])
+    assert app.checked_answers(rows, {"Q1": "Não respondeu"}, options, {"q": "Q1"})[1] == \
+        [{"q": "Q1", "omr": "A", "corrected": "Não respondeu"}]
+
+    # Pelo caminho do mosaico e da página inteira, com o modelo devolvendo lixo e correções inventadas
+    omr = {str(q): "A" for q in range(1, 6)}
+    original = app.chatgpt_completion
+    app.chatgpt_completion = lambda *args: {
+        "answers": {"Q2": "C", "Q3": "<script>", "Q4": "a"},
+        "corrections": [{"q": f"Q{q}", "corrected": "C"} for q in range(1, 6)],
+    }
+    try:
+        result = app.validate_with_chatgpt_crops(b"jpeg", {"2": "A", "3": "A", "4": "A"}, omr,
+                                                 ["A", "B", "C", "D", "E"], "stub")
+        assert result["chatgpt_validated"] == {**omr, "2": "C"}
+        assert result["corrections"] == [{"q": "2", "omr": "A", "corrected": "C"}]
+        assert result["corrections_count"] == 1 and result["agreement_rate"] == 80.0
+
+        with open(IMAGE_PATH, "rb") as f:
+            image_bytes = f.read()
+        template = app.AVAILABLE_TEMPLATES["enem90_v5"]
+        omr = {str(q): "A" for q in range(1, template["total_questions"] + 1)}
+        app.chatgpt_completion = lambda *args: {
+            "answers": ["B", "?", "Não respondeu"] + ["A"] * (template["total_questions"] + 5),
+            "corrections": [{"q": 50, "corrected": "E"}],
+        }
+        result = app.validate_with_chatgpt_internal(image_bytes, omr, "enem90_v5", "stub")
+        assert result["chatgpt_validated"] == {**omr, "1": "B", "3": "Não respondeu"}
+        assert [c["q"] for c in result["corrections"]] == ["1", "3"] and result["corrections_count"] == 2
+    finally:
+        app.chatgpt_completion = original
+
+
+def test_batch_router():
+    client = app.app.test_client()
+    with open(IMAGE_PATH, "rb") as f:
+        image_bytes = f.read()
+    batcher = app.validation_batcher(app.validate_sheets_with_chatgpt)
+
+    # Folha confiante: nenhum job, nenhuma chamada
+    validation = _submit(client, image_bytes, query="&validation_mode=batch").get_json()["chatgpt_validation"]
+    assert validation["status"] == "skipped" and validation["reason"] == "confident"
+
+    # Lote só sai no flush (sem o timer no meio do teste)
+    saved = validation_crops.VALIDATION_MARGIN, batcher.max_wait
+    validation_crops.VALIDATION_MARGIN, batcher.max_wait = 0.63, 600
+    before = _state.completions
+    try:
+        bodies = [_submit(client, image_bytes, page, query="&validation_mode=batch").get_json() for page in (1, 2, 3)]
+    finally:
+        validation_crops.VALIDATION_MARGIN, batcher.max_wait = saved
+    batcher.flush()
+    jobs = [_wait(client, body["chatgpt_validation"]["job_id"]) for body in bodies]
+    # Três folhas, uma chamada; cada job com as respostas da sua folha
+    assert _state.completions == before + 1
+    for body, job in zip(bodies, jobs):
+        assert job["status"] == "done", job
+        result = job["result"]
+        assert result["mode"] == "batch" and result["batch_sheets"] == 3
+        assert result["chatgpt_validated"] == body["pagina"]["resultado"]["questoes"]
+        assert len(result["questions_sent"]) == body["chatgpt_validation"]["questions"] > 0
+    assert batcher.info()["skipped_confident"] >= 1
+
+
+def load_test(n):
+    """N folhas com validação: tempo até todas as respostas OMR e até todas as validações."""
+    client = app.app.test_client()
+    with open(IMAGE_PATH, "rb") as f:
+        image_bytes = f.read()
+    start = time.perf_counter()
+    job_ids = []
+    for page in range(1, n + 1):
+        validation = _submit(client, image_bytes, page).get_json()["chatgpt_validation"]
+        if validation["status"] == "queued":
+            job_ids.append(validation["job_id"])
+    omr_done = time.perf_counter() - start
+    jobs = [_wait(client, job_id, timeout=600) for job_id in job_ids]
+    all_done = time.perf_counter() - start
+    ok = sum(1 for j in jobs if j["status"] == "done")
+    print(f"{n} folhas | OMR respondido em {omr_done:.2f}s | {len(job_ids)} jobs, {ok} ok, "
+          f"validação concluída em {all_done:.2f}s | latência do stub {LATENCY_MS} ms, "
+          f"{app.validation_jobs().workers} workers")
+
+
+if __name__ == "__main__":
+    test_async_validation_job()
+    print("✅ test_async_validation_job")
+    test_callback_allowlist()
+    print("✅ test_callback_allowlist")
+    test_crops_validation()
+    print("✅ test_crops_validation")
+    test_page_mode_sends_page()
+    print("✅ test_page_mode_sends_page")
+    test_model_answers_checked()
+    print("✅ test_model_answers_checked")
+    test_batch_router()
+    print("✅ test_batch_router")
+    load_test(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
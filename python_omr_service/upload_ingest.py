@@ -0,0 +1,99 @@
+"""
+Ingestão dos uploads de imagem sem cópias duplicadas.
+
+O Werkzeug grava cada arquivo do multipart no stream de spool_stream()
+(OMRRequest._get_file_stream): BytesIO quando a requisição inteira cabe em
+OMR_UPLOAD_SPOOL_KB, arquivo temporário (OMR_UPLOAD_TMPDIR) acima disso ou
+sem Content-Length. UploadBuffer expõe o conteúdo sem ler para um novo bytes:
+
+- arquivo temporário: mmap somente leitura; as páginas vêm do page cache sob
+  demanda e não contam como memória anônima do worker
+- BytesIO: getvalue(), que no CPython devolve o próprio buffer (sem cópia)
+
+O hash do cache de resultados e os decodificadores (image_decode) leem direto
+de `data`. Bytes próprios (to_bytes) só quando algo precisa sobreviver à
+requisição: o job assíncrono da validação em modo página.
+"""
+from typing import IO, Optional, Union
+import io
+import mmap
+import os
+import tempfile
+
+# Acima disso (requisição inteira) o upload vai para disco
+UPLOAD_SPOOL_BYTES = int(os.getenv("OMR_UPLOAD_SPOOL_KB", "512")) * 1024
+UPLOAD_TMPDIR = os.getenv("OMR_UPLOAD_TMPDIR") or None
+
+UploadData = Union[bytes, mmap.mmap]
+
+
+def spool_stream(total_content_length: Optional[int]) -> IO[bytes]:
+    """Destino de um arquivo do multipart: memória se a requisição é pequena, senão disco."""
+    if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_BYTES:
+        return io.BytesIO()
+    return tempfile.TemporaryFile("w+b", dir=UPLOAD_TMPDIR)
+
+
+class UploadBuffer:
+    """Conteúdo de um upload (FileStorage) como bytes ou mmap, sem cópia."""
+
+    def __init__(self, stream: IO[bytes]):
+        self.stream = stream
+        self._data: Optional[UploadData] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    @classmethod
+    def from_storage(cls, storage) -> "UploadBuffer":
+        return cls(storage.stream)
+
+    @property
+    def data(self) -> UploadData:
+        if self._data is None:
+            self._data = self._open()
+        return self._data
+
+    @property
+    def mapped(self) -> bool:
+        """True se o conteúdo é um mmap do arquivo temporário."""
+        self.data
+        return self._mmap is not None
+
+    def _open(self) -> UploadData:
+        stream = self.stream
+        if isinstance(stream, io.BytesIO):
+            return stream.getvalue()
+        try:
+            stream.flush()
+            fd = stream.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            # Stream sem arquivo por trás: lê uma vez
+            stream.seek(0)
+            return stream.read()
+        if os.fstat(fd).st_size == 0:
+            return b""
+        self._mmap = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def to_bytes(self) -> bytes:
+        """Cópia própria (para o que roda depois da requisição)."""
+        data = self.data
+        return data if isinstance(data, bytes) else data[:]
+
+    def close(self) -> None:
+        self._data = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Ainda há um array apontando para o mmap: o GC fecha depois
+                pass
+            self._mmap = None
+
+    def __enter__(self) -> "UploadBuffer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
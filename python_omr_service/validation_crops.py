@@ -0,0 +1,131 @@
+"""
+Validação por recortes: só as questões ambíguas vão para o modelo.
+
+Em vez da página inteira (megabytes em PNG/base64), monta um mosaico JPEG
+com uma faixa por questão ambígua, recortada da imagem alinhada: rótulo da
+questão à esquerda, letras das alternativas acima de cada bolha.
+
+Ambiguidade = margem 1ª-2ª (a mesma grandeza da escada de thresholds da
+detecção) abaixo de OMR_VALIDATION_MARGIN. A margem é medida em fração de
+tinta: preprocess_image gera 0/1, então a escuridão da detecção fica em
+[254/255, 1] e tinta = 1 - 255 * (1 - escuridão). A menor margem da folha
+(sheet_margin) é a confiança usada pelo roteador do modo batch.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+
+import cv2
+import numpy as np
+
+from omr_result import ink_fraction
+
+VALIDATION_MARGIN = float(os.getenv("OMR_VALIDATION_MARGIN", "0.2"))
+VALIDATION_JPEG_QUALITY = int(os.getenv("OMR_VALIDATION_JPEG_QUALITY", "70"))
+
+# Geometria do mosaico (pixels)
+ROW_HEIGHT = 40
+LETTER_STRIP = 14
+LABEL_WIDTH = 96
+ROW_GAP = 4
+
+
+def row_margins(darkness: np.ndarray) -> np.ndarray:
+    """Margem 1ª-2ª (em tinta) de cada questão; com uma alternativa só, a própria tinta."""
+    ink = ink_fraction(darkness)
+    if ink.shape[1] < 2:
+        return ink.max(axis=1)
+    top2 = np.partition(ink, -2, axis=1)[:, -2:]
+    return top2[:, 1] - top2[:, 0]
+
+
+def sheet_margin(reading) -> float:
+    """Confiança da folha: a menor margem 1ª-2ª entre as questões (usada pelo roteador de validação)."""
+    margins = row_margins(reading.darkness())
+    return float(margins.min()) if margins.size else 1.0
+
+
+def ambiguous_rows(reading, margin: Optional[float] = None) -> List[int]:
+    """Linhas do template (ordem das questões) com margem abaixo de `margin` (None = OMR_VALIDATION_MARGIN)."""
+    if margin is None:
+        margin = VALIDATION_MARGIN
+    margins = row_margins(reading.darkness())
+    return np.flatnonzero(margins < margin).tolist()
+
+
+def _to_gray(crop: np.ndarray) -> np.ndarray:
+    if crop.ndim == 2:
+        return crop
+    code = cv2.COLOR_RGBA2GRAY if crop.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return cv2.cvtColor(crop, code)
+
+
+def row_strip(reading, row: int) -> np.ndarray:
+    """Faixa de uma questão: recorte da linha (cinza) com as letras das alternativas acima."""
+    compiled = reading.compiled
+    radius = compiled.radius
+    xs = compiled.centers[row, :, 0].astype(np.float64)
+    cy = float(compiled.centers[row, 0, 1])
+    scale_x = reading.page_size[0] / reading.bw_page_size[0]
+    scale_y = reading.page_size[1] / reading.bw_page_size[1]
+    ox, oy = reading.image_origin
+    h, w = reading.image.shape[:2]
+
+    x1 = max(0, int((xs.min() - 2 * radius) * scale_x) - ox)
+    x2 = min(w, int((xs.max() + 2 * radius) * scale_x) - ox)
+    y1 = max(0, int((cy - 1.6 * radius) * scale_y) - oy)
+    y2 = min(h, int((cy + 1.6 * radius) * scale_y) - oy)
+    if x2 <= x1 or y2 <= y1:
+        crop = np.full((ROW_HEIGHT, ROW_HEIGHT), 255, dtype=np.uint8)
+        factor = 1.0
+    else:
+        crop = _to_gray(reading.image[y1:y2, x1:x2])
+        factor = ROW_HEIGHT / crop.shape[0]
+        crop = cv2.resize(crop, (max(1, int(round(crop.shape[1] * factor))), ROW_HEIGHT), interpolation=cv2.INTER_AREA)
+
+    strip = np.full((LETTER_STRIP + ROW_HEIGHT, crop.shape[1]), 255, dtype=np.uint8)
+    strip[LETTER_STRIP:] = crop
+    for letter, x in zip(compiled.options, xs.tolist()):
+        lx = int((x * scale_x - ox - x1) * factor) - 4
+        cv2.putText(strip, letter, (lx, LETTER_STRIP - 3), cv2.FONT_HERSHEY_SIMPLEX, 0.4, 0, 1, cv2.LINE_AA)
+    return strip
+
+
+def build_mosaic(rows: Sequence[Tuple[str, np.ndarray]], quality: Optional[int] = None) -> bytes:
+    """Empilha as faixas (rótulo à esquerda, alinhadas à esquerda) e codifica em JPEG."""
+    width = LABEL_WIDTH + max(s.shape[1] for _, s in rows)
+    height = sum(s.shape[0] for _, s in rows) + ROW_GAP * (len(rows) - 1)
+    mosaic = np.full((height, width), 255, dtype=np.uint8)
+    y = 0
+    for label, s in rows:
+        mosaic[y:y + s.shape[0], LABEL_WIDTH:LABEL_WIDTH + s.shape[1]] = s
+        cv2.putText(mosaic, label, (4, y + s.shape[0] - ROW_HEIGHT // 2 + 6),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, 0, 1, cv2.LINE_AA)
+        y += s.shape[0]
+        if y < height:
+            mosaic[y + ROW_GAP // 2, :] = 180
+        y += ROW_GAP
+    params = [cv2.IMWRITE_JPEG_QUALITY, VALIDATION_JPEG_QUALITY if quality is None else quality]
+    ok, buffer = cv2.imencode(".jpg", mosaic, params)
+    if not ok:
+        raise ValueError("Falha ao codificar o mosaico de validação")
+    return buffer.tobytes()
+
+
+def ambiguous_strips(reading, answers: Dict[str, str],
+                     margin: Optional[float] = None) -> Tuple[Dict[str, str], List[np.ndarray]]:
+    """{questão: resposta do OMR} das questões ambíguas e a faixa de cada uma (mesma ordem)."""
+    keys = reading.compiled.question_keys
+    rows = ambiguous_rows(reading, margin)
+    return {keys[row]: answers.get(keys[row]) for row in rows}, [row_strip(reading, row) for row in rows]
+
+
+def ambiguous_crops(reading, answers: Dict[str, str],
+                    margin: Optional[float] = None) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Mosaico JPEG das questões ambíguas da página e {questão: resposta do OMR} delas.
+    Sem questões ambíguas: (b"", {}).
+    """
+    ambiguous, strips = ambiguous_strips(reading, answers, margin)
+    if not ambiguous:
+        return b"", {}
+    return build_mosaic([(f"Q{q}", strip) for q, strip in zip(ambiguous, strips)]), ambiguous
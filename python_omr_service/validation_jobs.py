@@ -0,0 +1,377 @@
+"""
+Jobs assíncronos de validação por LLM (ChatGPT).
+
+A validação pode levar até 60s; em vez de prender o worker HTTP, o endpoint
+devolve as respostas do OMR na hora com um job_id e a chamada ao LLM roda num
+pool limitado de threads, todas com a mesma requests.Session (conexões
+keep-alive reaproveitadas).
+
+O estado de cada job é um JSON num diretório (gravação atômica), então o
+polling funciona com qualquer worker do gunicorn, não só com o que criou o job.
+Opcionalmente o resultado é enviado por POST para um callback_url, desde que
+ele esteja em OMR_CALLBACK_ALLOWLIST (o servidor não faz POST para qualquer
+URL que o cliente mandar).
+
+ValidationBatcher agrupa as questões ambíguas de várias folhas numa mesma
+chamada (modo batch), com o resultado de cada folha no job dela.
+
+OMR_OPENAI_API_URL troca a API remota por um servidor local
+(openai_stub_server.py) para testes e carga offline.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from startup_profile import lazy_import
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_URL = os.getenv("OMR_OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+VALIDATION_WORKERS = int(os.getenv("OMR_VALIDATION_WORKERS", "4"))
+# Jobs aguardando ou rodando por processo; acima disso a validação é recusada
+VALIDATION_QUEUE_MAX = int(os.getenv("OMR_VALIDATION_QUEUE_MAX", "64"))
+VALIDATION_JOBS_DIR = os.getenv("OMR_VALIDATION_JOBS_DIR", os.path.join(tempfile.gettempdir(), "omr_validation_jobs"))
+VALIDATION_JOB_TTL = int(os.getenv("OMR_VALIDATION_JOB_TTL", "3600"))
+CALLBACK_TIMEOUT = 10
+# Hosts ("hooks.escola.br", "hooks.escola.br:8443") ou prefixos de URL
+# ("https://hooks.escola.br/omr/") aceitos como callback_url, separados por
+# vírgula; vazio = callbacks desligados
+CALLBACK_ALLOWLIST = [entry.strip() for entry in os.getenv("OMR_CALLBACK_ALLOWLIST", "").split(",") if entry.strip()]
+
+
+class ValidationQueueFull(Exception):
+    """Fila de validação cheia."""
+
+
+class CallbackNotAllowed(ValueError):
+    """callback_url fora de OMR_CALLBACK_ALLOWLIST."""
+
+
+def callback_allowed(url: str, allowlist: Optional[List[str]] = None) -> bool:
+    """
+    True se url é http(s) e bate com uma entrada da allowlist: host (com ou sem
+    porta) igual ao da URL, ou prefixo de URL terminado em "/" (ou a URL exata),
+    para que "https://hooks.escola.br" não aceite "https://hooks.escola.br.evil".
+    """
+    allowlist = CALLBACK_ALLOWLIST if allowlist is None else allowlist
+    try:
+        parts = urlsplit(url)
+        host, port = (parts.hostname or "").lower(), parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or not host:
+        return False
+    for entry in allowlist:
+        if "://" in entry:
+            prefix = entry if entry.endswith("/") else entry + "/"
+            if url == entry or url.startswith(prefix):
+                return True
+        elif entry.lower() in (host, f"{host}:{port}"):
+            return True
+    return False
+
+
+def check_callback_url(url: Optional[str]) -> None:
+    """Levanta CallbackNotAllowed se url (quando dada) não está na allowlist."""
+    if url and not callback_allowed(url):
+        raise CallbackNotAllowed(f"callback_url não permitido (OMR_CALLBACK_ALLOWLIST): {url}")
+
+
+# requests (~70 ms de import com urllib3/certifi) só entra no primeiro uso
+_session = None
+_session_lock = Lock()
+
+
+def http_session():
+    """requests.Session compartilhada, com pool de conexões do tamanho do pool de validação."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            requests = lazy_import("requests")
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(VALIDATION_WORKERS, 4))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class ValidationJobs:
+    """Pool limitado de validações + estado dos jobs em disco."""
+
+    def __init__(self, directory: str, workers: int, queue_max: int, ttl: int):
+        self.directory = directory
+        self.workers = workers
+        self.queue_max = queue_max
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="validacao")
+        self._lock = Lock()
+        self._in_flight = 0
+        self._last_cleanup = 0.0
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _write(self, job: Dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(job["job_id"]))
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Estado do job (qualquer processo), ou None se não existir/expirou."""
+        if not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def create(self, meta: Optional[Dict] = None) -> Dict:
+        """
+        Registra um job "queued" (concluído depois por finish).
+        Levanta ValidationQueueFull se já houver queue_max jobs neste processo.
+        """
+        with self._lock:
+            if self._in_flight >= self.queue_max:
+                raise ValidationQueueFull(f"Fila de validação cheia ({self.queue_max} jobs)")
+            self._in_flight += 1
+
+        job = {"job_id": uuid.uuid4().hex, "status": "queued", "created_at": time.time()}
+        if meta:
+            job.update(meta)
+        try:
+            self._write(job)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        self._cleanup()
+        return job
+
+    def start(self, job: Dict) -> None:
+        job.update(status="running", started_at=time.time())
+        self._write(job)
+
+    def finish(self, job: Dict, result: Optional[Dict] = None, error: Optional[str] = None,
+               callback_url: Optional[str] = None) -> None:
+        """Grava o job como done/error, envia o callback e libera a vaga na fila."""
+        try:
+            if error is None:
+                job.update(status="done", result=result)
+            else:
+                job.update(status="error", error=error)
+            job["finished_at"] = time.time()
+            self._write(job)
+            if callback_url:
+                self._callback(job, callback_url)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def execute(self, fn: Callable, *args) -> None:
+        """Roda fn(*args) no pool de validação."""
+        self._executor.submit(fn, *args)
+
+    def submit(self, run: Callable[[], Dict], callback_url: Optional[str] = None, meta: Optional[Dict] = None) -> Dict:
+        """
+        Enfileira run() e retorna o job (status "queued").
+        Levanta CallbackNotAllowed se callback_url não está na allowlist e
+        ValidationQueueFull se já houver queue_max jobs neste processo.
+        """
+        check_callback_url(callback_url)
+        job = self.create(meta)
+        try:
+            self._executor.submit(self._run, job, run, callback_url)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        return job
+
+    def _run(self, job: Dict, run: Callable[[], Dict], callback_url: Optional[str]) -> None:
+        try:
+            self.start(job)
+            result = run()
+        except Exception as e:
+            self.finish(job, error=str(e), callback_url=callback_url)
+        else:
+            self.finish(job, result=result, callback_url=callback_url)
+
+    def _callback(self, job: Dict, callback_url: str) -> None:
+        try:
+            # Sem seguir redirecionamentos: um host da allowlist não pode mandar o POST para outra URL
+            response = http_session().post(callback_url, json=job, timeout=CALLBACK_TIMEOUT, allow_redirects=False)
+            job["callback_status"] = response.status_code
+            if response.is_redirect:
+                logger.warning(f"[Validação] Callback redirecionado ({callback_url} → "
+                               f"{response.headers.get('Location')}), não seguido")
+        except lazy_import("requests").RequestException as e:
+            logger.warning(f"[Validação] Callback falhou ({callback_url}): {e}")
+            job["callback_status"] = "erro"
+        self._write(job)
+
+    def _cleanup(self) -> None:
+        """Remove jobs mais antigos que o TTL (no máximo uma varredura por minuto)."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_cleanup < 60:
+                return
+            self._last_cleanup = now
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+    def info(self) -> Dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {"in_flight": in_flight, "queue_max": self.queue_max,
+                "workers": self.workers, "api_url": OPENAI_API_URL}
+
+
+_jobs: Optional[ValidationJobs] = None
+_jobs_lock = Lock()
+
+
+def validation_jobs() -> ValidationJobs:
+    """Pool de validação do processo (criado no primeiro uso, depois do fork)."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = ValidationJobs(VALIDATION_JOBS_DIR, VALIDATION_WORKERS, VALIDATION_QUEUE_MAX, VALIDATION_JOB_TTL)
+        return _jobs
+
+
+VALIDATION_BATCH_ROWS = int(os.getenv("OMR_VALIDATION_BATCH_ROWS", "40"))
+VALIDATION_BATCH_WAIT_MS = int(os.getenv("OMR_VALIDATION_BATCH_WAIT_MS", "2000"))
+
+
+class ValidationBatcher:
+    """
+    Junta as questões ambíguas de várias folhas numa mesma chamada ao modelo.
+
+    Cada folha ganha seu job (polling/callback iguais aos da validação por
+    folha); as folhas pendentes com a mesma chave de API vão juntas quando
+    somam max_rows questões ou max_wait segundos depois da primeira.
+    call(api_key, payloads) faz a chamada e devolve o resultado de cada folha,
+    na mesma ordem. Folhas confiantes não chegam aqui (ver skip).
+    """
+
+    def __init__(self, jobs: ValidationJobs, call: Callable[[str, List], List[Dict]], max_rows: int, max_wait: float):
+        self.jobs = jobs
+        self.call = call
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._lock = Lock()
+        self._pending: Dict[str, List[Tuple[Dict, object, Optional[str]]]] = {}
+        self._rows: Dict[str, int] = {}
+        self._timers: Dict[str, Timer] = {}
+        self.confident = 0
+        self.sheets = 0
+        self.calls = 0
+
+    def skip(self) -> None:
+        """Contabiliza uma folha que o roteador dispensou de validação."""
+        with self._lock:
+            self.confident += 1
+
+    def submit(self, api_key: str, payload, rows: int, callback_url: Optional[str] = None,
+               meta: Optional[Dict] = None) -> Dict:
+        """
+        Cria o job da folha e a coloca no lote pendente (rows = questões ambíguas dela).
+        Levanta CallbackNotAllowed e ValidationQueueFull como ValidationJobs.submit.
+        """
+        check_callback_url(callback_url)
+        job = self.jobs.create(meta)
+        with self._lock:
+            self.sheets += 1
+            self._pending.setdefault(api_key, []).append((job, payload, callback_url))
+            self._rows[api_key] = self._rows.get(api_key, 0) + rows
+            if self._rows[api_key] >= self.max_rows:
+                batch = self._take(api_key)
+            else:
+                batch = None
+                if api_key not in self._timers:
+                    timer = Timer(self.max_wait, self.flush, (api_key,))
+                    timer.daemon = True
+                    self._timers[api_key] = timer
+                    timer.start()
+        if batch:
+            self.jobs.execute(self._run, api_key, batch)
+        return job
+
+    def _take(self, api_key: str) -> List:
+        # Chamado com self._lock
+        timer = self._timers.pop(api_key, None)
+        if timer is not None:
+            timer.cancel()
+        self._rows.pop(api_key, None)
+        return self._pending.pop(api_key, [])
+
+    def flush(self, api_key: Optional[str] = None) -> None:
+        """Envia já os lotes pendentes (de uma chave ou de todas)."""
+        with self._lock:
+            keys = [api_key] if api_key is not None else list(self._pending)
+            batches = [(key, self._take(key)) for key in keys]
+        for key, batch in batches:
+            if batch:
+                self.jobs.execute(self._run, key, batch)
+
+    def _run(self, api_key: str, batch: List) -> None:
+        with self._lock:
+            self.calls += 1
+        try:
+            for job, _, _ in batch:
+                self.jobs.start(job)
+            results = self.call(api_key, [payload for _, payload, _ in batch])
+        except Exception as e:
+            logger.error(f"[Validação] Lote de {len(batch)} folhas falhou: {e}")
+            for job, _, callback_url in batch:
+                self.jobs.finish(job, error=str(e), callback_url=callback_url)
+            return
+        for (job, _, callback_url), result in zip(batch, results):
+            self.jobs.finish(job, result=result, callback_url=callback_url)
+
+    def info(self) -> Dict:
+        with self._lock:
+            routed = self.confident + self.sheets
+            pending = sum(len(batch) for batch in self._pending.values())
+            return {
+                "sheets": routed,
+                "skipped_confident": self.confident,
+                "sent": self.sheets,
+                "pending": pending,
+                "calls": self.calls,
+                "calls_per_sheet": round(self.calls / routed, 3) if routed else 0.0,
+                "max_rows": self.max_rows,
+                "max_wait_ms": int(self.max_wait * 1000),
+            }
+
+
+_batcher: Optional[ValidationBatcher] = None
+_batcher_lock = Lock()
+
+
+def validation_batcher(call: Callable[[str, List], List[Dict]]) -> ValidationBatcher:
+    """Lote de validação do processo; `call` só é usado na criação."""
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = ValidationBatcher(validation_jobs(), call, VALIDATION_BATCH_ROWS, VALIDATION_BATCH_WAIT_MS / 1000.0)
+        return _batcher
@@ -36,7 +36,7 @@ app.json_encoder = NumpyEncoder
 # CONFIGURAÇÃO GLOBAL
 # ============================================================================
 
-TABELA_TRI_PATH = os.path.join(
+TABELA_TRI_PATH = os.getenv('TRI_TABELA_PATH') or os.path.join(
     os.path.dirname(__file__),
     'tri_tabela_referencia_oficial.csv'
 )
@@ -51,6 +51,29 @@ except Exception as e:
     processador = None
 
 
+def aquecer_processador():
+    """
+    Roda uma turma sintética pelo processador (pandas/numpy já inicializados)
+    antes do worker aceitar tráfego. Retorna o tempo gasto em segundos.
+    """
+    if processador is None:
+        return 0.0
+    import time
+    inicio = time.perf_counter()
+    alternativas = 'ABCDE'
+    gabarito = {q: alternativas[q % 5] for q in range(1, 91)}
+    alunos = [
+        {'nome': f'Aquecimento {i}', **{f'q{q}': alternativas[(q * i) % 5] for q in range(1, 91)}}
+        for i in range(1, 4)
+    ]
+    processador.processar_turma(
+        alunos=alunos,
+        gabarito=gabarito,
+        areas_config={'LC': (1, 45), 'CH': (46, 90), 'CN': (1, 45), 'MT': (46, 90)}
+    )
+    return time.perf_counter() - inicio
+
+
 # ============================================================================
 # ENDPOINTS
 # ============================================================================
@@ -246,9 +269,10 @@ if __name__ == '__main__':
     print(f"🌐 Servidor: http://0.0.0.0:5003")
     print("="*100 + "\n")
     
+    # Servidor de desenvolvimento; produção: gunicorn -c gunicorn.conf.py app:app
     app.run(
         host='0.0.0.0',
-        port=5003,
-        debug=True,
+        port=int(os.getenv('PORT', 5003)),
+        debug=os.getenv('TRI_DEBUG', 'false').lower() == 'true',
         threaded=True
     )
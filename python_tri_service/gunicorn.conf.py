@@ -0,0 +1,39 @@
+"""
+Servidor de produção do serviço TRI V2 (gunicorn, pre-fork).
+
+    cd python_tri_service && gunicorn -c gunicorn.conf.py app:app
+
+- A tabela TRI é carregada uma vez no master (preload_app) e compartilhada
+  pelos workers por copy-on-write.
+- Cada worker roda uma turma sintética antes de aceitar conexões.
+- Reload gracioso: `kill -HUP <pid do master>` troca os workers sem derrubar
+  as requisições em andamento; código novo: `kill -USR2` e depois `kill -TERM` no master antigo.
+"""
+import logging
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5003')}"
+workers = int(os.getenv("TRI_WORKERS", "0")) or multiprocessing.cpu_count()
+worker_class = "sync"
+preload_app = True
+
+timeout = int(os.getenv("TRI_WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("TRI_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+max_requests = int(os.getenv("TRI_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("TRI_LOG_LEVEL", "info")
+
+# numpy/pandas: uma thread de BLAS por worker
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+
+def post_worker_init(worker):
+    import app as tri_app
+    elapsed = tri_app.aquecer_processador()
+    logging.getLogger("gunicorn.error").info(f"Worker {worker.pid} aquecido em {elapsed * 1000:.0f} ms")
@@ -37,4 +37,9 @@ echo ""
 echo "========================================"
 echo "✅ Iniciando serviço na porta 5003..."
 echo "========================================"
+# Produção (gunicorn, um worker por núcleo): ./start_service.sh prod
+if [ "$1" = "prod" ]; then
+    exec gunicorn -c gunicorn.conf.py app:app
+fi
+
 python app.py